@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""Drive the MoCookie database with signed transactions.
+
+Keypairs are generated once with RSAUser.generate_keys and kept in a key
+directory. Signed gct, rct, cct and pct requests in the format of
+doc/server.md are synthesized into a messages file, one per line, so the
+expensive signing is done before the measured run and the same load can
+be replayed. The run adds every message with its Blockchain.addXXX
+function from concurrent connections while blocks are committed at a
+fixed interval, and reports the add throughput and latency and the block
+commit times as JSON.
+
+The database refuses a transaction whose ttime is an hour old, and the
+ttimes are set when the messages file is written: a file whose first
+ttime is older than TTIME_WINDOW - the --ttime-margin is written again
+before the run, and a run must end within the margin to replay only
+accepted requests.
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import itertools
+import concurrent.futures
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'server'))
+
+import encryption  # noqa: E402
+import server  # noqa: E402
+import results  # noqa: E402
+
+# Any committed block will do as recent_hash, the genesis block always is
+GENESIS_HASH = 'GENESIS/BLOCK/=============================='
+
+# Age of a ttime refused by the *_transaction_time_check constraints
+TTIME_WINDOW = 3600
+
+# Position of the ttime in a request of each protocol
+TTIME_FIELDS = {'gct': 2, 'rct': 2, 'cct': 2, 'pct': 3}
+
+# Number of requests of each kind of exchange
+EXCHANGE_SIZES = {'gct': 1, 'rct': 1, 'cct': 3, 'pct': 2}
+
+# Keys of the signing processes, see load_signers()
+signers = []
+
+
+def key_paths(keys_dir: str, i: int) -> tuple:
+    """Get the public and private key paths of user i."""
+    return (os.path.join(keys_dir, 'user%d.pub' % i),
+            os.path.join(keys_dir, 'user%d.priv' % i))
+
+
+def generate_key(keys_dir: str, i: int):
+    """Generate the keypair of user i unless it already exists."""
+    pubkey_path, privkey_path = key_paths(keys_dir, i)
+    if os.path.exists(pubkey_path) and os.path.exists(privkey_path):
+        return
+    encryption.RSAUser().generate_keys(pubkey_path, privkey_path)
+
+
+def generate_keys(keys_dir: str, users: int, workers: int):
+    """Generate the keypairs of users 0 to users - 1 in parallel."""
+    os.makedirs(keys_dir, exist_ok=True)
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        list(executor.map(generate_key, itertools.repeat(keys_dir),
+                          range(users)))
+
+
+def load_user(keys_dir: str, i: int) -> 'encryption.RSAUser':
+    """Load the keypair of user i."""
+    user = encryption.RSAUser()
+    user.retrieve_keys(*key_paths(keys_dir, i))
+    return user
+
+
+def load_signers(keys_dir: str, users: int):
+    """Load every keypair in a signing process."""
+    global signers
+    signers = [load_user(keys_dir, i) for i in range(users)]
+
+
+def wire_pubkey(user: 'encryption.RSAUser') -> str:
+    """Get a public key as sent in a request, without its newline."""
+    return user.pubkey.rstrip('\n')
+
+
+def sign_chunk(chunk: list) -> list:
+    """Sign a chunk of requests in a signing process.
+
+    Keyword arguments:
+    chunk -- list of (invoker, request) where invoker is a user number and
+      request the tab separated request without its signature
+
+    Returns:
+    The signed requests in the same order
+
+    """
+    return ['%s\t%s' % (request, signers[invoker].sign(request).rstrip('\n'))
+            for invoker, request in chunk]
+
+
+def exchanges(pubkeys: list, mix: dict, seed: int, start_time: float):
+    """Synthesize unsigned requests forever.
+
+    A cct is sent by each of its three users and a pct by both of its
+    users, so the database can combine them.
+
+    Keyword arguments:
+    pubkeys -- public key of each user
+    mix -- relative weight of each protocol
+    seed -- seed of the random generator
+    start_time -- ttime of the first request
+
+    Yields:
+    (invoker, request) tuples as accepted by sign_chunk
+
+    """
+    rng = random.Random(seed)
+    protocols = list(mix)
+    weights = [mix[p] for p in protocols]
+    counter = itertools.count()
+    while True:
+        protocol = rng.choices(protocols, weights)[0]
+        users = rng.sample(range(len(pubkeys)),
+                           3 if protocol == 'cct' else 2)
+        num_cookies = rng.randint(1, 5)
+        if protocol == 'gct':
+            ttime = start_time + next(counter) / 1000
+            yield users[0], '\t'.join([
+                'gct', pubkeys[users[0]], '%.3f' % ttime, pubkeys[users[1]],
+                GENESIS_HASH, str(num_cookies), 'bench'])
+        elif protocol == 'rct':
+            ttime = start_time + next(counter) / 1000
+            yield users[0], '\t'.join([
+                'rct', pubkeys[users[0]], '%.3f' % ttime, pubkeys[users[1]],
+                GENESIS_HASH, str(num_cookies), 'bench'])
+        elif protocol == 'cct':
+            for invoker in users:
+                ttime = start_time + next(counter) / 1000
+                yield invoker, '\t'.join(
+                    ['cct', pubkeys[invoker], '%.3f' % ttime, GENESIS_HASH] +
+                    [pubkeys[u] for u in users] + [str(num_cookies)])
+        else:
+            for invoker, other in (users, users[::-1]):
+                ttime = start_time + next(counter) / 1000
+                yield invoker, '\t'.join([
+                    'pct', pubkeys[invoker], pubkeys[other], '%.3f' % ttime,
+                    GENESIS_HASH, str(num_cookies)])
+
+
+def generate_messages(path: str, keys_dir: str, users: int, count: int,
+                      mix: dict, seed: int, workers: int,
+                      chunksize: int = 256):
+    """Write count signed requests to a messages file.
+
+    Keyword arguments:
+    path -- the messages file
+    keys_dir -- directory holding the keypairs
+    users -- number of users
+    count -- number of requests
+    mix -- relative weight of each protocol
+    seed -- seed of the random generator
+    workers -- number of signing processes
+    chunksize -- number of requests signed per task
+    """
+    pubkeys = [wire_pubkey(load_user(keys_dir, i)) for i in range(users)]
+    unsigned = itertools.islice(
+        exchanges(pubkeys, mix, seed, time.time()), count)
+    chunks = iter(lambda: list(itertools.islice(unsigned, chunksize)), [])
+    with concurrent.futures.ProcessPoolExecutor(
+            workers, initializer=load_signers,
+            initargs=(keys_dir, users)) as executor:
+        with open(path, 'w') as f:
+            for signed in executor.map(sign_chunk, chunks):
+                f.write(''.join(line + '\n' for line in signed))
+
+
+def messages_age(path: str) -> float:
+    """Get the age in seconds of the first ttime of a messages file.
+
+    The requests are written in ttime order, so the first one is the
+    oldest.
+
+    Returns:
+    The age, None if the file is empty
+
+    """
+    with open(path) as f:
+        fields = f.readline().split('\t')
+    if len(fields) < 4:
+        return None
+    return time.time() - float(fields[TTIME_FIELDS[fields[0]]])
+
+
+async def register_users(admin_dsn: str, keys_dir: str, users: int):
+    """Add every user to the database and commit them in a block."""
+    conn = await server.asyncpg.connect(admin_dsn)
+    try:
+        for i in range(users):
+            await conn.fetchval('SELECT Blockchain.addAUT($1)',
+                                wire_pubkey(load_user(keys_dir, i)))
+        await conn.fetchval('SELECT Blockchain.commitBlock()')
+    finally:
+        await conn.close()
+
+
+async def count_committed(admin_dsn: str) -> int:
+    """Get the number of transactions committed in a block."""
+    conn = await server.asyncpg.connect(admin_dsn)
+    try:
+        return await conn.fetchval(
+            'SELECT count(*) FROM Blockchain.IncludeTransaction')
+    finally:
+        await conn.close()
+
+
+async def drive(dsn: str, lines, concurrency: int, commit_interval: float,
+                commit_function: str) -> dict:
+    """Add every request while committing blocks at a fixed interval.
+
+    Keyword arguments:
+    dsn -- connection URI of the MoCookie database
+    lines -- iterable of signed requests
+    concurrency -- number of requests in flight
+    commit_interval -- seconds between two block commits
+    commit_function -- Blockchain.commitBlock or Blockchain.commitBlockBatch
+
+    Returns:
+    The measurements
+
+    """
+    latencies = []
+    commit_times = []
+    outcomes = {'ok': 0, 'no': 0}
+    done = asyncio.Event()
+    db = await server.asyncpg.create_pool(dsn, min_size=concurrency + 1,
+                                          max_size=concurrency + 1)
+    commit_query = 'SELECT %s()' % commit_function
+
+    async def add():
+        for line in lines:
+            protocol, fields = server.parse_message(line.rstrip('\n'))
+            start = time.perf_counter()
+            ok = await db.fetchval(server.PROTOCOLS[protocol][1], *fields)
+            latencies.append(time.perf_counter() - start)
+            outcomes['ok' if ok else 'no'] += 1
+
+    async def commit():
+        start = time.perf_counter()
+        committed = await db.fetchval(commit_query)
+        if committed:
+            commit_times.append(time.perf_counter() - start)
+
+    async def committer():
+        while not done.is_set():
+            try:
+                await asyncio.wait_for(done.wait(), commit_interval)
+            except asyncio.TimeoutError:
+                await commit()
+
+    try:
+        task = asyncio.ensure_future(committer())
+        start = time.perf_counter()
+        await asyncio.gather(*[add() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+        done.set()
+        await task
+        # Commit what is left in the pool
+        await commit()
+    finally:
+        await db.close()
+    return {
+        'elapsed_s': elapsed,
+        'accepted': outcomes['ok'],
+        'refused': outcomes['no'],
+        'add': results.summarize(latencies, elapsed),
+        'commit': results.summarize(commit_times),
+    }
+
+
+def parse_mix(mix: str) -> dict:
+    """Parse a protocol mix such as gct=50,rct=30,cct=15,pct=5."""
+    weights = {}
+    for item in mix.split(','):
+        protocol, _, weight = item.partition('=')
+        if protocol not in EXCHANGE_SIZES:
+            raise argparse.ArgumentTypeError('unknown protocol ' + protocol)
+        weights[protocol] = float(weight)
+    return weights
+
+
+def main():
+    """Run the load generator from the command line."""
+    parser = argparse.ArgumentParser(description='MoCookie load generator.')
+    parser.add_argument('--dsn',
+                        default='postgresql:///mocookie?user=mc_server')
+    parser.add_argument('--admin-dsn', default='postgresql:///mocookie')
+    parser.add_argument('--keys-dir',
+                        default=os.path.join(ROOT, 'bench', 'keys'))
+    parser.add_argument('--messages',
+                        default=os.path.join(ROOT, 'bench', 'messages.txt'),
+                        help='messages file, generated if it does not exist'
+                        ' or if its ttimes are about to expire')
+    parser.add_argument('--ttime-margin', type=float, default=900,
+                        help='seconds a run may last before the ttimes of'
+                        ' the messages file expire')
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--count', type=int, default=10000,
+                        help='number of requests to generate')
+    parser.add_argument('--mix', type=parse_mix,
+                        default='gct=50,rct=30,cct=15,pct=5')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='key generation and signing processes')
+    parser.add_argument('--generate-only', action='store_true',
+                        help='write the messages file and exit')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--commit-interval', type=float, default=1.0)
+    parser.add_argument('--commit-function', default='Blockchain.commitBlock',
+                        choices=['Blockchain.commitBlock',
+                                 'Blockchain.commitBlockBatch'])
+    parser.add_argument('--output', help='report file, default to stdout')
+    args = parser.parse_args()
+
+    generate_keys(args.keys_dir, args.users, args.workers)
+    if os.path.exists(args.messages):
+        age = messages_age(args.messages)
+        if age is None or age > TTIME_WINDOW - args.ttime_margin:
+            # The database would refuse every request as too old
+            print('%s: ttimes about to expire, writing it again' %
+                  args.messages, file=sys.stderr)
+            os.remove(args.messages)
+    if not os.path.exists(args.messages):
+        generate_messages(args.messages, args.keys_dir, args.users,
+                          args.count, args.mix, args.seed, args.workers)
+    if args.generate_only:
+        return
+    if not server.ASYNCPG_INSTALLED:
+        raise ImportError('Module asyncpg not installed.')
+
+    async def run() -> dict:
+        await register_users(args.admin_dsn, args.keys_dir, args.users)
+        committed = await count_committed(args.admin_dsn)
+        with open(args.messages) as lines:
+            measurements = await drive(args.dsn, lines, args.concurrency,
+                                       args.commit_interval,
+                                       args.commit_function)
+        measurements['committed'] = (await count_committed(args.admin_dsn) -
+                                     committed)
+        return measurements
+
+    measurements = asyncio.run(run())
+    config = {k: v for k, v in vars(args).items()
+              if k not in ('dsn', 'admin_dsn', 'output')}
+    results.write_report('loadgen', config, measurements, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks of the Python core.
+
+Each benchmark times single calls of a hot function and reports their
+throughput and latency as JSON:
+
+block_hash -- Block.calculate_hash over a whole block
+block_hash_incremental -- Block.calculate_hash after adding a transaction
+rsa_verify -- encryption.RSA_verify with the verifier cached
+rsa_verify_many -- encryption.RSA_verify_many, per signature
+transaction_validate -- Transaction.validate
+"""
+
+import os
+import sys
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'server'))
+sys.path.insert(0, os.path.join(ROOT, 'py'))
+
+import encryption  # noqa: E402
+import cookie  # noqa: E402
+import transaction  # noqa: E402
+import blockchain  # noqa: E402
+import results  # noqa: E402
+
+
+def timed(func, iterations: int) -> list:
+    """Call func iterations times.
+
+    Returns:
+    The duration of each call in seconds
+
+    """
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def make_transactions(cookiers: list, count: int) -> list:
+    """Create count gct between consecutive cookiers."""
+    return [transaction.GiveCookieTransaction(
+                'recent', cookiers[i % len(cookiers)],
+                cookiers[(i + 1) % len(cookiers)], 'bench %d' % i)
+            for i in range(count)]
+
+
+def bench_block_hash(cookiers: list, block_size: int,
+                     iterations: int) -> dict:
+    """Hash a whole block from scratch."""
+    block = blockchain.Block()
+    block.previous_hash = '0' * 128
+    block.transactions = make_transactions(cookiers, block_size)
+
+    def run():
+        block.invalidate_hash()
+        block.calculate_hash()
+    return results.summarize(timed(run, iterations))
+
+
+def bench_block_hash_incremental(cookiers: list, iterations: int) -> dict:
+    """Add a transaction to a block then hash it again."""
+    block = blockchain.Block()
+    block.previous_hash = '0' * 128
+    pending = iter(make_transactions(cookiers, iterations))
+
+    def run():
+        block.add_transaction(next(pending))
+        block.calculate_hash()
+    return results.summarize(timed(run, iterations))
+
+
+def bench_rsa_verify(signer: 'encryption.RSAUser', iterations: int) -> dict:
+    """Verify a signature whose public key is already cached."""
+    message = 'gct\tbench message'
+    signature = signer.sign(message)
+    pubkey = signer.pubkey
+    encryption.RSA_verify(message, signature, pubkey)
+    return results.summarize(timed(
+        lambda: encryption.RSA_verify(message, signature, pubkey),
+        iterations))
+
+
+def bench_rsa_verify_many(signer: 'encryption.RSAUser', batch: int,
+                          iterations: int) -> dict:
+    """Verify batches of signatures, reported per signature."""
+    messages = ['gct\tbench message %d' % i for i in range(batch)]
+    items = [(m, signer.sign(m), signer.pubkey) for m in messages]
+    samples = timed(lambda: encryption.RSA_verify_many(items), iterations)
+    return results.summarize([s / batch for s in samples for _ in items])
+
+
+def bench_transaction_validate(cookiers: list, iterations: int) -> dict:
+    """Validate a transaction."""
+    t = make_transactions(cookiers, 1)[0]
+    return results.summarize(timed(t.validate, iterations))
+
+
+def main():
+    """Run the micro-benchmarks from the command line."""
+    parser = argparse.ArgumentParser(description='MoCookie micro-benchmarks.')
+    parser.add_argument('--iterations', type=int, default=1000)
+    parser.add_argument('--block-size', type=int, default=1000,
+                        help='number of transactions in a hashed block')
+    parser.add_argument('--batch', type=int, default=64,
+                        help='number of signatures per RSA_verify_many call')
+    parser.add_argument('--output', help='report file, default to stdout')
+    args = parser.parse_args()
+
+    signer = encryption.RSAUser()
+    keys_dir = os.path.join(ROOT, 'bench', 'keys')
+    pubkey_path = os.path.join(keys_dir, 'user0.pub')
+    privkey_path = os.path.join(keys_dir, 'user0.priv')
+    if os.path.exists(pubkey_path) and os.path.exists(privkey_path):
+        signer.retrieve_keys(pubkey_path, privkey_path)
+    else:
+        signer.generate_keys(pubkey_path, privkey_path)
+    cookiers = [cookie.Cookier('pubk%d' % i, 'user%d' % i) for i in range(10)]
+
+    measurements = {
+        'block_hash': bench_block_hash(cookiers, args.block_size,
+                                       args.iterations),
+        'block_hash_incremental': bench_block_hash_incremental(
+            cookiers, args.iterations),
+        'rsa_verify': bench_rsa_verify(signer, args.iterations),
+        'rsa_verify_many': bench_rsa_verify_many(
+            signer, args.batch, max(args.iterations // args.batch, 1)),
+        'transaction_validate': bench_transaction_validate(
+            cookiers, args.iterations),
+    }
+    results.write_report('microbench', vars(args), measurements, args.output)
+
+
+if __name__ == '__main__':
+    main()
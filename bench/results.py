@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Summaries and machine readable reports shared by the benchmarks."""
+
+import json
+import sys
+import platform
+from datetime import datetime
+
+
+def percentile(samples: list, q: float) -> float:
+    """Get a percentile of samples by linear interpolation.
+
+    Keyword arguments:
+    samples -- a sorted list of numbers
+    q -- the percentile, between 0 and 100
+
+    Returns:
+    The percentile, None if samples is empty
+
+    """
+    if not samples:
+        return None
+    pos = (len(samples) - 1) * q / 100
+    low = int(pos)
+    high = min(low + 1, len(samples) - 1)
+    return samples[low] + (samples[high] - samples[low]) * (pos - low)
+
+
+def summarize(samples: list, elapsed: float = None) -> dict:
+    """Summarize the durations of a series of operations.
+
+    Keyword arguments:
+    samples -- duration of each operation in seconds
+    elapsed -- wall clock time of the whole series in seconds. Default to
+      the sum of samples, as for operations run one after the other.
+
+    Returns:
+    A dict of count, ops_per_s and p50_ms, p99_ms, mean_ms, max_ms
+
+    """
+    samples = sorted(samples)
+    if elapsed is None:
+        elapsed = sum(samples)
+    summary = {
+        'count': len(samples),
+        'ops_per_s': len(samples) / elapsed if elapsed else None,
+        'p50_ms': None,
+        'p99_ms': None,
+        'mean_ms': None,
+        'max_ms': None,
+    }
+    if samples:
+        summary['p50_ms'] = percentile(samples, 50) * 1000
+        summary['p99_ms'] = percentile(samples, 99) * 1000
+        summary['mean_ms'] = sum(samples) / len(samples) * 1000
+        summary['max_ms'] = samples[-1] * 1000
+    return summary
+
+
+def write_report(benchmark: str, config: dict, results: dict,
+                 path: str = None):
+    """Write a benchmark report as JSON.
+
+    Keyword arguments:
+    benchmark -- name of the benchmark
+    config -- parameters the benchmark ran with
+    results -- the measurements
+    path -- file to write to. Default to stdout.
+    """
+    report = {
+        'benchmark': benchmark,
+        'time': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'config': config,
+        'results': results,
+    }
+    if path:
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write('\n')
@@ -1,13 +1,408 @@
+#!/usr/bin/env python3
+"""MoCookie client-side API.
+
+Transactions are queued as intents while offline, signed in batches, and
+sent pipelined over a single connection until the server has answered
+each of them:
+
+    client = MoCookieClient(user, queue_path='queue', log_path='blocks.log')
+    await client.sync()
+    client.give_cookie(friend_pubk, 2, 'lunch')
+    client.sign_pending()
+    await client.submit()
+
+Signed requests are kept in a journal file until they are answered, so a
+restart sends them again. The database refuses a second copy of a request
+(the invoker and ttime are unique), so sending one twice is harmless.
+"""
+
+import os
+import time
+import asyncio
+import collections
 
-import transaction
 import encryption
-import cookie
+import ledger
+import compact
+import blocklog
+
+GENESIS_HASH = ledger.GENESIS_HASH
+
+# Answer of the server to a request it may accept later
+TRANSIENT_RESPONSES = ('err\tserver failure', 'err\tpool full')
+
+
+class TransactionQueue():
+    """Signed requests waiting for the server's answer.
+
+    The journal holds a req record per queued request and an ack record
+    per answered one. It is compacted to the pending requests when loaded.
+    """
+
+    def __init__(self, path: str = None):
+        """Constructor.
+
+        Keyword arguments:
+        path -- journal file, None to keep the queue in memory only
+        """
+        self.__path = path
+        self.__pending = collections.OrderedDict()
+        self.__next_id = 0
+        self.__journal = None
+        if path is None:
+            return
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for record in f:
+                    kind, request_id, line = record.rstrip('\n').split(
+                        '\t', 2)
+                    if kind == 'req':
+                        self.__pending[int(request_id)] = line
+                    else:
+                        self.__pending.pop(int(request_id), None)
+        # Rewrite the journal with only the pending requests
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(''.join(self.__record('req', request_id, line)
+                            for request_id, line in self.__pending.items()))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+        if self.__pending:
+            self.__next_id = next(reversed(self.__pending)) + 1
+        self.__journal = open(path, 'a', encoding='utf-8')
+
+    @staticmethod
+    def __record(kind: str, request_id: int, line: str) -> str:
+        """Format a journal record."""
+        return '%s\t%d\t%s\n' % (kind, request_id, line)
+
+    def __len__(self) -> int:
+        """Get the number of pending requests."""
+        return len(self.__pending)
+
+    def pending(self) -> list:
+        """Get the pending requests as (id, request), oldest first."""
+        return list(self.__pending.items())
+
+    def add(self, lines: list) -> list:
+        """Queue signed requests, synced to the journal at once.
+
+        Returns:
+        The id of each request
+
+        """
+        ids = list(range(self.__next_id, self.__next_id + len(lines)))
+        self.__next_id += len(lines)
+        if self.__journal:
+            self.__journal.write(''.join(
+                self.__record('req', request_id, line)
+                for request_id, line in zip(ids, lines)))
+            self.__journal.flush()
+            os.fsync(self.__journal.fileno())
+        self.__pending.update(zip(ids, lines))
+        return ids
+
+    def ack(self, request_id: int, response: str):
+        """Remove an answered request.
+
+        Acks are not synced: one lost in a crash only sends the request
+        again.
+        """
+        del self.__pending[request_id]
+        if self.__journal:
+            self.__journal.write(self.__record('ack', request_id, response))
+
+    def flush(self):
+        """Write the acks to the journal."""
+        if self.__journal:
+            self.__journal.flush()
+
+    def close(self):
+        """Close the journal."""
+        if self.__journal:
+            self.__journal.close()
+            self.__journal = None
 
 
 class MoCookieClient():
     """MoCookie client-side API"""
 
-    def __init__(self, username):
-        self.__me = cookie.Cookier()
+    def __init__(self, rsa_user: 'encryption.RSAUser',
+                 host: str = '127.0.0.1', port: int = 8765,
+                 queue_path: str = None, log_path: str = None,
+                 executor: 'concurrent.futures.Executor' = None,
+                 batch_size: int = 256, max_pipeline: int = 64):
+        """Constructor.
+
+        Keyword arguments:
+        rsa_user -- keys of the user, signing the transactions
+        host -- address of the server
+        port -- port of the server
+        queue_path -- journal of the signed requests, None to keep them in
+          memory only
+        log_path -- local BlockLog, None to use the genesis block as the
+          recent block of every transaction
+        executor -- thread pool signing the requests, None to sign them in
+          the calling thread
+        batch_size -- number of requests signed at once
+        max_pipeline -- maximum number of requests sent but not answered
+        """
+        if not isinstance(rsa_user, encryption.RSAUser):
+            raise TypeError('rsa_user must be of type RSAUser.')
+        if not rsa_user.pubkey:
+            raise ValueError('rsa_user has no keys.')
+        self.__user = rsa_user
+        self.__pubk = rsa_user.pubkey.rstrip('\n')
+        self.__host = host
+        self.__port = port
+        self.__executor = executor
+        self.__batch_size = batch_size
+        self.__max_pipeline = max_pipeline
+        self.__intents = []
+        self.__last_ttime = 0
+        self.__queue = TransactionQueue(queue_path)
+        self.__log = blocklog.BlockLog(log_path) if log_path else None
+
+    @property
+    def pubk(self) -> str:
+        """Get the public key of the user, as sent in requests."""
+        return self.__pubk
+
+    @property
+    def head(self) -> str:
+        """Get the hash of the last block known to the client."""
+        if self.__log is None:
+            return GENESIS_HASH
+        return self.__log.head
+
+    @property
+    def queue(self) -> 'TransactionQueue':
+        """Get the signed requests waiting for the server's answer."""
+        return self.__queue
+
+    @property
+    def intents(self) -> int:
+        """Get the number of transactions waiting to be signed."""
+        return len(self.__intents)
+
+    @staticmethod
+    def __check_text(name: str, value: str, maxlen: int):
+        """Check a free text field of a request."""
+        if not isinstance(value, str):
+            raise TypeError('%s must be of type str.' % name)
+        if len(value) > maxlen:
+            raise ValueError('%s is too long.' % name)
+        if '\t' in value or '\n' in value:
+            raise ValueError('%s must not hold tabs or newlines.' % name)
+
+    def __queue_intent(self, protocol: str, num_cookies: int, *fields):
+        """Queue a transaction to be signed by sign_pending()."""
+        if not isinstance(num_cookies, int):
+            raise TypeError('num_cookies must be of type int.')
+        if num_cookies < 1:
+            raise ValueError('num_cookies must be positive.')
+        for field in fields:
+            self.__check_text('public key', field, 1000)
+        self.__intents.append((protocol, num_cookies) + fields)
+
+    def give_cookie(self, receiver: str, num_cookies: int = 1,
+                    reason: str = ''):
+        """Queue a gct giving cookies to receiver."""
+        self.__check_text('reason', reason, 100)
+        self.__queue_intent('gct', num_cookies, receiver, reason)
+
+    def receive_cookie(self, sender: str, num_cookies: int = 1,
+                       cookie_type: str = ''):
+        """Queue a rct receiving cookies from sender."""
+        self.__check_text('cookie_type', cookie_type, 100)
+        self.__queue_intent('rct', num_cookies, sender, cookie_type)
+
+    def chain_collapse(self, start_user: str, mid_user: str, end_user: str,
+                       num_cookies: int = 1):
+        """Queue the cct of the user, one of the three involved."""
+        self.__queue_intent('cct', num_cookies, start_user, mid_user,
+                            end_user)
+
+    def pair_cancel(self, other: str, num_cookies: int = 1):
+        """Queue the pct of the user with other."""
+        self.__queue_intent('pct', num_cookies, other)
+
+    def __ttime(self) -> str:
+        """Get a ttime later than the previous one.
+
+        The database refuses two requests of an invoker at the same time.
+        """
+        ttime = max(round(time.time(), 3), self.__last_ttime + 0.001)
+        self.__last_ttime = ttime
+        return '%.3f' % ttime
+
+    def __request(self, intent: tuple, recent_hash: str) -> str:
+        """Format the unsigned request of an intent."""
+        protocol, num_cookies = intent[:2]
+        num_cookies = str(num_cookies)
+        ttime = self.__ttime()
+        if protocol in ('gct', 'rct'):
+            other, text = intent[2:]
+            fields = [other, recent_hash, num_cookies, text]
+        elif protocol == 'cct':
+            fields = [recent_hash] + list(intent[2:]) + [num_cookies]
+        else:
+            return '\t'.join(['pct', self.__pubk, intent[2], ttime,
+                              recent_hash, num_cookies])
+        return '\t'.join([protocol, self.__pubk, ttime] + fields)
+
+    def sign_pending(self) -> int:
+        """Sign the queued transactions in batches and queue the requests.
+
+        Returns:
+        The number of requests queued
+
+        """
+        recent_hash = self.head
+        count = 0
+        while self.__intents:
+            batch = self.__intents[:self.__batch_size]
+            messages = [self.__request(intent, recent_hash)
+                        for intent in batch]
+            signatures = self.__user.sign_many(messages, self.__executor)
+            self.__queue.add(['%s\t%s' % (message, signature.rstrip('\n'))
+                              for message, signature
+                              in zip(messages, signatures)])
+            del self.__intents[:len(batch)]
+            count += len(batch)
+        return count
+
+    async def __send_pending(self, pending: list, results: list):
+        """Send requests pipelined over one connection.
+
+        The answered requests are acked, and their answer added to
+        results. Requests with a transient answer stay in the queue.
+        """
+        reader, writer = await asyncio.open_connection(self.__host,
+                                                       self.__port)
+        window = asyncio.Semaphore(self.__max_pipeline)
+        in_flight = collections.deque()
+
+        async def send():
+            for request_id, line in pending:
+                await window.acquire()
+                in_flight.append((request_id, line))
+                writer.write(bytes(line + '\n', 'utf-8'))
+                await writer.drain()
+
+        sender = asyncio.ensure_future(send())
+        try:
+            for _ in pending:
+                response = await reader.readline()
+                if not response:
+                    raise ConnectionError('connection closed by the server')
+                request_id, line = in_flight.popleft()
+                window.release()
+                response = str(response, 'utf-8').rstrip('\n')
+                if response in TRANSIENT_RESPONSES:
+                    continue
+                self.__queue.ack(request_id, response)
+                results.append((line, response))
+            await sender
+        finally:
+            sender.cancel()
+            self.__queue.flush()
+            writer.close()
+
+    async def submit(self, attempts: int = None, backoff: float = 0.1,
+                     max_backoff: float = 30.0) -> list:
+        """Send the queued requests until the server answers each of them.
+
+        The connection is opened again after a failure, waiting twice as
+        long after each failure in a row.
+
+        Keyword arguments:
+        attempts -- number of connections to try, None to try until every
+          request is answered
+        backoff -- seconds to wait after the first failure
+        max_backoff -- longest wait between two attempts
+
+        Returns:
+        (request, response) for each answered request, where response is
+        ok, no or err followed by the reason
+
+        """
+        results = []
+        delay = backoff
+        attempt = 0
+        while len(self.__queue) and (attempts is None or attempt < attempts):
+            attempt += 1
+            answered = len(results)
+            try:
+                await self.__send_pending(self.__queue.pending(), results)
+            except (OSError, asyncio.IncompleteReadError):
+                pass
+            if not len(self.__queue):
+                break
+            if len(results) > answered:
+                delay = backoff
+            await asyncio.sleep(delay)
+            delay = min(2 * delay, max_backoff)
+        return results
+
+    async def sync(self, encrypted: bool = False, server_pubk: str = None,
+                   compact_form: bool = False) -> int:
+        """Append the blocks committed since the head to the local log.
+
+        Keyword arguments:
+        encrypted -- ask for the blocks through an encrypted session
+        server_pubk -- public key of the server, checking the signature of
+          the session key
+        compact_form -- ask for the blocks in the compact form of
+          compact.Codec (gbcz)
+
+        Returns:
+        The number of blocks appended
+
+        """
+        if self.__log is None:
+            raise ValueError('the client has no block log.')
+        reader, writer = await asyncio.open_connection(self.__host,
+                                                       self.__port)
+        try:
+            if encrypted:
+                writer.write(bytes('ses\t%s\n' % self.__pubk, 'utf-8'))
+            request = 'gbcz' if compact_form else 'gbc'
+            writer.write(bytes('%s\t%s\n' % (request, self.head), 'utf-8'))
+            await writer.drain()
+            session = None
+            if encrypted:
+                fields = str(await reader.readline(),
+                             'utf-8').rstrip('\n').split('\t')
+                if fields[0] != 'ses':
+                    raise ConnectionError('no session: %s' % fields[-1])
+                if server_pubk:
+                    try:
+                        signed = len(fields) == 3 and encryption.RSA_verify(
+                            fields[1], fields[2], server_pubk)
+                    except ValueError:
+                        signed = False
+                    if not signed:
+                        raise ValueError('session key not signed by the '
+                                         'server.')
+                session = self.__user.open_session(fields[1])
+            protocol, _, length = str(await reader.readline(),
+                                      'utf-8').rstrip('\n').partition('\t')
+            if protocol != request:
+                raise ConnectionError('%s refused: %s' % (request, length))
+            payload = await reader.readexactly(int(length))
+        finally:
+            writer.close()
+        if session:
+            payload = session.decrypt(payload)
+        if compact_form:
+            text = compact.Codec().decode_blockchain(payload)
+        else:
+            text = str(payload, 'utf-8')
+        return self.__log.append_blockchain(text)
 
-    def give_cookie(privk, pubk, )
+    def close(self):
+        """Close the request journal and the block log."""
+        self.__queue.close()
+        if self.__log is not None:
+            self.__log.close()
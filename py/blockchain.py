@@ -1,12 +1,66 @@
 """Blockchain."""
 
+import os
+import concurrent.futures
 import Crypto.Hash.SHA512 as SHA512
+import cookie
 import transaction
 import encryption
+import metrics
+
+
+class SignatureError(ValueError):
+    """Transactions of the pool carry a bad signature.
+
+    The rejected transactions are in the rejected attribute.
+    """
+
+    def __init__(self, rejected: list):
+        """Constructor.
+
+        Keyword arguments:
+        rejected -- the transactions whose signature does not verify
+        """
+        super().__init__('%d transaction(s) with a bad signature.'
+                         % len(rejected))
+        self.rejected = rejected
+
+
+def verify_chunk(chunk: list) -> list:
+    """Verify a chunk of signatures, typically inside a worker process.
+
+    A malformed signature or public key only rejects its own entry.
+
+    Keyword arguments:
+    chunk -- list of (message, signature, pubkey) tuples
+
+    Returns:
+    A list of booleans in the same order as chunk
+
+    """
+    try:
+        return encryption.RSA_verify_many(chunk)
+    except ValueError:
+        pass
+    results = []
+    for item in chunk:
+        try:
+            results.extend(encryption.RSA_verify_many([item]))
+        except ValueError:
+            results.append(False)
+    return results
 
 
 class Block():
-    """Block in the blockchain."""
+    """Block in the blockchain.
+
+    The transactions of a block are either a list of Transaction objects
+    or a range of rows in a transaction.TransactionTable.
+    """
+
+    __slots__ = ('__previous_block', '__previous_hash', '__current_hash',
+                 '__transactions', '__table', '__rows', '__hash_state',
+                 '__hashed_count', '__hashed', '__hash_changes')
 
     def __init__(self):
         """Constructor."""
@@ -14,6 +68,15 @@ class Block():
         self.__previous_hash = None
         self.__current_hash = None
         self.__transactions = []
+        self.__table = None
+        self.__rows = None
+        # Running SHA512 state over prev_hash|trans1|trans2...
+        self.__hash_state = None
+        self.__hashed_count = 0
+        # Transactions of the list fed into the state, and the change
+        # counters of transactions and public keys when it was started
+        self.__hashed = []
+        self.__hash_changes = None
 
     @property
     def previous_block(self) -> 'Block':
@@ -34,6 +97,7 @@ class Block():
     def previous_hash(self, prev_hash: 'Block'):
         """Set previous_hash."""
         self.__previous_hash = prev_hash
+        self.invalidate_hash()
 
     @property
     def current_hash(self) -> str:
@@ -43,13 +107,19 @@ class Block():
         128 character hash of the current block
 
         """
-        if not self.__current_hash:
+        if not self.__current_hash or self.__stale():
             self.__current_hash = self.calculate_hash()
         return self.__current_hash
 
     @property
     def transactions(self) -> list:
-        """Get transactions."""
+        """Get transactions.
+
+        For a block backed by a table, the transactions are rebuilt from
+        their rows and changing the list does not change the block.
+        """
+        if self.__table is not None:
+            return [self.__table[row] for row in self.__rows]
         return self.__transactions
 
     @transactions.setter
@@ -58,67 +128,275 @@ class Block():
         if not isinstance(transactions, list):
             raise TypeError('transactions must be of type list.')
         for t in transactions:
-            if not issubclass(t, transaction.Transaction):
+            if not isinstance(t, transaction.Transaction):
                 e = 'elements must be a subclass of transaction.Transaction'
                 raise TypeError(e)
         self.__transactions = transactions
+        self.__table = None
+        self.__rows = None
+        self.invalidate_hash()
+
+    @property
+    def table(self) -> 'transaction.TransactionTable':
+        """Get the table holding the transactions, None if not backed."""
+        return self.__table
+
+    @property
+    def rows(self) -> range:
+        """Get the rows of the transactions, None if not backed."""
+        return self.__rows
+
+    def use_table(self, table: 'transaction.TransactionTable', rows: range):
+        """Back the block by a range of rows of a table.
+
+        Keyword arguments:
+        table -- the table holding the transactions
+        rows -- range of the rows, in block order
+        """
+        if not isinstance(table, transaction.TransactionTable):
+            raise TypeError('table must be of type TransactionTable.')
+        if not isinstance(rows, range) or rows.step != 1:
+            raise TypeError('rows must be a range with a step of 1.')
+        if rows.start < 0 or rows.stop > len(table):
+            raise ValueError('rows out of the table.')
+        self.__transactions = []
+        self.__table = table
+        self.__rows = rows
+        self.invalidate_hash()
 
     def add_transaction(self, t: 'Transaction'):
         """Add a transaction to the block."""
-        if not issubclass(t, transaction.Transaction):
+        if not isinstance(t, transaction.Transaction):
             raise TypeError('transaction is not a subclass of Transaction')
+        if self.__table is not None:
+            # Rows of a table cannot be appended to, rebuild the list
+            self.__transactions = self.transactions
+            self.__table = None
+            self.__rows = None
         self.__transactions.append(t)
+        # Only the sealed hash is stale, the running state is still valid.
+        self.__current_hash = None
 
+    def invalidate_hash(self):
+        """Discard the cached hash and the running hash state."""
+        self.__current_hash = None
+        self.__hash_state = None
+        self.__hashed_count = 0
+        self.__hashed = []
+        self.__hash_changes = None
+
+    def __stale(self) -> bool:
+        """Check whether the running hash state is out of date.
+
+        It is if a transaction or the public key of a cookier changed
+        since it was started, or if a hashed transaction was replaced or
+        removed from the transactions list in place.
+        """
+        if self.__hash_changes != (transaction.Transaction.changes,
+                                   cookie.Cookier.pubk_changes):
+            return True
+        if self.__table is not None:
+            return False
+        return self.__transactions[:self.__hashed_count] != self.__hashed
+
+    @metrics.timed('mocookie_block_hash_seconds')
     def calculate_hash(self) -> str:
         """Calculate the hash of the current block.
 
-        Use the current_hash() function for optimizatoin.
+        Use the current_hash() function for optimizatoin. Transactions
+        are fed into a running SHA512 state as they are hashed, so only
+        transactions added since the last call are serialized. The state
+        is started over if it is stale, see __stale().
 
         Returns:
         Base64 of the hash:
 
         """
-        plaintext = ''  # nonce(opt)|prev_hash|trans1|trans2...
+        # nonce(opt)|prev_hash|trans1|trans2...
         if not self.__previous_hash:
             raise Warning('Previous hash has not been set yet.')
-        plaintext += self.__previous_hash
-        plaintext += '|'.join([str(i) for i in self.__transactions])
-        digest = SHA512.new(bytes(plaintext, 'utf-8')).digest()
+        if self.__hash_state is None or self.__stale():
+            self.__hash_state = SHA512.new(bytes(self.__previous_hash,
+                                                 'utf-8'))
+            self.__hashed_count = 0
+            self.__hashed = []
+            self.__hash_changes = (transaction.Transaction.changes,
+                                   cookie.Cookier.pubk_changes)
+        if self.__table is not None:
+            serialized = (self.__table.serialize(row)
+                          for row in self.__rows[self.__hashed_count:])
+        else:
+            new = self.__transactions[self.__hashed_count:]
+            self.__hashed += new
+            serialized = (t.serialize() for t in new)
+        for data in serialized:
+            if self.__hashed_count:
+                self.__hash_state.update(b'|')
+            self.__hash_state.update(data)
+            self.__hashed_count += 1
+        digest = self.__hash_state.copy().digest()
         return str(encryption.bin2base64(digest), 'ascii')
 
 
-class Blockchain():
-    """Store a linked list of blocks."""
+class ChainStore():
+    """Array-backed store of committed blocks.
+
+    Blocks are kept in a list ordered by height (the first block has
+    height 0) with a dict index from block hash to height, so lookups by
+    height or by hash do not walk the previous_block pointers.
+    """
 
     def __init__(self):
         """Constructor."""
-        self.__head = None
-        self.__size = 0
+        self.__blocks = []
+        self.__heights = {}
+
+    def __len__(self) -> int:
+        """Get the number of blocks in the store."""
+        return len(self.__blocks)
+
+    def __contains__(self, block_hash: str) -> bool:
+        """Check whether a block with the given hash is in the store."""
+        return block_hash in self.__heights
+
+    @property
+    def head(self) -> 'Block':
+        """Get the most recent block, None if the store is empty."""
+        if not self.__blocks:
+            return None
+        return self.__blocks[-1]
+
+    def append(self, block: 'Block'):
+        """Append a block on top of the current head.
+
+        Keyword arguments:
+        block -- a Block whose previous_block is the current head
+        """
+        if not isinstance(block, Block):
+            raise TypeError('append(x): x must be of type Block.')
+        if block.previous_block is not self.head:
+            raise ValueError('append(x): x does not extend the head.')
+        block_hash = block.current_hash
+        if block_hash in self.__heights:
+            raise ValueError('append(x): x already exists.')
+        self.__heights[block_hash] = len(self.__blocks)
+        self.__blocks.append(block)
+
+    def height_of(self, block_hash: str) -> int:
+        """Get the height of a block from its hash.
+
+        Returns:
+        The height of the block, None if it is not in the store
+
+        """
+        return self.__heights.get(block_hash)
+
+    def get_by_hash(self, block_hash: str) -> 'Block':
+        """Get a block from its hash.
+
+        Returns:
+        The matching block, None if it is not in the store
+
+        """
+        height = self.__heights.get(block_hash)
+        if height is None:
+            return None
+        return self.__blocks[height]
+
+    def get_by_height(self, height: int) -> 'Block':
+        """Get a block from its height.
+
+        Returns:
+        The matching block, None if the height is out of range
+
+        """
+        if not 0 <= height < len(self.__blocks):
+            return None
+        return self.__blocks[height]
+
+    def iter_range(self, start: int = 0, stop: int = None):
+        """Iterate over the blocks with heights in [start, stop).
+
+        Keyword arguments:
+        start -- height of the first block
+        stop -- height after the last block, defaults to the chain length
+        """
+        if stop is None:
+            stop = len(self.__blocks)
+        for height in range(max(start, 0), min(stop, len(self.__blocks))):
+            yield self.__blocks[height]
+
+
+class Blockchain():
+    """Store a chain of blocks in a ChainStore."""
+
+    verify_chunksize = 64
+
+    def __init__(self, verify_workers: int = None):
+        """Constructor.
+
+        Keyword arguments:
+        verify_workers -- number of processes verifying signatures before a
+          commit. Default to os.cpu_count(), 1 verifies on the caller's
+          thread.
+        """
+        self.__store = ChainStore()
+        self.__table = transaction.TransactionTable()
         self.__pool = []
+        self.__verify_workers = None
+        self.__executor = None
+        self.verify_workers = verify_workers or os.cpu_count() or 1
 
     @property
     def head(self) -> 'Block':
         """Get head block."""
-        return self.__head
+        return self.__store.head
 
     @head.setter
     def head(self, head: 'Block'):
-        """Set head block."""
+        """Set head block and rebuild the store from its previous blocks."""
         if not isinstance(head, Block):
             raise TypeError('head must be of type Block.')
-        # Update size
+        blocks = []
         curr = head
-        size = 0
         while curr:
-            size += 1
+            blocks.append(curr)
             curr = curr.previous_block
-        self.__head = head
-        self.__size = size
+        store = ChainStore()
+        for block in reversed(blocks):
+            store.append(block)
+        self.__store = store
 
     @property
-    def size(self) -> 'Block':
+    def size(self) -> int:
         """Get blockchain size."""
-        return self.__size
+        return len(self.__store)
+
+    @property
+    def store(self) -> 'ChainStore':
+        """Get the store holding the committed blocks."""
+        return self.__store
+
+    @property
+    def table(self) -> 'transaction.TransactionTable':
+        """Get the table holding the committed transactions."""
+        return self.__table
+
+    @property
+    def verify_workers(self) -> int:
+        """Get the number of signature verification processes."""
+        return self.__verify_workers
+
+    @verify_workers.setter
+    def verify_workers(self, verify_workers: int):
+        """Set the number of signature verification processes."""
+        if not isinstance(verify_workers, int):
+            raise TypeError('verify_workers must be of type int.')
+        if verify_workers < 1:
+            raise ValueError('verify_workers must be positive.')
+        if verify_workers != self.__verify_workers:
+            self.shutdown()
+        self.__verify_workers = verify_workers
 
     @property
     def pool(self) -> list:
@@ -131,7 +409,7 @@ class Blockchain():
         if not isinstance(pool, list):
             raise TypeError('pool must be of type list')
         for t in pool:
-            if not issubclass(t, transaction.Transaction):
+            if not isinstance(t, transaction.Transaction):
                 e = 'elements in pool must be a subclass of Transaction'
                 raise TypeError(e)
         self.__pool = pool
@@ -142,43 +420,95 @@ class Blockchain():
         Keyword arguments:
         t -- transaction, any subclass of transaction.Transaction
         """
-        if not issubclass(t, transaction.Transaction):
+        if not isinstance(t, transaction.Transaction):
             e = 'add_transaction(t): t must be a subclass of Transaction.'
             raise TypeError(e)
-        # Check transaction validity
+        # Check transaction validity, signatures are checked on commit
         t.validate()
         # Add transaction to the pool
         self.__pool.append(t)
 
+    def verify_pool(self) -> list:
+        """Verify the signatures of every transaction in the pool.
+
+        Signatures are checked in chunks of verify_chunksize on a pool of
+        verify_workers processes. Transactions with an invalid signature
+        are removed from the pool, the others are kept in order. Unsigned
+        transactions are kept, signatures are optional.
+
+        Returns:
+        The list of rejected transactions
+
+        """
+        signed = [t for t in self.__pool if t.signature]
+        rejected = []
+        items = [t.signed_message() for t in signed]
+        size = Blockchain.verify_chunksize
+        chunks = [items[i:i + size] for i in range(0, len(items), size)]
+        if self.__verify_workers == 1 or len(chunks) <= 1:
+            results = [verify_chunk(chunk) for chunk in chunks]
+        else:
+            if not self.__executor:
+                self.__executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.__verify_workers)
+            results = self.__executor.map(verify_chunk, chunks)
+        invalid = set()
+        offset = 0
+        for chunk_results in results:
+            for i, ok in enumerate(chunk_results):
+                if not ok:
+                    invalid.add(id(signed[offset + i]))
+                    rejected.append(signed[offset + i])
+            offset += len(chunk_results)
+        if invalid:
+            self.__pool = [t for t in self.__pool if id(t) not in invalid]
+        return rejected
+
+    def shutdown(self):
+        """Stop the signature verification processes, if any."""
+        if self.__executor:
+            self.__executor.shutdown()
+            self.__executor = None
+
     def commit(self, nonce: int) -> bool:
         """Commit 3 or less transactions from the pool based on condition.
 
         Keyword arguments:
         nonce -- a random integer
 
+        If transactions carry a bad signature, they are dropped from the
+        pool and a SignatureError holding them is raised before anything
+        is committed; the others stay in the pool for the next call.
+
         Returns:
         True if a block is committed
         False if no blocks is committed
 
         """
+        rejected = self.verify_pool()
+        if rejected:
+            raise SignatureError(rejected)
         if len(self.__pool) == 0:
             # Nothing to commit
             return False
 
         # Initialize a new block
         new_block = Block()
-        if not self.__head:
+        head = self.__store.head
+        if not head:
             new_block.previous_hash = '0' * 128
-        new_block.transactions = self.__pool
-        new_block.previous_block = self.__head
+        else:
+            new_block.previous_hash = head.current_hash
+        new_block.use_table(self.__table, self.__table.extend(self.__pool))
+        new_block.previous_block = head
 
         # Commit current pool
-        self.__head = new_block
+        self.__store.append(new_block)
+        pool = self.__pool
         self.__pool = []
-        self.__size += 1
 
         # Execute actions associated to the transactions
-        for t in new_block.transactions:
+        for t in pool:
             t.action()
 
         return True
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""Append-only local log of the committed blocks.
+
+Blocks are stored one after the other in a log file and located through
+an index file of fixed-width entries, one per block in chain order:
+
+    offset   8 bytes  position of the block in the log file
+    length   4 bytes  size of the block in the log file
+    crc      4 bytes  CRC32 of the block
+    hash    44 bytes  hash of the block, as in a gbc response
+
+A block is stored as its transaction lines, the previous hash being the
+hash of the entry before it. The log is read through mmap and is never
+rewritten: blocks are written and synced before their index entries, and
+opening the log drops whatever a crash left past the last whole block.
+A client opens its log in milliseconds and only asks for the blocks
+committed since its head:
+
+    log = BlockLog('blocks.log')
+    log.append_blockchain(gbc(log.head))
+"""
+
+import re
+import os
+import mmap
+import zlib
+import struct
+
+import ledger
+
+GENESIS_HASH = ledger.GENESIS_HASH
+
+INDEX_ENTRY = struct.Struct('<QII44s')
+
+# Base64 of a SHA-256 digest, as the hashes of the committed blocks
+BLOCK_HASH = re.compile(rb'[A-Za-z0-9+/]{43}=')
+
+
+class BlockLog():
+    """Blocks of the chain stored in a log file and its index."""
+
+    def __init__(self, path: str):
+        """Constructor, open the log or create it.
+
+        Keyword arguments:
+        path -- path of the log file, the index is path + '.idx'
+        """
+        self.__path = path
+        self.__log = open(path, 'a+b')
+        self.__index = open(path + '.idx', 'a+b')
+        self.__map = None
+        self.__index_map = None
+        self.__hashes = None
+        self.__recover()
+
+    def __recover(self):
+        """Drop the partial writes left by a crash.
+
+        The index is kept up to the first entry that does not start where
+        the previous block ends, points past the log or holds a malformed
+        hash, then back to the last entry whose block matches its CRC.
+        """
+        size = os.fstat(self.__index.fileno()).st_size
+        log_size = os.fstat(self.__log.fileno()).st_size
+        self.__index.seek(0)
+        entries = self.__index.read(size - size % INDEX_ENTRY.size)
+        count = 0
+        end = 0
+        for offset, length, _, block_hash in INDEX_ENTRY.iter_unpack(
+                entries):
+            if offset != end or offset + length > log_size or \
+                    not BLOCK_HASH.fullmatch(block_hash):
+                break
+            count += 1
+            end = offset + length
+        # The last entries may point to blocks the log did not sync
+        while count:
+            offset, length, crc, _ = INDEX_ENTRY.unpack_from(
+                entries, (count - 1) * INDEX_ENTRY.size)
+            self.__log.seek(offset)
+            if zlib.crc32(self.__log.read(length)) == crc:
+                break
+            count -= 1
+        end = 0
+        if count:
+            offset, length, _, _ = INDEX_ENTRY.unpack_from(
+                entries, (count - 1) * INDEX_ENTRY.size)
+            end = offset + length
+        if count * INDEX_ENTRY.size != size:
+            self.__index.truncate(count * INDEX_ENTRY.size)
+            os.fsync(self.__index.fileno())
+        if end != log_size:
+            self.__log.truncate(end)
+            os.fsync(self.__log.fileno())
+        self.__count = count
+        self.__end = end
+        self.__head = self.__entry(count)[3] if count else GENESIS_HASH
+
+    def __remap(self):
+        """Map the log and index files as they are now."""
+        self.__unmap()
+        if self.__end:
+            self.__map = mmap.mmap(self.__log.fileno(), self.__end,
+                                   access=mmap.ACCESS_READ)
+        if self.__count:
+            self.__index_map = mmap.mmap(
+                self.__index.fileno(), self.__count * INDEX_ENTRY.size,
+                access=mmap.ACCESS_READ)
+
+    def __unmap(self):
+        """Release the maps of the log and index files."""
+        for m in (self.__map, self.__index_map):
+            if m is not None:
+                m.close()
+        self.__map = None
+        self.__index_map = None
+
+    def __entry(self, height: int) -> tuple:
+        """Read the index entry of a block.
+
+        Returns:
+        (offset, length, crc, hash)
+
+        """
+        if self.__index_map is None or \
+                len(self.__index_map) < height * INDEX_ENTRY.size:
+            self.__remap()
+        offset, length, crc, block_hash = INDEX_ENTRY.unpack_from(
+            self.__index_map, (height - 1) * INDEX_ENTRY.size)
+        return offset, length, crc, str(block_hash, 'ascii')
+
+    @property
+    def path(self) -> str:
+        """Get the path of the log file."""
+        return self.__path
+
+    @property
+    def head(self) -> str:
+        """Get the hash of the last stored block."""
+        return self.__head
+
+    def __len__(self) -> int:
+        """Get the number of stored blocks, the genesis block excluded."""
+        return self.__count
+
+    def hash(self, height: int) -> str:
+        """Get the hash of the block at a height, 0 for the genesis block."""
+        if not 0 <= height <= self.__count:
+            raise IndexError('no block at height %d.' % height)
+        if height == 0:
+            return GENESIS_HASH
+        return self.__entry(height)[3]
+
+    def find(self, block_hash: str) -> int:
+        """Get the height of a block.
+
+        The hash index is built on the first call.
+
+        Returns:
+        The height, None if the block is not stored
+
+        """
+        if self.__hashes is None:
+            self.__hashes = {GENESIS_HASH: 0}
+            for height in range(1, self.__count + 1):
+                self.__hashes[self.__entry(height)[3]] = height
+        return self.__hashes.get(block_hash)
+
+    def block(self, height: int) -> tuple:
+        """Read the block at a height.
+
+        Returns:
+        (prev_hash, curr_hash, lines) as in ledger.parse_blockchain
+
+        """
+        if not 1 <= height <= self.__count:
+            raise IndexError('no block at height %d.' % height)
+        offset, length, _, curr_hash = self.__entry(height)
+        lines = []
+        if length:
+            if self.__map is None or len(self.__map) < offset + length:
+                self.__remap()
+            lines = str(self.__map[offset:offset + length],
+                        'utf-8').split('\n')
+        return self.hash(height - 1), curr_hash, lines
+
+    def blocks(self, start: int = 1):
+        """Iterate over the blocks from a height to the head."""
+        for height in range(start, self.__count + 1):
+            yield self.block(height)
+
+    def append_blocks(self, blocks: list, verify: bool = True) -> int:
+        """Append blocks following the head.
+
+        The blocks are checked before anything is written, then written
+        and synced with a single fsync of each file.
+
+        Keyword arguments:
+        blocks -- list of (prev_hash, curr_hash, lines) in chain order
+        verify -- check that the hash of each block matches its text
+
+        Returns:
+        The number of blocks appended
+
+        """
+        head = self.__head
+        data = bytearray()
+        entries = bytearray()
+        offset = self.__end
+        for prev_hash, curr_hash, lines in blocks:
+            if prev_hash != head:
+                raise ValueError('block does not follow the head.')
+            if verify and ledger.block_hash(prev_hash, lines) != curr_hash:
+                raise ValueError('block hash does not match its text.')
+            if not curr_hash.isascii() or \
+                    not BLOCK_HASH.fullmatch(bytes(curr_hash, 'ascii')):
+                raise ValueError('malformed block hash.')
+            record = bytes('\n'.join(lines), 'utf-8')
+            entries += INDEX_ENTRY.pack(offset + len(data), len(record),
+                                        zlib.crc32(record),
+                                        bytes(curr_hash, 'ascii'))
+            data += record
+            head = curr_hash
+        if not entries:
+            return 0
+        try:
+            self.__log.write(data)
+            self.__log.flush()
+            os.fsync(self.__log.fileno())
+            self.__index.write(entries)
+            self.__index.flush()
+            os.fsync(self.__index.fileno())
+        except OSError:
+            # Leave the files as they were before the call
+            self.__log.truncate(self.__end)
+            self.__index.truncate(self.__count * INDEX_ENTRY.size)
+            raise
+        first = self.__count + 1
+        self.__count += len(entries) // INDEX_ENTRY.size
+        self.__end += len(data)
+        self.__head = head
+        if self.__hashes is not None:
+            for height in range(first, self.__count + 1):
+                self.__hashes[self.hash(height)] = height
+        return self.__count - first + 1
+
+    def append_blockchain(self, text: str, verify: bool = True) -> int:
+        """Append every block of a gbc response sent for the head.
+
+        Returns:
+        The number of blocks appended
+
+        """
+        if not text:
+            return 0
+        return self.append_blocks(ledger.parse_blockchain(text), verify)
+
+    def close(self):
+        """Close the log and index files."""
+        self.__unmap()
+        self.__log.close()
+        self.__index.close()
+
+    def __enter__(self) -> 'BlockLog':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""Compact binary encoding of transaction lines and blocks.
+
+The canonical form of a transaction is its tab separated line, as signed
+and as hashed in a block. The compact form refers to users by their index
+in the chain, the order in which their aut was committed, and to recent
+blocks by their height. Other fields are length-prefixed and base64
+fields are stored as raw bytes. Every field falls back to its text when
+it has no shorter form, so decoding always gives back the exact line.
+
+Both sides of a link must hold the same chain state: a Codec registers
+the users and blocks it encodes or decodes, in chain order. The server
+answers gbcz requests with a new Codec per response, see doc/server.md:
+
+    text = Codec().decode_blockchain(payload)
+"""
+
+import base64
+
+import ledger
+
+GENESIS_HASH = ledger.GENESIS_HASH
+
+# Protocol code, then the kind of each field after the protocol
+SCHEMAS = {
+    'aut': (0, ('newuser',)),
+    'rut': (1, ('user',)),
+    'gct': (2, ('user', 'time', 'user', 'hash', 'int', 'text', 'base64')),
+    'rct': (3, ('user', 'time', 'user', 'hash', 'int', 'text', 'base64')),
+    'cct': (4, ('user', 'time', 'hash', 'user', 'user', 'user', 'int',
+                'base64')),
+    # pct in a block, without recent_hash
+    'pct': (5, ('user', 'time', 'user', 'int', 'base64')),
+}
+# pct request as sent to the server, see doc/server.md
+PCT_REQUEST = (6, ('user', 'user', 'time', 'hash', 'int', 'base64'))
+# Any other line is stored as text
+TEXT_LINE = 255
+
+PROTOCOLS = {code: (protocol, fields)
+             for protocol, (code, fields) in SCHEMAS.items()}
+PROTOCOLS[PCT_REQUEST[0]] = ('pct', PCT_REQUEST[1])
+
+
+def write_varint(buf: bytearray, n: int):
+    """Append a non-negative integer in LEB128."""
+    while n > 0x7f:
+        buf.append((n & 0x7f) | 0x80)
+        n >>= 7
+    buf.append(n)
+
+
+def read_varint(data: bytes, pos: int) -> tuple:
+    """Read a LEB128 integer.
+
+    Returns:
+    (integer, position after it)
+
+    """
+    n = 0
+    shift = 0
+    while True:
+        try:
+            byte = data[pos]
+        except IndexError:
+            raise ValueError('truncated varint.')
+        pos += 1
+        n |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return n, pos
+        shift += 7
+
+
+def write_bytes(buf: bytearray, value: bytes):
+    """Append length-prefixed bytes."""
+    write_varint(buf, len(value))
+    buf += value
+
+
+def read_bytes(data: bytes, pos: int) -> tuple:
+    """Read length-prefixed bytes.
+
+    Returns:
+    (bytes, position after them)
+
+    """
+    length, pos = read_varint(data, pos)
+    if pos + length > len(data):
+        raise ValueError('truncated field.')
+    return bytes(data[pos:pos + length]), pos + length
+
+
+def write_text(buf: bytearray, value: str):
+    """Append a length-prefixed utf-8 string."""
+    write_bytes(buf, bytes(value, 'utf-8'))
+
+
+def read_text(data: bytes, pos: int) -> tuple:
+    """Read a length-prefixed utf-8 string.
+
+    Returns:
+    (string, position after it)
+
+    """
+    value, pos = read_bytes(data, pos)
+    return str(value, 'utf-8'), pos
+
+
+def write_base64(buf: bytearray, value: str):
+    """Append a base64 string as raw bytes, or as text if not canonical.
+
+    The length is doubled, plus one for raw bytes.
+    """
+    try:
+        raw = base64.b64decode(value, validate=True)
+    except ValueError:
+        # Not ascii or not base64
+        raw = None
+    if raw is not None and str(base64.b64encode(raw), 'ascii') == value:
+        write_varint(buf, 2 * len(raw) + 1)
+        buf += raw
+    else:
+        raw = bytes(value, 'utf-8')
+        write_varint(buf, 2 * len(raw))
+        buf += raw
+
+
+def read_base64(data: bytes, pos: int) -> tuple:
+    """Read a string written by write_base64.
+
+    Returns:
+    (string, position after it)
+
+    """
+    tag, pos = read_varint(data, pos)
+    length = tag >> 1
+    if pos + length > len(data):
+        raise ValueError('truncated field.')
+    raw = bytes(data[pos:pos + length])
+    if tag & 1:
+        return str(base64.b64encode(raw), 'ascii'), pos + length
+    return str(raw, 'utf-8'), pos + length
+
+
+class Codec():
+    """Encode and decode lines and blocks against a chain state."""
+
+    def __init__(self):
+        """Constructor, with only the genesis block known."""
+        self.__users = []
+        self.__user_index = {}
+        self.__blocks = []
+        self.__block_index = {}
+        self.register_block(GENESIS_HASH)
+
+    @property
+    def users(self) -> list:
+        """Get the public key of each user by index."""
+        return self.__users
+
+    @property
+    def blocks(self) -> list:
+        """Get the hash of each block by height."""
+        return self.__blocks
+
+    def register_user(self, pubk: str):
+        """Give the next index to a user, as an aut is committed."""
+        if pubk not in self.__user_index:
+            self.__user_index[pubk] = len(self.__users)
+            self.__users.append(pubk)
+
+    def register_block(self, block_hash: str):
+        """Give the next height to a block, as it is committed."""
+        if block_hash not in self.__block_index:
+            self.__block_index[block_hash] = len(self.__blocks)
+            self.__blocks.append(block_hash)
+
+    def __write_field(self, buf: bytearray, kind: str, value: str):
+        """Append a field of the given kind."""
+        if kind in ('user', 'newuser'):
+            # 0 then the key for an unknown user, else index + 1
+            index = self.__user_index.get(value)
+            if index is None or kind == 'newuser':
+                buf.append(0)
+                write_base64(buf, value)
+            else:
+                write_varint(buf, index + 1)
+        elif kind == 'hash':
+            # Odd for a known block, 0 then the hash otherwise
+            height = self.__block_index.get(value)
+            if height is None:
+                buf.append(0)
+                write_base64(buf, value)
+            else:
+                write_varint(buf, 2 * height + 1)
+        elif kind == 'int':
+            # 0 then the text for a non canonical integer, else value + 1
+            if (value.isascii() and value.isdigit() and
+                    str(int(value)) == value):
+                write_varint(buf, int(value) + 1)
+            else:
+                buf.append(0)
+                write_text(buf, value)
+        elif kind == 'time':
+            # Decimal seconds as the number of fraction digits + 1 and the
+            # digits as an integer, 0 then the text if not canonical
+            whole, point, fraction = value.partition('.')
+            digits = whole + fraction
+            if (digits.isascii() and digits.isdigit() and whole.isdigit()
+                    and str(int(whole)) == whole and
+                    (fraction.isdigit() or not point)):
+                write_varint(buf, len(fraction) + 1)
+                write_varint(buf, int(digits))
+            else:
+                buf.append(0)
+                write_text(buf, value)
+        elif kind == 'base64':
+            write_base64(buf, value)
+        else:
+            write_text(buf, value)
+
+    def __read_field(self, data: bytes, pos: int, kind: str) -> tuple:
+        """Read a field of the given kind.
+
+        Returns:
+        (string, position after it)
+
+        """
+        if kind == 'base64':
+            return read_base64(data, pos)
+        if kind == 'text':
+            return read_text(data, pos)
+        tag, pos = read_varint(data, pos)
+        if tag == 0:
+            if kind in ('user', 'newuser', 'hash'):
+                return read_base64(data, pos)
+            return read_text(data, pos)
+        try:
+            if kind == 'user':
+                return self.__users[tag - 1], pos
+            if kind == 'hash':
+                return self.__blocks[tag >> 1], pos
+        except IndexError:
+            raise ValueError('unknown %s reference.' % kind)
+        if kind == 'int':
+            return str(tag - 1), pos
+        if kind != 'time':
+            raise ValueError('malformed %s.' % kind)
+        digits, pos = read_varint(data, pos)
+        fraction = tag - 1
+        if not fraction:
+            return str(digits), pos
+        digits = str(digits).rjust(fraction + 1, '0')
+        return '%s.%s' % (digits[:-fraction], digits[-fraction:]), pos
+
+    def encode_line(self, line: str) -> bytes:
+        """Encode a transaction line.
+
+        A committed aut registers its user: only encode the lines of a
+        block through encode_block.
+        """
+        buf = bytearray()
+        self.__encode_line(buf, line)
+        return bytes(buf)
+
+    def __encode_line(self, buf: bytearray, line: str):
+        """Append an encoded transaction line."""
+        fields = line.split('\t')
+        code, kinds = SCHEMAS.get(fields[0], (TEXT_LINE, ()))
+        if code == 5 and len(fields) == len(PCT_REQUEST[1]) + 1:
+            code, kinds = PCT_REQUEST
+        if code == TEXT_LINE or len(fields) != len(kinds) + 1:
+            buf.append(TEXT_LINE)
+            write_text(buf, line)
+            return
+        buf.append(code)
+        for kind, value in zip(kinds, fields[1:]):
+            self.__write_field(buf, kind, value)
+        if code == 0:
+            self.register_user(fields[1])
+
+    def decode_line(self, data: bytes, pos: int = 0) -> tuple:
+        """Decode a transaction line.
+
+        Returns:
+        (line, position after it)
+
+        """
+        try:
+            code = data[pos]
+        except IndexError:
+            raise ValueError('truncated line.')
+        pos += 1
+        if code == TEXT_LINE:
+            return read_text(data, pos)
+        if code not in PROTOCOLS:
+            raise ValueError('unknown protocol code %d.' % code)
+        protocol, kinds = PROTOCOLS[code]
+        fields = [protocol]
+        for kind in kinds:
+            value, pos = self.__read_field(data, pos, kind)
+            fields.append(value)
+        if code == 0:
+            self.register_user(fields[1])
+        return '\t'.join(fields), pos
+
+    def encode_block(self, prev_hash: str, curr_hash: str,
+                     lines: list) -> bytes:
+        """Encode a committed block and register its users and hash."""
+        buf = bytearray()
+        self.__encode_block(buf, prev_hash, curr_hash, lines)
+        return bytes(buf)
+
+    def __encode_block(self, buf: bytearray, prev_hash: str, curr_hash: str,
+                       lines: list):
+        """Append an encoded block."""
+        self.__write_field(buf, 'hash', prev_hash)
+        self.__write_field(buf, 'hash', curr_hash)
+        write_varint(buf, len(lines))
+        for line in lines:
+            self.__encode_line(buf, line)
+        self.register_block(curr_hash)
+
+    def decode_block(self, data: bytes, pos: int = 0) -> tuple:
+        """Decode a committed block and register its users and hash.
+
+        Returns:
+        ((prev_hash, curr_hash, lines), position after it)
+
+        """
+        prev_hash, pos = self.__read_field(data, pos, 'hash')
+        curr_hash, pos = self.__read_field(data, pos, 'hash')
+        count, pos = read_varint(data, pos)
+        lines = []
+        for _ in range(count):
+            line, pos = self.decode_line(data, pos)
+            lines.append(line)
+        self.register_block(curr_hash)
+        return (prev_hash, curr_hash, lines), pos
+
+    def encode_blockchain(self, text: str) -> bytes:
+        """Encode a gbc response."""
+        blocks = ledger.parse_blockchain(text) if text else []
+        buf = bytearray()
+        write_varint(buf, len(blocks))
+        for block in blocks:
+            self.__encode_block(buf, *block)
+        return bytes(buf)
+
+    def decode_blockchain(self, data: bytes) -> str:
+        """Decode a gbc response given by encode_blockchain."""
+        count, pos = read_varint(data, 0)
+        texts = []
+        curr_hash = None
+        for _ in range(count):
+            (prev_hash, curr_hash, lines), pos = self.decode_block(data, pos)
+            texts.append('\n'.join(['prev\t' + prev_hash] + lines))
+        if pos != len(data):
+            raise ValueError('trailing data.')
+        if not texts:
+            return ''
+        return '\n'.join(texts + ['head\t' + curr_hash])
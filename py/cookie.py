@@ -1,28 +1,86 @@
 #!/usr/bin/env python3
 """Contains information on Individuals involved in the project."""
 
+import bisect
+
 import encryption
 
 
 class CookierList():
-    """A list of cookiers."""
+    """A list of cookiers, indexed by public key, name and wallet.
+
+    Lookups by public key or name are constant time and the wallet index
+    is kept sorted for top() and wallet_range(). Cookiers tell the lists
+    holding them when their public key, name or wallet changes.
+    """
+
+    def __init__(self, cookiers: list = None):
+        """Constructor.
+
+        Keyword arguments:
+        cookiers -- cookiers to bulk load, see add_cookiers()
+        """
+        # id(cookier) -> cookier, in insertion order
+        self.__cookiers = {}
+        self.__by_pubk = {}
+        self.__by_name = {}
+        # Sorted (wallet, seq) keys with the matching cookiers, seq breaks
+        # ties so that a cookier's key is unique
+        self.__wallet_keys = []
+        self.__wallet_cookiers = []
+        self.__seqs = {}
+        self.__next_seq = 0
+        if cookiers:
+            self.add_cookiers(cookiers)
 
-    def __init__(self):
-        """Constructor."""
-        self.__cookiers = []
+    def __len__(self) -> int:
+        """Get the number of cookiers."""
+        return len(self.__cookiers)
+
+    def __iter__(self):
+        """Iterate over the cookiers in insertion order."""
+        return iter(list(self.__cookiers.values()))
+
+    def __contains__(self, cookier: 'Cookier') -> bool:
+        """Check whether an equal cookier is in the list."""
+        return isinstance(cookier, Cookier) and any(
+            c == cookier for c in self.__by_pubk.get(cookier.pubk, ()))
 
     @property
-    def cookiers(self):
-        """Get cookiers."""
-        return self.__cookiers
+    def cookiers(self) -> list:
+        """Get a copy of the cookiers, in insertion order."""
+        return list(self.__cookiers.values())
 
     @cookiers.setter
-    def cookiers(self, cookiers):
-        """Set cookiers."""
+    def cookiers(self, cookiers: list):
+        """Replace the cookiers, see add_cookiers()."""
         for cookier in cookiers:
             if not isinstance(cookier, Cookier):
                 raise TypeError('list elements must be of type Cookier')
-        self.__cookiers = cookiers
+        for cookier in self.cookiers:
+            self.remove_cookier(cookier)
+        self.add_cookiers(cookiers)
+
+    def __index(self, cookier: 'Cookier'):
+        """Add a cookier to the pubk and name indexes."""
+        self.__cookiers[id(cookier)] = cookier
+        self.__by_pubk.setdefault(cookier.pubk, []).append(cookier)
+        self.__by_name.setdefault(cookier.name, []).append(cookier)
+        self.__seqs[id(cookier)] = self.__next_seq
+        self.__next_seq += 1
+        cookier._lists.append(self)
+
+    def __unindex(self, cookier: 'Cookier', pubk: str, name: str):
+        """Remove a cookier from the pubk and name indexes."""
+        for index, key in ((self.__by_pubk, pubk), (self.__by_name, name)):
+            bucket = index[key]
+            bucket.remove(cookier)
+            if not bucket:
+                del index[key]
+
+    def __wallet_key(self, cookier: 'Cookier', wallet: int) -> tuple:
+        """Get the key of a cookier in the wallet index."""
+        return (wallet, self.__seqs[id(cookier)])
 
     def add_cookier(self, cookier: 'Cookier'):
         """Add a cookier into the list.
@@ -33,24 +91,142 @@ class CookierList():
         if not isinstance(cookier, Cookier):
             raise TypeError("add_cookier(x): x must be of type Cookier")
         # Check that the cookier doesn't exist already
-        if cookier in self.__cookiers:
+        if cookier in self:
             raise ValueError('add_cookier(x): x already exists.')
-        self.__cookiers.append(cookier)
+        self.__index(cookier)
+        key = self.__wallet_key(cookier, cookier.wallet)
+        i = bisect.bisect_left(self.__wallet_keys, key)
+        self.__wallet_keys.insert(i, key)
+        self.__wallet_cookiers.insert(i, cookier)
+
+    def add_cookiers(self, cookiers: list):
+        """Add many cookiers into the list at once.
+
+        The wallet index is sorted once for the whole batch. Nothing is
+        added if one of the cookiers is invalid or already exists.
+
+        Keyword arguments:
+        cookiers -- iterable of Cookier objects
+        """
+        cookiers = list(cookiers)
+        seen = {}
+        for cookier in cookiers:
+            if not isinstance(cookier, Cookier):
+                raise TypeError('add_cookiers(x): x must contain Cookier.')
+            key = (cookier.pubk, cookier.name)
+            if cookier in self or key in seen:
+                raise ValueError('add_cookiers(x): %s already exists.'
+                                 % cookier.name)
+            seen[key] = cookier
+        for cookier in cookiers:
+            self.__index(cookier)
+        entries = sorted(
+            zip(self.__wallet_keys, self.__wallet_cookiers),
+            key=lambda entry: entry[0])
+        entries += [(self.__wallet_key(c, c.wallet), c) for c in cookiers]
+        entries.sort(key=lambda entry: entry[0])
+        self.__wallet_keys = [key for key, _ in entries]
+        self.__wallet_cookiers = [cookier for _, cookier in entries]
 
     def remove_cookier(self, cookier: 'Cookier'):
         """Remove a cookier from the list.
 
         Keyword arguments:
-        pubk -- public key associated to the cookier
+        cookier -- the Cookier object, or one equal to it
         """
-        try:
-            self.__cookiers.remove(cookier)
-        except ValueError:
+        if isinstance(cookier, Cookier):
+            for c in self.__by_pubk.get(cookier.pubk, ()):
+                if c == cookier:
+                    cookier = c
+                    break
+        if not isinstance(cookier, Cookier) or \
+                id(cookier) not in self.__cookiers:
             raise ValueError('remove_cookier(x): x not in cook')
+        self.__unindex(cookier, cookier.pubk, cookier.name)
+        key = self.__wallet_key(cookier, cookier.wallet)
+        i = bisect.bisect_left(self.__wallet_keys, key)
+        del self.__wallet_keys[i]
+        del self.__wallet_cookiers[i]
+        del self.__cookiers[id(cookier)]
+        del self.__seqs[id(cookier)]
+        cookier._lists.remove(self)
+
+    def _check_change(self, cookier: 'Cookier', pubk: str, name: str):
+        """Check that a cookier can take a new public key and name.
+
+        Called by Cookier before the change.
+        """
+        for c in self.__by_pubk.get(pubk, ()):
+            if c is not cookier and c.name == name:
+                raise ValueError('a cookier with this pubk and name exists.')
+
+    def _reindex(self, cookier: 'Cookier', pubk: str, name: str,
+                 wallet: int):
+        """Move a cookier in the indexes after a change.
 
-    def search(self, pubk=None: str, name=None: str, wallet=None: int) -> list:
+        Called by Cookier with the values before the change.
+
+        Keyword arguments:
+        cookier -- the changed cookier
+        pubk -- public key before the change
+        name -- name before the change
+        wallet -- wallet before the change
+        """
+        if (pubk, name) != (cookier.pubk, cookier.name):
+            self.__unindex(cookier, pubk, name)
+            self.__by_pubk.setdefault(cookier.pubk, []).append(cookier)
+            self.__by_name.setdefault(cookier.name, []).append(cookier)
+        if wallet != cookier.wallet:
+            key = self.__wallet_key(cookier, wallet)
+            i = bisect.bisect_left(self.__wallet_keys, key)
+            del self.__wallet_keys[i]
+            del self.__wallet_cookiers[i]
+            key = self.__wallet_key(cookier, cookier.wallet)
+            i = bisect.bisect_left(self.__wallet_keys, key)
+            self.__wallet_keys.insert(i, key)
+            self.__wallet_cookiers.insert(i, cookier)
+
+    def get(self, pubk: str) -> 'Cookier':
+        """Get the first cookier added with a public key.
+
+        Returns:
+        The cookier, None if there is none
+
+        """
+        bucket = self.__by_pubk.get(pubk)
+        return bucket[0] if bucket else None
+
+    def top(self, n: int) -> list:
+        """Get the n cookiers with the most cookies, most cookies first."""
+        if n <= 0:
+            return []
+        return self.__wallet_cookiers[:-n - 1:-1]
+
+    def wallet_range(self, low: int = None, high: int = None) -> list:
+        """Get the cookiers whose wallet is in [low, high].
+
+        Keyword arguments:
+        low -- smallest wallet, unbounded if None
+        high -- largest wallet, unbounded if None
+
+        Returns:
+        The cookiers, fewest cookies first
+
+        """
+        start = 0
+        stop = len(self.__wallet_keys)
+        if low is not None:
+            start = bisect.bisect_left(self.__wallet_keys, (low,))
+        if high is not None:
+            stop = bisect.bisect_left(self.__wallet_keys, (high + 1,))
+        return self.__wallet_cookiers[start:stop]
+
+    def search(self, pubk: str = None, name: str = None,
+               wallet: int = None) -> list:
         """Search for all matching cookiers in the list.
 
+        The most selective index among the given conditions is used.
+
         Keyword arguments:
         pubk -- public key associated to the cookier
         name -- name associated to the cookier
@@ -60,42 +236,36 @@ class CookierList():
         A list of matched cookiers
 
         """
-        conditions = 0
-        if pubk:
-            if not isinstance(pubk, str):
-                raise TypeError('search(pubk=x): x must be of type str.')
-            conditions += 1
-        if name:
-            if not isinstance(name, str):
-                raise TypeError('search(name=x): x must be of type str.')
-            conditions += 1
-        if wallet:
-            if not isinstance(wallet, int):
-                raise TypeError('search(wallet=x): x must be of type int.')
-            conditions += 1
-
-        if conditions == 0:
+        if pubk is not None and not isinstance(pubk, str):
+            raise TypeError('search(pubk=x): x must be of type str.')
+        if name is not None and not isinstance(name, str):
+            raise TypeError('search(name=x): x must be of type str.')
+        if wallet is not None and not isinstance(wallet, int):
+            raise TypeError('search(wallet=x): x must be of type int.')
+        if pubk is None and name is None and wallet is None:
             err_log = 'search(pubk=x, name=y): please specify x and/or y'
             raise ValueError(err_log)
 
-        matched_cookiers = []
-        for cookier in self.__cookiers:
-            match = 0
-            if pubk and cookier.pubk == pubk:
-                match += 1
-            if name and cookier.name == name:
-                match += 1
-            if wallet and cookier.waller == wallet:
-                match += 1
-            if conditions == match:
-                matched_cookiers.append(cookier)
-        return matched_cookiers
+        if pubk is not None:
+            candidates = self.__by_pubk.get(pubk, [])
+        elif name is not None:
+            candidates = self.__by_name.get(name, [])
+        else:
+            return self.wallet_range(wallet, wallet)
+        return [cookier for cookier in candidates
+                if (name is None or cookier.name == name) and
+                (wallet is None or cookier.wallet == wallet)]
 
 
 class Cookier():
     """An individual involved in MoCookie."""
 
+    __slots__ = ('__pubk', '__name', '__wallet', '_lists')
+
     name_maxlen = 16
+    # Number of public key changes of any cookier, for the caches holding
+    # serialized public keys
+    pubk_changes = 0
 
     def __init__(self, pubk: str, name: str):
         """Constructor.
@@ -114,6 +284,8 @@ class Cookier():
             raise ValueError('name must be of length 2-16')
         self.__pubk = pubk
         self.__wallet = 0
+        # CookierLists holding the cookier
+        self._lists = []
 
     def __eq__(self, other):
         """Redefine equality function."""
@@ -127,7 +299,7 @@ class Cookier():
     @pubk.setter
     def pubk(self, pubk: str):
         """Set the cookier's public key."""
-        self.__pubk = pubk
+        self.__change(pubk, self.__name, self.__wallet)
 
     @property
     def name(self) -> str:
@@ -139,7 +311,30 @@ class Cookier():
         """Setter for the cookier's name."""
         if len(name) > Cookier.name_maxlen:
             raise ValueError('Name is too long.')
-        self.__name = name
+        self.__change(self.__pubk, name, self.__wallet)
+
+    @property
+    def wallet(self) -> int:
+        """Get the number of cookies belonging to the cookier."""
+        return self.__wallet
+
+    @wallet.setter
+    def wallet(self, wallet: int):
+        """Set the number of cookies belonging to the cookier."""
+        if not isinstance(wallet, int):
+            raise TypeError('wallet must be of type int.')
+        self.__change(self.__pubk, self.__name, wallet)
+
+    def __change(self, pubk: str, name: str, wallet: int):
+        """Change the cookier and update the lists holding it."""
+        for cookier_list in self._lists:
+            cookier_list._check_change(self, pubk, name)
+        old = (self.__pubk, self.__name, self.__wallet)
+        self.__pubk, self.__name, self.__wallet = pubk, name, wallet
+        if pubk != old[0]:
+            Cookier.pubk_changes += 1
+        for cookier_list in self._lists:
+            cookier_list._reindex(self, *old)
 
     def verify(self, message: str, signature: str) -> bool:
         """Verify a message sent by the Cookier.
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""Pairwise debt ledger built from the committed blocks.
+
+The ledger holds the same debts as the Debt table of the server: the
+number of cookies each user owes another, with only positive debts kept.
+Blocks are applied one at a time in the text format returned by the gbc
+protocol, so a client only needs the blocks committed since the ledger's
+head. Snapshots tag the ledger with the hash of its head block; a client
+restarts by loading its latest snapshot and sending gbc with that hash:
+
+    store = SnapshotStore('snapshots')
+    ledger = store.latest() or Ledger()
+    ledger.apply_blockchain(gbc(ledger.head))
+    store.save(ledger)
+"""
+
+import os
+import json
+import zlib
+import base64
+import hashlib
+
+GENESIS_HASH = 'GENESIS/BLOCK/=============================='
+
+# Number of lines of a cct and a pct in a block, one per user
+COMBINED_SIZES = {'cct': 3, 'pct': 2}
+
+
+def block_hash(prev_hash: str, lines: list) -> str:
+    """Calculate the hash of a block as Blockchain.generateCurrHash does.
+
+    Keyword arguments:
+    prev_hash -- hash of the previous block
+    lines -- transaction lines of the block
+
+    Returns:
+    Base64 of the SHA256 of the block text
+
+    """
+    text = ''.join('%s\n' % line for line in ['prev\t' + prev_hash] + lines)
+    digest = hashlib.sha256(bytes(text, 'utf-8')).digest()
+    return str(base64.b64encode(digest), 'ascii')
+
+
+def parse_blockchain(text: str) -> list:
+    """Split a gbc response into blocks.
+
+    Keyword arguments:
+    text -- the result of Blockchain.getBlockchain
+
+    Returns:
+    A list of (prev_hash, curr_hash, lines) in chain order
+
+    """
+    blocks = []
+    head = None
+    for line in text.split('\n'):
+        if line.startswith('prev\t'):
+            blocks.append((line[5:], []))
+        elif line.startswith('head\t'):
+            head = line[5:]
+        elif line:
+            if not blocks:
+                raise ValueError('transaction outside of a block.')
+            blocks[-1][1].append(line)
+    if blocks and head is None:
+        raise ValueError('missing head hash.')
+    hashes = [prev_hash for prev_hash, _ in blocks[1:]] + [head]
+    return [(prev_hash, curr_hash, lines)
+            for (prev_hash, lines), curr_hash in zip(blocks, hashes)]
+
+
+def debt_changes(lines: list) -> tuple:
+    """Compute the net changes of a block to the debts and users.
+
+    Lines of a cct or pct come one per user, in a row, and are applied
+    once for the whole combined transaction.
+
+    Keyword arguments:
+    lines -- transaction lines of a block
+
+    Returns:
+    (deltas, users) where deltas maps (sender, receiver) to the change in
+    the cookies sender owes receiver, and users maps each added or
+    removed public key to its new validity
+
+    """
+    deltas = {}
+    users = {}
+
+    def change(sender, receiver, delta):
+        deltas[(sender, receiver)] = deltas.get((sender, receiver), 0) + delta
+
+    combined = []
+    for line in lines:
+        fields = line.split('\t')
+        protocol = fields[0]
+        try:
+            if combined and protocol != combined[0][0]:
+                raise ValueError('incomplete %s.' % combined[0][0])
+            if protocol == 'aut':
+                users[fields[1]] = True
+            elif protocol == 'rut':
+                users[fields[1]] = False
+            elif protocol == 'gct':
+                change(fields[1], fields[3], int(fields[5]))
+            elif protocol == 'rct':
+                change(fields[3], fields[1], -int(fields[5]))
+            elif protocol == 'cct':
+                # Every user signs the same start, mid, end and num_cookies
+                combined.append(['cct'] + fields[4:8])
+            elif protocol == 'pct':
+                # user_a then user_b, each naming the other
+                combined.append(['pct', fields[1], fields[3], fields[4]])
+            else:
+                raise ValueError('unknown protocol %s.' % protocol)
+        except IndexError:
+            raise ValueError('malformed transaction: %s' % line)
+        if combined and len(combined) == COMBINED_SIZES[protocol]:
+            if protocol == 'cct':
+                if any(c != combined[0] for c in combined):
+                    raise ValueError('cct lines do not match.')
+                _, start, mid, end, num = combined[0]
+                num = int(num)
+                change(start, mid, -num)
+                change(mid, end, -num)
+                change(start, end, num)
+            else:
+                (_, user_a, user_b, num), (_, other_b, other_a, other_num) = \
+                    combined
+                if (user_a, user_b, num) != (other_a, other_b, other_num):
+                    raise ValueError('pct lines do not match.')
+                num = int(num)
+                change(user_a, user_b, -num)
+                change(user_b, user_a, -num)
+            combined = []
+    if combined:
+        raise ValueError('incomplete %s.' % combined[0][0])
+    return deltas, users
+
+
+class Ledger():
+    """Debts between users as of a block."""
+
+    def __init__(self):
+        """Constructor."""
+        self.__head = GENESIS_HASH
+        self.__height = 0
+        self.__debts = {}
+        self.__balances = {}
+        self.__users = {}
+
+    @property
+    def head(self) -> str:
+        """Get the hash of the last applied block."""
+        return self.__head
+
+    @property
+    def height(self) -> int:
+        """Get the number of applied blocks, the genesis block excluded."""
+        return self.__height
+
+    @property
+    def users(self) -> dict:
+        """Get a copy of the validity of each user, by public key."""
+        return dict(self.__users)
+
+    def __len__(self) -> int:
+        """Get the number of pairs of users with a debt."""
+        return len(self.__debts)
+
+    def debt(self, sender: str, receiver: str) -> int:
+        """Get the number of cookies sender owes receiver, 0 if none."""
+        return self.__debts.get((sender, receiver), 0)
+
+    def debts(self):
+        """Iterate over the ((sender, receiver), cookies_owed) debts."""
+        return iter(self.__debts.items())
+
+    def balance(self, pubk: str) -> int:
+        """Get the cookies owed to a user minus the cookies they owe."""
+        return self.__balances.get(pubk, 0)
+
+    def apply_block(self, prev_hash: str, curr_hash: str, lines: list,
+                    verify: bool = True):
+        """Apply the transactions of the block following the head.
+
+        The block is applied as a whole: if it is rejected the ledger is
+        left unchanged.
+
+        Keyword arguments:
+        prev_hash -- hash of the previous block, must be the head
+        curr_hash -- hash of the block
+        lines -- transaction lines of the block
+        verify -- check that curr_hash is the hash of the block text
+        """
+        if prev_hash != self.__head:
+            raise ValueError('block does not follow the head.')
+        if verify and block_hash(prev_hash, lines) != curr_hash:
+            raise ValueError('block hash does not match its text.')
+        deltas, users = debt_changes(lines)
+        # The block may list a transaction before one it depends on, only
+        # the debts after the whole block must be valid
+        owed = {pair: self.__debts.get(pair, 0) + delta
+                for pair, delta in deltas.items() if delta}
+        for (sender, receiver), cookies in owed.items():
+            if cookies < 0:
+                raise ValueError('%s would owe %s %d cookies.'
+                                 % (sender, receiver, cookies))
+        for (sender, receiver), cookies in owed.items():
+            if cookies:
+                self.__debts[(sender, receiver)] = cookies
+            else:
+                del self.__debts[(sender, receiver)]
+            delta = deltas[(sender, receiver)]
+            self.__balances[sender] = self.__balances.get(sender, 0) - delta
+            self.__balances[receiver] = (self.__balances.get(receiver, 0) +
+                                         delta)
+        self.__users.update(users)
+        self.__head = curr_hash
+        self.__height += 1
+
+    def apply_blockchain(self, text: str, verify: bool = True) -> int:
+        """Apply every block of a gbc response sent for the head.
+
+        Keyword arguments:
+        text -- the result of Blockchain.getBlockchain(head)
+        verify -- check the hash of each block
+
+        Returns:
+        The number of blocks applied
+
+        """
+        blocks = parse_blockchain(text)
+        for prev_hash, curr_hash, lines in blocks:
+            self.apply_block(prev_hash, curr_hash, lines, verify)
+        return len(blocks)
+
+    def dumps(self) -> bytes:
+        """Give a compact snapshot of the ledger.
+
+        Public keys are stored once and debts refer to them by index.
+
+        Returns:
+        The zlib compressed snapshot
+
+        """
+        pubks = sorted(set(self.__users).union(
+            *((sender, receiver) for sender, receiver in self.__debts)))
+        index = {pubk: i for i, pubk in enumerate(pubks)}
+        snapshot = {
+            'head': self.__head,
+            'height': self.__height,
+            'users': pubks,
+            'valid': [self.__users.get(pubk) for pubk in pubks],
+            'debts': [[index[sender], index[receiver], cookies]
+                      for (sender, receiver), cookies
+                      in sorted(self.__debts.items())],
+        }
+        return zlib.compress(bytes(json.dumps(snapshot,
+                                              separators=(',', ':')),
+                                   'utf-8'))
+
+    @classmethod
+    def loads(cls, data: bytes) -> 'Ledger':
+        """Create a ledger from a snapshot given by dumps()."""
+        snapshot = json.loads(str(zlib.decompress(data), 'utf-8'))
+        ledger = cls()
+        pubks = snapshot['users']
+        ledger.__head = snapshot['head']
+        ledger.__height = snapshot['height']
+        ledger.__users = {pubk: valid
+                          for pubk, valid in zip(pubks, snapshot['valid'])
+                          if valid is not None}
+        for sender, receiver, cookies in snapshot['debts']:
+            sender, receiver = pubks[sender], pubks[receiver]
+            ledger.__debts[(sender, receiver)] = cookies
+            ledger.__balances[sender] = (ledger.__balances.get(sender, 0) -
+                                         cookies)
+            ledger.__balances[receiver] = (
+                ledger.__balances.get(receiver, 0) + cookies)
+        return ledger
+
+
+class SnapshotStore():
+    """Directory of ledger snapshots named after their height and head."""
+
+    suffix = '.snapshot'
+
+    def __init__(self, directory: str, keep: int = 3):
+        """Constructor.
+
+        Keyword arguments:
+        directory -- directory holding the snapshots, created if needed
+        keep -- number of most recent snapshots kept by save()
+        """
+        if keep < 1:
+            raise ValueError('keep must be positive.')
+        os.makedirs(directory, exist_ok=True)
+        self.__directory = directory
+        self.__keep = keep
+
+    @property
+    def directory(self) -> str:
+        """Get the snapshot directory."""
+        return self.__directory
+
+    def snapshots(self) -> list:
+        """Get the snapshot file names, the most recent last."""
+        names = [name for name in os.listdir(self.__directory)
+                 if name.endswith(SnapshotStore.suffix)]
+        return sorted(names, key=lambda name: int(name.split('-', 1)[0]))
+
+    def save(self, ledger: 'Ledger') -> str:
+        """Write a snapshot of a ledger and drop the oldest ones.
+
+        The snapshot is written to a temporary file then renamed, so a
+        crash never leaves a partial snapshot behind.
+
+        Returns:
+        The path of the snapshot
+
+        """
+        head = ledger.head.replace('+', '-').replace('/', '_').rstrip('=')
+        name = '%d-%s%s' % (ledger.height, head, SnapshotStore.suffix)
+        path = os.path.join(self.__directory, name)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(ledger.dumps())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+        for old in self.snapshots()[:-self.__keep]:
+            os.remove(os.path.join(self.__directory, old))
+        return path
+
+    def latest(self) -> 'Ledger':
+        """Load the most recent snapshot.
+
+        Returns:
+        The ledger of the snapshot, None if there is none
+
+        """
+        snapshots = self.snapshots()
+        if not snapshots:
+            return None
+        with open(os.path.join(self.__directory, snapshots[-1]), 'rb') as f:
+            return Ledger.loads(f.read())
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""Signature checks of the pool on a commit and cached block hashes.
+
+Run from the repository root with python -m pytest py/tests.
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..',
+                                'server'))
+
+import encryption  # noqa: E402
+from Crypto.PublicKey import RSA  # noqa: E402
+from cookie import Cookier  # noqa: E402
+from transaction import GiveCookieTransaction  # noqa: E402
+from blockchain import Block, Blockchain, SignatureError  # noqa: E402
+
+
+class TestCommit(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.user = encryption.RSAUser()
+        key = RSA.generate(encryption.RSAUser.keylen)
+        cls.user.set_keys(key.publickey(), key)
+
+    def setUp(self):
+        self.chain = Blockchain(verify_workers=1)
+        self.giver = Cookier(self.user.pubkey, 'giver')
+        self.receiver = Cookier('receiver-key', 'receiver')
+
+    def tearDown(self):
+        self.chain.shutdown()
+
+    def give(self, reason: str, sign: bool = False) -> 'Transaction':
+        t = GiveCookieTransaction('h', self.giver, self.receiver, reason)
+        if sign:
+            t.signature = self.user.sign(str(t))
+        return t
+
+    def test_unsigned_transaction_commits(self):
+        t = self.give('x')
+        self.chain.add_transaction(t)
+        self.assertTrue(self.chain.commit(1))
+        self.assertEqual(self.chain.size, 1)
+        self.assertEqual(self.chain.head.transactions[0].serialize(),
+                         t.serialize())
+        self.assertEqual(self.chain.pool, [])
+
+    def test_bad_signature_raises_with_rejected(self):
+        good = self.give('good', sign=True)
+        unsigned = self.give('unsigned')
+        # Signed for another message
+        bad = GiveCookieTransaction('h', self.giver, self.receiver, 'bad',
+                                    signature=good.signature)
+        self.assertEqual(bad.signature, good.signature)
+        for t in (good, unsigned, bad):
+            self.chain.add_transaction(t)
+        with self.assertRaises(SignatureError) as cm:
+            self.chain.commit(1)
+        self.assertEqual(cm.exception.rejected, [bad])
+        self.assertEqual(self.chain.size, 0)
+        self.assertEqual(self.chain.pool, [good, unsigned])
+        self.assertTrue(self.chain.commit(1))
+        self.assertEqual(len(self.chain.head.transactions), 2)
+
+    def test_empty_pool(self):
+        self.assertFalse(self.chain.commit(1))
+
+
+def rehash(block: 'Block') -> str:
+    """Hash the transactions of a block from scratch."""
+    copy = Block()
+    copy.previous_hash = block.previous_hash
+    copy.transactions = list(block.transactions)
+    return copy.calculate_hash()
+
+
+class TestBlockHash(unittest.TestCase):
+
+    def setUp(self):
+        self.a = Cookier('key-a', 'alice')
+        self.b = Cookier('key-b', 'bob')
+        self.block = Block()
+        self.block.previous_hash = '0' * 128
+        self.t1 = GiveCookieTransaction('h', self.a, self.b, 'one')
+        self.t2 = GiveCookieTransaction('h', self.b, self.a, 'two')
+        self.block.add_transaction(self.t1)
+        self.block.add_transaction(self.t2)
+        self.hash = self.block.current_hash
+
+    def test_reason_change(self):
+        self.t2.reason = 'changed'
+        self.assertNotEqual(self.block.current_hash, self.hash)
+        self.assertEqual(self.block.current_hash, rehash(self.block))
+
+    def test_pubk_change(self):
+        self.a.pubk = 'key-z'
+        self.assertIn('key-z', str(self.t1))
+        self.assertNotEqual(self.block.current_hash, self.hash)
+        self.assertEqual(self.block.current_hash, rehash(self.block))
+
+    def test_transactions_change(self):
+        t3 = GiveCookieTransaction('h', self.a, self.b, 'three')
+        self.block.transactions[0] = t3
+        self.assertEqual(self.block.current_hash, rehash(self.block))
+        del self.block.transactions[0]
+        self.assertEqual(self.block.current_hash, rehash(self.block))
+        self.block.transactions = [self.t1, self.t2]
+        self.assertEqual(self.block.current_hash, self.hash)
+        self.block.add_transaction(t3)
+        self.assertEqual(self.block.current_hash, rehash(self.block))
+
+    def test_table_block_pubk_change(self):
+        chain = Blockchain(verify_workers=1)
+        chain.add_transaction(self.t1)
+        chain.add_transaction(self.t2)
+        self.assertTrue(chain.commit(1))
+        head = chain.head
+        self.assertEqual(head.current_hash, self.hash)
+        self.b.pubk = 'key-y'
+        self.assertEqual(head.current_hash, rehash(head))
+        self.assertNotEqual(head.current_hash, self.hash)
+
+
+if __name__ == '__main__':
+    unittest.main()
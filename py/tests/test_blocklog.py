@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""Recovery of a BlockLog after a crash.
+
+Run from the repository root with python -m pytest py/tests.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import ledger  # noqa: E402
+from blocklog import BlockLog, INDEX_ENTRY  # noqa: E402
+
+
+def make_blocks(count: int, prev_hash: str = ledger.GENESIS_HASH) -> list:
+    """Build count blocks of one line each following prev_hash."""
+    blocks = []
+    for i in range(count):
+        lines = ['aut\t%d\tuser%d' % (i, i)]
+        curr_hash = ledger.block_hash(prev_hash, lines)
+        blocks.append((prev_hash, curr_hash, lines))
+        prev_hash = curr_hash
+    return blocks
+
+
+class TestRecover(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'blocks.log')
+        self.blocks = make_blocks(3)
+        with BlockLog(self.path) as log:
+            log.append_blocks(self.blocks)
+        self.log_size = os.path.getsize(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def append(self, suffix: str, data: bytes):
+        with open(self.path + suffix, 'ab') as f:
+            f.write(data)
+
+    def assertIntact(self):
+        with BlockLog(self.path) as log:
+            self.assertEqual(len(log), 3)
+            self.assertEqual(log.head, self.blocks[-1][1])
+            self.assertEqual(list(log.blocks()), self.blocks)
+        self.assertEqual(os.path.getsize(self.path + '.idx'),
+                         3 * INDEX_ENTRY.size)
+        self.assertEqual(os.path.getsize(self.path), self.log_size)
+
+    def test_reopen(self):
+        self.assertIntact()
+
+    def test_zero_entry(self):
+        self.append('.idx', bytes(INDEX_ENTRY.size))
+        self.assertIntact()
+
+    def test_partial_entry(self):
+        self.append('.idx', bytes(INDEX_ENTRY.size // 2))
+        self.assertIntact()
+
+    def test_entry_past_log(self):
+        prev_hash, curr_hash, lines = make_blocks(1, self.blocks[-1][1])[0]
+        self.append('.idx', INDEX_ENTRY.pack(self.log_size, 10, 0,
+                                             bytes(curr_hash, 'ascii')))
+        self.assertIntact()
+
+    def test_entry_not_contiguous(self):
+        self.append('', b'garbage')
+        self.append('.idx', INDEX_ENTRY.pack(self.log_size + 1, 0, 0,
+                                             b'A' * 43 + b'='))
+        self.assertIntact()
+
+    def test_crc_mismatch(self):
+        self.append('', b'garbage')
+        self.append('.idx', INDEX_ENTRY.pack(self.log_size, 7, 0,
+                                             b'A' * 43 + b'='))
+        self.assertIntact()
+
+    def test_log_without_entry(self):
+        self.append('', b'partial block')
+        self.assertIntact()
+
+    def test_append_after_recovery(self):
+        self.append('.idx', bytes(INDEX_ENTRY.size))
+        more = make_blocks(2, self.blocks[-1][1])
+        with BlockLog(self.path) as log:
+            self.assertEqual(log.append_blocks(more), 2)
+        with BlockLog(self.path) as log:
+            self.assertEqual(len(log), 5)
+            self.assertEqual(list(log.blocks()), self.blocks + more)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""Round trips of lines and gbc responses through the compact Codec.
+
+Run from the repository root with python -m pytest py/tests.
+"""
+
+import os
+import sys
+import base64
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import ledger  # noqa: E402
+from compact import Codec, TEXT_LINE  # noqa: E402
+
+ALICE = str(base64.b64encode(b'alice' * 60), 'ascii')
+BOB = str(base64.b64encode(b'bob' * 100), 'ascii')
+CAROL = str(base64.b64encode(b'carol' * 60), 'ascii')
+SIGNATURE = str(base64.b64encode(bytes(range(256))), 'ascii')
+
+
+def gct(ttime: str = '1700000000.5', cookies: str = '2',
+        recent: str = ledger.GENESIS_HASH, receiver: str = BOB,
+        signature: str = SIGNATURE) -> str:
+    """Build a gct line from ALICE."""
+    return '\t'.join(['gct', ALICE, ttime, receiver, recent, cookies,
+                      'lunch', signature])
+
+
+def make_blockchain(blocks: list) -> str:
+    """Build a gbc response from the lines of each block."""
+    prev_hash = ledger.GENESIS_HASH
+    texts = []
+    for lines in blocks:
+        texts.append('\n'.join(['prev\t' + prev_hash] + lines))
+        prev_hash = ledger.block_hash(prev_hash, lines)
+    return '\n'.join(texts + ['head\t' + prev_hash])
+
+
+class TestLines(unittest.TestCase):
+
+    def setUp(self):
+        # Encoder and decoder hold the same chain state
+        self.encoder = Codec()
+        self.decoder = Codec()
+        for codec in (self.encoder, self.decoder):
+            codec.register_user(ALICE)
+            codec.register_user(BOB)
+
+    def round_trip(self, line: str) -> bytes:
+        data = self.encoder.encode_line(line)
+        self.assertEqual(self.decoder.decode_line(data), (line, len(data)))
+        return data
+
+    def test_canonical_fields_are_shorter(self):
+        line = gct()
+        self.assertLess(len(self.round_trip(line)), len(line) // 4)
+
+    def test_non_canonical_int(self):
+        for cookies in ('007', '-1', '2.0', 'two', '', '٣'):
+            self.round_trip(gct(cookies=cookies))
+
+    def test_non_canonical_time(self):
+        for ttime in ('1700000000', '1700000000.050', '01.5', '.5', '1.',
+                      '-1.5', '1e9', '', '1.5.5', '١.5'):
+            self.round_trip(gct(ttime=ttime))
+
+    def test_non_canonical_base64(self):
+        for signature in ('', 'YQ', 'YQ==\n', 'not base64!', 'été',
+                          SIGNATURE[:-2] + '=='):
+            self.round_trip(gct(signature=signature))
+
+    def test_unknown_user_and_hash(self):
+        recent = ledger.block_hash(ledger.GENESIS_HASH, ['x'])
+        known = self.round_trip(gct())
+        unknown = self.round_trip(gct(receiver=CAROL, recent=recent))
+        self.assertGreater(len(unknown), len(known) + len(CAROL) // 2)
+        self.round_trip(gct(receiver='not a key'))
+
+    def test_unknown_reference_is_rejected(self):
+        # ALICE and BOB are referred to by index
+        data = self.encoder.encode_line(gct())
+        with self.assertRaises(ValueError):
+            Codec().decode_line(data)
+
+    def test_text_lines(self):
+        for line in ('xyz\tfree text', 'gct\ttoo\tfew', '',
+                     'aut\t%s\textra' % CAROL, 'gct\té'):
+            data = self.round_trip(line)
+            self.assertEqual(data[0], TEXT_LINE)
+
+    def test_pct_request_and_block_forms(self):
+        request = '\t'.join(['pct', ALICE, BOB, '1700000000.25',
+                             ledger.GENESIS_HASH, '1', SIGNATURE])
+        block = '\t'.join(['pct', ALICE, '1700000000.25', BOB, '1',
+                           SIGNATURE])
+        self.assertNotEqual(self.round_trip(request)[0],
+                            self.round_trip(block)[0])
+
+    def test_aut_registers_user(self):
+        self.round_trip('aut\t' + CAROL)
+        self.assertEqual(self.decoder.users[-1], CAROL)
+        short = self.round_trip(gct(receiver=CAROL))
+        self.assertEqual(len(short), len(self.round_trip(gct())))
+
+
+class TestBlockchain(unittest.TestCase):
+
+    def test_round_trip(self):
+        text = make_blockchain([
+            ['aut\t' + ALICE, 'aut\t' + BOB],
+            [gct(), 'rut\t' + BOB],
+            ['cct\t%s\t1700000001\t%s\t%s\t%s\t%s\t3\t%s' % (
+                ALICE, ledger.GENESIS_HASH, ALICE, BOB, CAROL, SIGNATURE),
+             'note\tnot a transaction'],
+        ])
+        encoder = Codec()
+        data = encoder.encode_blockchain(text)
+        self.assertLess(len(data), len(text))
+        decoder = Codec()
+        self.assertEqual(decoder.decode_blockchain(data), text)
+        self.assertEqual(decoder.users, encoder.users)
+        self.assertEqual(decoder.blocks, encoder.blocks)
+
+    def test_empty(self):
+        self.assertEqual(Codec().decode_blockchain(
+            Codec().encode_blockchain('')), '')
+
+    def test_trailing_data(self):
+        data = Codec().encode_blockchain(make_blockchain([['x']]))
+        with self.assertRaises(ValueError):
+            Codec().decode_blockchain(data + b'\x00')
+
+
+if __name__ == '__main__':
+    unittest.main()
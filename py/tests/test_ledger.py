@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""Debts of a Ledger as blocks are applied, and its snapshots.
+
+Run from the repository root with python -m pytest py/tests.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import ledger  # noqa: E402
+from ledger import Ledger, SnapshotStore, debt_changes  # noqa: E402
+
+A, B, C = 'key-a', 'key-b', 'key-c'
+RECENT = ledger.GENESIS_HASH
+
+
+def gct(invoker: str, receiver: str, num: int) -> str:
+    """Give the line of a gct."""
+    return 'gct\t%s\t1\t%s\t%s\t%d\treason\tsig' % (invoker, receiver,
+                                                     RECENT, num)
+
+
+def rct(invoker: str, sender: str, num: int) -> str:
+    """Give the line of a rct."""
+    return 'rct\t%s\t1\t%s\t%s\t%d\ttype\tsig' % (invoker, sender, RECENT,
+                                                   num)
+
+
+def cct(start: str, mid: str, end: str, num: int) -> list:
+    """Give the lines of a cct, one per user."""
+    return ['cct\t%s\t1\t%s\t%s\t%s\t%s\t%d\tsig' % (user, RECENT, start,
+                                                     mid, end, num)
+            for user in (start, mid, end)]
+
+
+def pct(user_a: str, user_b: str, num: int) -> list:
+    """Give the lines of a pct, one per user."""
+    return ['pct\t%s\t1\t%s\t%d\tsig' % (user_a, user_b, num),
+            'pct\t%s\t1\t%s\t%d\tsig' % (user_b, user_a, num)]
+
+
+def apply(book: 'Ledger', lines: list) -> str:
+    """Apply a block of lines following the head of a ledger."""
+    curr_hash = ledger.block_hash(book.head, lines)
+    book.apply_block(book.head, curr_hash, lines)
+    return curr_hash
+
+
+def state(book: 'Ledger') -> tuple:
+    """Give everything a rejected block must leave unchanged."""
+    return (book.head, book.height, dict(book.debts()), book.users,
+            [book.balance(user) for user in (A, B, C)])
+
+
+class TestDebtChanges(unittest.TestCase):
+    """Deltas as in the Blockchain.DebtDelta view."""
+
+    def test_gct(self):
+        # invoker -> receiver, +num_cookies
+        self.assertEqual(debt_changes([gct(A, B, 2)]), ({(A, B): 2}, {}))
+
+    def test_rct(self):
+        # sender -> invoker, -num_cookies
+        self.assertEqual(debt_changes([rct(B, A, 2)]), ({(A, B): -2}, {}))
+
+    def test_cct(self):
+        # start -> mid and mid -> end, -num_cookies, start -> end, +num
+        self.assertEqual(debt_changes(cct(A, B, C, 3))[0],
+                         {(A, B): -3, (B, C): -3, (A, C): 3})
+
+    def test_pct(self):
+        # user_a -> user_b and user_b -> user_a, -num_cookies
+        self.assertEqual(debt_changes(pct(A, B, 1))[0],
+                         {(A, B): -1, (B, A): -1})
+
+    def test_users(self):
+        self.assertEqual(debt_changes(['aut\t' + A, 'rut\t' + B]),
+                         ({}, {A: True, B: False}))
+
+    def test_malformed_combined(self):
+        with self.assertRaises(ValueError):
+            debt_changes(cct(A, B, C, 3)[:2])
+        with self.assertRaises(ValueError):
+            debt_changes(pct(A, B, 1)[:1] + pct(A, B, 2)[1:])
+        with self.assertRaises(ValueError):
+            debt_changes(['xyz\t' + A])
+
+
+class TestLedger(unittest.TestCase):
+
+    def setUp(self):
+        self.book = Ledger()
+        apply(self.book, ['aut\t' + A, 'aut\t' + B, 'aut\t' + C])
+
+    def test_block_hash(self):
+        # Blockchain.generateCurrHash of the block committed after
+        # addAUT('YWxpY2U=') and addAUT('Ym9i') on an empty chain
+        self.assertEqual(
+            ledger.block_hash(ledger.GENESIS_HASH,
+                              ['aut\tYWxpY2U=', 'aut\tYm9i']),
+            'mNT+PytViBgzJFjet3LK45VE1e9xkXMCVFt9OzMNOQk=')
+
+    def test_debts(self):
+        apply(self.book, [gct(A, B, 3), gct(B, C, 2), rct(B, A, 1)])
+        self.assertEqual(dict(self.book.debts()), {(A, B): 2, (B, C): 2})
+        apply(self.book, cct(A, B, C, 2))
+        self.assertEqual(dict(self.book.debts()), {(A, C): 2})
+        self.assertEqual(self.book.balance(A), -2)
+        self.assertEqual(self.book.balance(B), 0)
+        self.assertEqual(self.book.balance(C), 2)
+        apply(self.book, [gct(C, A, 1)] + pct(A, C, 1))
+        self.assertEqual(dict(self.book.debts()), {(A, C): 1})
+        self.assertEqual(self.book.height, 4)
+
+    def test_order_within_block(self):
+        # The rct comes before the gct it cancels
+        apply(self.book, [rct(B, A, 1), gct(A, B, 1)])
+        self.assertEqual(len(self.book), 0)
+
+    def test_negative_debt_is_rejected(self):
+        apply(self.book, [gct(A, B, 1)])
+        before = state(self.book)
+        for lines in ([rct(B, A, 2)], cct(A, B, C, 1), pct(A, B, 1),
+                      [gct(B, C, 1), rct(B, A, 1), rct(A, C, 1)]):
+            curr_hash = ledger.block_hash(self.book.head, lines)
+            with self.assertRaises(ValueError):
+                self.book.apply_block(self.book.head, curr_hash, lines)
+            self.assertEqual(state(self.book), before)
+
+    def test_wrong_block_is_rejected(self):
+        before = state(self.book)
+        lines = [gct(A, B, 1)]
+        with self.assertRaises(ValueError):
+            self.book.apply_block(self.book.head, 'x' * 44, lines)
+        with self.assertRaises(ValueError):
+            self.book.apply_block(ledger.GENESIS_HASH,
+                                  ledger.block_hash(ledger.GENESIS_HASH,
+                                                    lines), lines)
+        self.assertEqual(state(self.book), before)
+
+    def test_apply_blockchain(self):
+        lines = [gct(A, B, 1)]
+        text = 'prev\t%s\n%s\nhead\t%s' % (
+            self.book.head, lines[0],
+            ledger.block_hash(self.book.head, lines))
+        self.assertEqual(self.book.apply_blockchain(text), 1)
+        self.assertEqual(self.book.debt(A, B), 1)
+        self.assertEqual(self.book.apply_blockchain(''), 0)
+
+    def test_dumps_loads(self):
+        apply(self.book, [gct(A, B, 3), gct(C, A, 1), 'rut\t' + C])
+        copy = Ledger.loads(self.book.dumps())
+        self.assertEqual(state(copy), state(self.book))
+        self.assertEqual(len(copy), len(self.book))
+        # The copy goes on from the same head
+        apply(copy, [rct(B, A, 3)])
+        self.assertEqual(copy.debt(A, B), 0)
+
+
+class TestSnapshotStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_empty(self):
+        self.assertIsNone(SnapshotStore(self.directory).latest())
+
+    def test_latest_and_keep(self):
+        store = SnapshotStore(self.directory, keep=2)
+        book = Ledger()
+        heads = []
+        for i in range(12):
+            heads.append(apply(book, [gct(A, B, 1)]))
+            store.save(book)
+        snapshots = store.snapshots()
+        self.assertEqual(len(snapshots), 2)
+        # Sorted by height, not by name
+        self.assertEqual([int(name.split('-', 1)[0]) for name in snapshots],
+                         [11, 12])
+        latest = store.latest()
+        self.assertEqual(latest.head, heads[-1])
+        self.assertEqual(latest.height, 12)
+        self.assertEqual(latest.debt(A, B), 12)
+        self.assertFalse([name for name in os.listdir(self.directory)
+                          if name.endswith('.tmp')])
+
+    def test_keep_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            SnapshotStore(self.directory, keep=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""Transactions stored in and rebuilt from a TransactionTable.
+
+Run from the repository root with python -m pytest py/tests.
+"""
+
+import os
+import sys
+import unittest
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..',
+                                'server'))
+
+from cookie import Cookier  # noqa: E402
+from transaction import (CollapseCookieTransaction,  # noqa: E402
+                         GiveCookieTransaction, ReceiveCookieTransaction,
+                         Transaction, TransactionTable)
+
+# Base64 as given by RSAUser.sign, stored as raw bytes
+SIGNATURE = 'c2lnbmF0dXJl\n'
+
+
+class TestTable(unittest.TestCase):
+
+    def setUp(self):
+        self.a = Cookier('key-a', 'alice')
+        self.b = Cookier('key-b', 'bob')
+        self.c = Cookier('key-c', 'carol')
+        self.table = TransactionTable()
+        self.transactions = [
+            GiveCookieTransaction('h1', self.a, self.b, 'lunch',
+                                  signature=SIGNATURE),
+            ReceiveCookieTransaction('h2', self.b, self.a, 'chocolate é'),
+            CollapseCookieTransaction('h1', self.a, self.b, self.c, 'oat',
+                                      signature='not base64'),
+            Transaction('xx', 'h3', '', [self.c, self.a], cookies=7,
+                        timestamp=datetime(2001, 2, 3, 4, 5, 6, 789),
+                        signature=''),
+        ]
+
+    def check(self, row: int, t: 'Transaction'):
+        copy = self.table[row]
+        self.assertIs(type(copy), type(t))
+        self.assertEqual(self.table.serialize(row), t.serialize())
+        self.assertEqual(copy.serialize(), t.serialize())
+        self.assertEqual(self.table.protocol(row), t._protocol)
+        self.assertEqual(self.table.signature(row), t.signature)
+        self.assertEqual(copy.signature, t.signature)
+        self.assertEqual(copy._timestamp, t._timestamp)
+        self.assertEqual(copy._cookiers, t._cookiers)
+
+    def test_append(self):
+        for row, t in enumerate(self.transactions):
+            self.assertEqual(self.table.append(t), row)
+        for row, t in enumerate(self.transactions):
+            self.check(row, t)
+
+    def test_extend(self):
+        self.table.append(self.transactions[0])
+        rows = self.table.extend(self.transactions)
+        self.assertEqual(rows, range(1, 5))
+        for row, t in zip(rows, self.transactions):
+            self.check(row, t)
+        self.assertEqual(self.table[-1].serialize(),
+                         self.transactions[-1].serialize())
+        with self.assertRaises(IndexError):
+            self.table[5]
+
+    def test_subclass_fields(self):
+        self.table.extend(self.transactions)
+        give, receive, collapse = (self.table[row] for row in range(3))
+        self.assertEqual((give.giver, give.receiver, give.reason),
+                         (self.a, self.b, 'lunch'))
+        self.assertEqual((receive.receiver, receive.giver,
+                          receive.cookie_type),
+                         (self.b, self.a, 'chocolate é'))
+        self.assertEqual(collapse.cookie_type, 'oat')
+        # A rebuilt transaction can be changed like any other
+        give.reason = 'dinner'
+        self.assertIn(b'dinner', give.serialize())
+        self.assertIn(b'lunch', self.table.serialize(0))
+
+    def test_shared_cookiers(self):
+        self.table.extend(self.transactions)
+        self.assertEqual(len(self.table.cookiers), 3)
+        self.assertIs(self.table[0]._cookiers[0], self.table[2]._cookiers[0])
+        self.assertEqual(self.table.users(2), [0, 1, 2])
+        self.assertEqual(self.table.rows_of(self.c), [2, 3])
+        self.assertEqual(self.table.rows_of(self.c, 3), [3])
+
+    def test_aware_timestamp_is_rejected(self):
+        t = self.transactions[0]
+        t._timestamp = datetime.now(timezone.utc)
+        with self.assertRaises(ValueError):
+            self.table.append(t)
+        self.assertEqual(len(self.table), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
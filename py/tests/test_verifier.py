@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""Audit of a small signed chain by the ChainVerifier, with checkpoints.
+
+Run from the repository root with python -m pytest py/tests.
+"""
+
+import io
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..',
+                                'server'))
+
+import encryption  # noqa: E402
+import ledger  # noqa: E402
+from verifier import ChainVerifier, read_blockchain  # noqa: E402
+from verifier import ttime_forms, verify_line  # noqa: E402
+
+
+def make_chain(user: 'encryption.RSAUser', count: int,
+               prev_hash: str = ledger.GENESIS_HASH) -> list:
+    """Build count blocks of two gct lines signed by user."""
+    pubk = user.pubkey.strip()
+    blocks = []
+    for i in range(count):
+        lines = []
+        for j in range(2):
+            # Signed with fewer decimals than the block holds
+            message = 'gct\t%s\t17000000%02d.%d\treceiver\t%s\t1\tn%d' % (
+                pubk, i, j + 1, prev_hash, i)
+            signature = user.sign(message).strip()
+            fields = message.split('\t')
+            fields[2] += '00000'
+            lines.append('\t'.join(fields + [signature]))
+        curr_hash = ledger.block_hash(prev_hash, lines)
+        blocks.append((prev_hash, curr_hash, lines))
+        prev_hash = curr_hash
+    return blocks
+
+
+@unittest.skipUnless(encryption.PYCRYPTO_INSTALLED, 'needs pycryptodome')
+class TestVerify(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.user = encryption.RSAUser()
+        key = encryption.RSA.generate(encryption.RSAUser.keylen)
+        cls.user.set_keys(key.publickey(), key)
+        cls.chain = make_chain(cls.user, 4)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.checkpoint = os.path.join(self.directory, 'audit.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def verifier(self, workers: int = 0) -> 'ChainVerifier':
+        return ChainVerifier(self.checkpoint, workers=workers, chunksize=3)
+
+    def saved(self) -> dict:
+        with open(self.checkpoint) as f:
+            return json.load(f)
+
+    def test_whole_chain(self):
+        report = self.verifier().verify(self.chain)
+        self.assertEqual(report['failures'], [])
+        self.assertEqual((report['blocks'], report['transactions'],
+                          report['signatures']), (4, 8, 8))
+        self.assertEqual(report['head'], self.chain[-1][1])
+        self.assertEqual(self.saved(), {'head': self.chain[-1][1],
+                                        'height': 4, 'transactions': 8})
+
+    def test_worker_processes(self):
+        report = self.verifier(workers=2).verify(self.chain)
+        self.assertEqual(report['failures'], [])
+        self.assertEqual(report['height'], 4)
+
+    def test_bad_signature_stops_checkpoint(self):
+        chain = list(self.chain)
+        prev_hash, _, lines = chain[2]
+        # The signature of the other line
+        lines = [lines[0], lines[1].rpartition('\t')[0] + '\t' +
+                 lines[0].rpartition('\t')[2]]
+        for height in (2, 3):
+            chain[height] = (prev_hash, ledger.block_hash(prev_hash, lines),
+                             lines)
+            prev_hash, lines = chain[height][1], self.chain[3][2]
+        report = self.verifier().verify(chain)
+        self.assertEqual([(f['height'], f['reason'], f['line'])
+                          for f in report['failures']],
+                         [(3, 'bad signature', 1)])
+        # The last block is sound but follows the failed one
+        self.assertEqual(report['blocks'], 4)
+        self.assertEqual(report['height'], 2)
+        self.assertEqual(self.saved()['head'], self.chain[1][1])
+
+    def test_hash_mismatch_stops(self):
+        chain = list(self.chain)
+        prev_hash, curr_hash, lines = chain[1]
+        chain[1] = (prev_hash, curr_hash, lines[:1])
+        report = self.verifier().verify(chain)
+        self.assertEqual([(f['height'], f['reason'])
+                          for f in report['failures']],
+                         [(2, 'block hash does not match its text')])
+        self.assertEqual((report['blocks'], report['height']), (1, 1))
+        self.assertEqual(self.saved()['height'], 1)
+
+    def test_resume_covers_new_blocks(self):
+        # From the genesis block, then from the last verified block
+        for blocks in (self.chain, self.chain[2:]):
+            if os.path.exists(self.checkpoint):
+                os.remove(self.checkpoint)
+            self.verifier().verify(self.chain[:2])
+            verifier = self.verifier()
+            self.assertEqual(verifier.height, 2)
+            report = verifier.verify(blocks)
+            self.assertEqual(report['failures'], [])
+            self.assertEqual((report['start_height'], report['blocks'],
+                              report['signatures'], report['height']),
+                             (2, 2, 4, 4))
+
+    def test_up_to_date(self):
+        self.verifier().verify(self.chain)
+        for blocks in (self.chain, []):
+            report = self.verifier().verify(blocks)
+            self.assertEqual(report['failures'], [])
+            self.assertEqual((report['blocks'], report['height']), (0, 4))
+
+    def test_head_not_in_blocks(self):
+        self.verifier().verify(self.chain[:2])
+        other = make_chain(self.user, 2, prev_hash='x' * 43 + '=')
+        report = self.verifier().verify(other)
+        self.assertEqual([(f['height'], f['hash'], f['reason'])
+                          for f in report['failures']],
+                         [(2, self.chain[1][1],
+                           'last verified block not in the blocks')])
+        self.assertEqual((report['blocks'], report['height']), (0, 2))
+
+    def test_not_from_genesis(self):
+        report = self.verifier().verify(self.chain[1:])
+        self.assertEqual(len(report['failures']), 1)
+        self.assertEqual(report['height'], 0)
+
+    def test_read_blockchain(self):
+        text = '\n'.join(['\n'.join(['prev\t' + prev_hash] + lines)
+                          for prev_hash, _, lines in self.chain] +
+                         ['head\t' + self.chain[-1][1]])
+        self.assertEqual(list(read_blockchain(io.StringIO(text + '\n'))),
+                         self.chain)
+        with self.assertRaises(ValueError):
+            list(read_blockchain(io.StringIO(text.rpartition('\n')[0])))
+
+    def test_verify_line(self):
+        self.assertTrue(verify_line(self.chain[0][2][0]))
+        self.assertFalse(verify_line('gct\ttoo\tfew'))
+        self.assertFalse(verify_line('pct\ta\t1\tb\t1\tsig'))
+        self.assertFalse(verify_line(
+            'gct\tnot a key\t1\tb\th\t1\treason\tsig'))
+
+
+class TestTtimeForms(unittest.TestCase):
+
+    def test_forms(self):
+        self.assertEqual(ttime_forms('1700000000.500000'),
+                         ['1700000000.5', '1700000000.50', '1700000000.500',
+                          '1700000000.5000', '1700000000.50000',
+                          '1700000000.500000'])
+        self.assertEqual(ttime_forms('1700000000.000000'),
+                         ['1700000000', '1700000000.0', '1700000000.00',
+                          '1700000000.000', '1700000000.0000',
+                          '1700000000.00000', '1700000000.000000'])
+        self.assertEqual(ttime_forms('1700000000.123456'),
+                         ['1700000000.123456'])
+        self.assertEqual(ttime_forms('1700000000'), ['1700000000'])
+
+
+if __name__ == '__main__':
+    unittest.main()
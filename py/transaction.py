@@ -1,15 +1,29 @@
 """All types of transactions in MoCookie."""
 
-from person import Cookier
-from datetime import datetime
+import binascii
+from array import array
+from cookie import Cookier
+from datetime import datetime, timedelta
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
 
 
 class Transaction():
     """Generic Transaction class."""
 
+    __slots__ = ('_protocol', '_recent_block', '_content', '_cookiers',
+                 '_cookies', '_timestamp', '_signature', '_serialized',
+                 '_pubk_changes')
+
+    # Number of changes of any transaction after its construction, for the
+    # caches holding serialized transactions
+    changes = 0
+
     def __init__(self, protocol: str, recent_block: str, content: str,
-                 cookiers: list, cookies: int,
-                 timestamp=datetime.now(): 'datetime.datetime'):
+                 cookiers: list, cookies: int = 1,
+                 timestamp: 'datetime.datetime' = None,
+                 signature: str = None):
         """Constructor.
 
         Keyword arguments:
@@ -17,15 +31,19 @@ class Transaction():
         recent_block -- the hash of a recent block as a string.
         content -- body of the transaction. Limit: 100 characters.
         cookiers -- list of cookiers involved in the transaction. Limit: 2-3.
-        cookies -- number of cookies involved
+        cookies -- number of cookies involved. Default to 1
         timestamp -- timestamp of the transaction. Default to datetime.now()
+        signature -- str(self) signed by the first cookier, in base64
         """
         self._protocol = protocol
         self._recent_block = recent_block
         self._content = content  # 100 characters limit
         self._cookiers = cookiers  # 2-3 length limit
         self._cookies = cookies
-        self._timestamp = str(timestamp)
+        self._timestamp = timestamp or datetime.now()
+        self._signature = signature
+        self._serialized = None
+        self._pubk_changes = None
         self.validate()
 
     def __str__(self) -> str:
@@ -35,12 +53,66 @@ class Transaction():
         protocol|recent_block|content|pubk1,pubk2...,pubkn|cookies|timestamp
 
         """
-        pubks = [i.pubk for i in self._cookiers]
-        return '%s|%s|%s|%s' % (self._protocol,
-                                self._recent_block,
-                                ','.join(pubks),
-                                self._content,
-                                self._timestamp)
+        return str(self.serialize(), 'utf-8')
+
+    def serialize(self) -> bytes:
+        """Give the utf-8 encoded string representation of the transaction.
+
+        The result is cached until the transaction or the public key of
+        a cookier is modified.
+
+        Returns:
+        The string representation as bytes
+
+        """
+        if self._serialized is None or \
+                self._pubk_changes != Cookier.pubk_changes:
+            pubks = [i.pubk for i in self._cookiers]
+            plaintext = '%s|%s|%s|%s|%s|%s' % (self._protocol,
+                                               self._recent_block,
+                                               self._content,
+                                               ','.join(pubks),
+                                               self._cookies,
+                                               str(self._timestamp))
+            self._serialized = bytes(plaintext, 'utf-8')
+            self._pubk_changes = Cookier.pubk_changes
+        return self._serialized
+
+    def _changed(self):
+        """Drop the cached string, called by the setters."""
+        self._serialized = None
+        Transaction.changes += 1
+
+    @property
+    def signature(self) -> str:
+        """Get the signature."""
+        return self._signature
+
+    @signature.setter
+    def signature(self, signature: str):
+        """Set the signature.
+
+        Keyword arguments:
+        signature -- str(self) signed by the first cookier, in base64
+        """
+        if not isinstance(signature, str):
+            raise TypeError('signature must be of type str.')
+        self._signature = signature
+
+    def signed_message(self) -> tuple:
+        """Give the arguments needed to check the signature.
+
+        Returns:
+        (message, signature, pubkey) as accepted by encryption.RSA_verify
+
+        """
+        return (str(self), self._signature, self._cookiers[0].pubk)
+
+    def verify(self) -> bool:
+        """Verify the signature against the first cookier's public key."""
+        if not self._signature:
+            return False
+        return self._cookiers[0].verify(str(self), self._signature)
 
     def validate(self):
         """Validate the transaction at a basic level."""
@@ -70,7 +142,7 @@ class Transaction():
         if self._cookies > 99:
             err_msg = 'Each transaction can only involve up to 10 cookies.'
             raise ValueError(err_msg)
-        if datetime.now() - self._timestamp < 0:
+        if self._timestamp > datetime.now():
             raise ValueError('Incorrect transaction timestamp')
         try:
             self.validate_further()
@@ -89,8 +161,10 @@ class Transaction():
 class GiveCookieTransaction(Transaction):
     """A gives B a crypto cookie."""
 
+    __slots__ = ()
+
     def __init__(self, recent_block: str, giver: 'Cookier',
-                 receiver: 'Cookier', reason: str):
+                 receiver: 'Cookier', reason: str, signature: str = None):
         """Constructor.
 
         Keyword arguments:
@@ -98,9 +172,11 @@ class GiveCookieTransaction(Transaction):
         giver -- a Cookier object
         receiver -- a Cookier object
         reason -- a string of 100 characters limit
+        signature -- str(self) signed by the giver, in base64
         """
         # Initialize super class
-        super().__init__('gc', recent_block, reason, [giver, receiver])
+        super().__init__('gc', recent_block, reason, [giver, receiver],
+                         signature=signature)
 
     @property
     def reason(self) -> str:
@@ -113,6 +189,7 @@ class GiveCookieTransaction(Transaction):
         if len(reason) > 100:
             raise ValueError('reason cannot be more than 100 characters.')
         self._content = reason
+        self._changed()
 
     @property
     def giver(self) -> 'Cookier':
@@ -125,6 +202,7 @@ class GiveCookieTransaction(Transaction):
         if not isinstance(giver, Cookier):
             raise TypeError('giver must be of type Cookier.')
         self._cookiers[0] = giver
+        self._changed()
 
     @property
     def receiver(self) -> 'Cookier':
@@ -137,6 +215,7 @@ class GiveCookieTransaction(Transaction):
         if not isinstance(receiver, Cookier):
             raise TypeError('receiver must be of type Cookier.')
         self._cookiers[1] = receiver
+        self._changed()
 
     def action(self):
         """Recalculate A, B and C's cookie wallets."""
@@ -147,8 +226,11 @@ class GiveCookieTransaction(Transaction):
 class ReceiveCookieTransaction(Transaction):
     """A receive a real cookie from B."""
 
+    __slots__ = ()
+
     def __init__(self, recent_block: str, receiver: 'Cookier',
-                 giver: 'Cookier', cookie_type: str):
+                 giver: 'Cookier', cookie_type: str,
+                 signature: str = None):
         """Constructor.
 
         Keyword arguments:
@@ -156,8 +238,10 @@ class ReceiveCookieTransaction(Transaction):
         receiver -- a Cookier object
         giver -- a Cookier object
         cookie_type -- a string of 100 characters limit
+        signature -- str(self) signed by the receiver, in base64
         """
-        super().__init__('rc', recent_block, cookie_type, [receiver, giver])
+        super().__init__('rc', recent_block, cookie_type, [receiver, giver],
+                         signature=signature)
 
     @property
     def cookie_type(self) -> str:
@@ -170,6 +254,7 @@ class ReceiveCookieTransaction(Transaction):
         if len(cookie_type) > 100:
             raise ValueError('cookie_type cannot be more than 100 characters.')
         self._content = cookie_type
+        self._changed()
 
     @property
     def receiver(self) -> 'Cookier':
@@ -182,6 +267,7 @@ class ReceiveCookieTransaction(Transaction):
         if not isinstance(receiver, Cookier):
             raise TypeError('receiver must be of type Cookier.')
         self._cookiers[0] = receiver
+        self._changed()
 
     @property
     def giver(self) -> 'Cookier':
@@ -194,6 +280,7 @@ class ReceiveCookieTransaction(Transaction):
         if not isinstance(giver, Cookier):
             raise TypeError('giver must be of type Cookier.')
         self._cookiers[1] = giver
+        self._changed()
 
     def action(self):
         """Recalculate A, B and C's cookie wallets."""
@@ -204,8 +291,11 @@ class ReceiveCookieTransaction(Transaction):
 class CollapseCookieTransaction(Transaction):
     """A owes B owes C a cookie then A gives C a cookie."""
 
-    def __init__(self, recent_block: str, giver: 'Cookier', middler: 'Cookier'
-                 receiver: 'Cookier', cookie_type: str):
+    __slots__ = ()
+
+    def __init__(self, recent_block: str, giver: 'Cookier', middler: 'Cookier',
+                 receiver: 'Cookier', cookie_type: str,
+                 signature: str = None):
         """Constructor.
 
         Keyword arguments:
@@ -213,9 +303,10 @@ class CollapseCookieTransaction(Transaction):
         giver -- a Cookier object
         receiver -- a Cookier object
         cookie_type -- a string of 100 characters limit
+        signature -- str(self) signed by the giver, in base64
         """
         super().__init__('cc', recent_block, cookie_type,
-                         [giver, middler, receiver])
+                         [giver, middler, receiver], signature=signature)
 
     @property
     def cookie_type(self) -> str:
@@ -232,6 +323,7 @@ class CollapseCookieTransaction(Transaction):
         if len(cookie_type) > 100:
             raise ValueError('cookie_type cannot be more than 100 characters.')
         self._content = cookie_type
+        self._changed()
 
     @property
     def giver(self) -> 'Cookier':
@@ -244,6 +336,7 @@ class CollapseCookieTransaction(Transaction):
         if not isinstance(giver, Cookier):
             raise TypeError('giver must be of type Cookier.')
         self._cookiers[0] = giver
+        self._changed()
 
     @property
     def receiver(self) -> 'Cookier':
@@ -256,8 +349,216 @@ class CollapseCookieTransaction(Transaction):
         if not isinstance(receiver, Cookier):
             raise TypeError('receiver must be of type Cookier.')
         self._cookiers[1] = receiver
+        self._changed()
 
     def action(self):
         """Recalculate A, B and C's cookie wallets."""
         self._cookiers[0].wallet += 1
         self._cookiers[2].wallet -= 1
+
+
+class TransactionTable():
+    """Columnar store of committed transactions.
+
+    Each row is a transaction, stored across arrays instead of as an
+    object: a protocol code, up to three user indices, the number of
+    cookies and the timestamp in microseconds since the epoch. Users,
+    recent block hashes and protocols are interned, content and signature
+    are utf-8 in a shared buffer, except base64 signatures as produced by
+    RSAUser.sign which are stored as raw bytes. Blocks refer to their
+    transactions as a range of rows, see blockchain.Block.use_table().
+    """
+
+    # Third user index of a transaction between two cookiers
+    no_user = 0xffffffff
+    # Set in the protocol code if the transaction is signed
+    signed_flag = 0x80
+    # Set in the protocol code if the signature is stored as raw bytes
+    raw_flag = 0x40
+
+    def __init__(self):
+        """Constructor."""
+        self.__codes = array('B')
+        self.__users = array('I')
+        self.__cookies = array('i')
+        self.__timestamps = array('q')
+        self.__blocks = array('I')
+        # Content then signature of each row, ends in string_ends
+        self.__strings = bytearray()
+        self.__string_ends = array('Q')
+        # Interned values
+        self.__kinds = []
+        self.__kind_index = {}
+        self.__cookiers = []
+        self.__cookier_index = {}
+        self.__block_hashes = []
+        self.__block_index = {}
+
+    def __len__(self) -> int:
+        """Get the number of rows."""
+        return len(self.__codes)
+
+    @property
+    def cookiers(self) -> list:
+        """Get the cookier of each user index."""
+        return self.__cookiers
+
+    @property
+    def cookies(self) -> 'array':
+        """Get the number of cookies of each row."""
+        return self.__cookies
+
+    @property
+    def timestamps(self) -> 'array':
+        """Get the timestamp of each row in microseconds since the epoch."""
+        return self.__timestamps
+
+    def __intern(self, values: list, index: dict, key, value) -> int:
+        """Get the index of an interned value, adding it if needed."""
+        i = index.get(key)
+        if i is None:
+            i = index[key] = len(values)
+            values.append(value)
+        return i
+
+    def append(self, t: 'Transaction') -> int:
+        """Append a transaction.
+
+        Keyword arguments:
+        t -- transaction, any subclass of Transaction
+
+        Returns:
+        The row of the transaction
+
+        """
+        if not isinstance(t, Transaction):
+            raise TypeError('append(t): t must be a subclass of Transaction.')
+        if t._timestamp.tzinfo is not None:
+            raise ValueError('append(t): t must have a naive timestamp.')
+        code = self.__intern(self.__kinds, self.__kind_index,
+                             (type(t), t._protocol), (type(t), t._protocol))
+        if code >= TransactionTable.raw_flag:
+            raise ValueError('too many kinds of transactions.')
+        users = [self.__intern(self.__cookiers, self.__cookier_index,
+                               (c.pubk, c.name), c) for c in t._cookiers]
+        users += [TransactionTable.no_user] * (3 - len(users))
+        signature = bytes(t._signature or '', 'utf-8')
+        if t._signature is not None:
+            code |= TransactionTable.signed_flag
+            try:
+                raw = binascii.a2b_base64(signature)
+            except binascii.Error:
+                raw = None
+            if raw is not None and binascii.b2a_base64(raw) == signature:
+                code |= TransactionTable.raw_flag
+                signature = raw
+        self.__codes.append(code)
+        self.__users.extend(users)
+        self.__cookies.append(t._cookies)
+        self.__timestamps.append((t._timestamp - EPOCH) // MICROSECOND)
+        self.__blocks.append(self.__intern(
+            self.__block_hashes, self.__block_index, t._recent_block,
+            t._recent_block))
+        self.__strings += bytes(t._content, 'utf-8')
+        self.__string_ends.append(len(self.__strings))
+        self.__strings += signature
+        self.__string_ends.append(len(self.__strings))
+        return len(self.__codes) - 1
+
+    def extend(self, transactions: list) -> range:
+        """Append transactions.
+
+        Returns:
+        The range of their rows
+
+        """
+        start = len(self.__codes)
+        for t in transactions:
+            self.append(t)
+        return range(start, len(self.__codes))
+
+    def __string(self, i: int) -> bytes:
+        """Get the i-th string of the shared buffer."""
+        start = self.__string_ends[i - 1] if i else 0
+        return bytes(self.__strings[start:self.__string_ends[i]])
+
+    def __kind(self, row: int) -> tuple:
+        """Get the (class, protocol) of a row."""
+        return self.__kinds[self.__codes[row] & (TransactionTable.raw_flag -
+                                                 1)]
+
+    def protocol(self, row: int) -> str:
+        """Get the protocol of a row."""
+        return self.__kind(row)[1]
+
+    def signature(self, row: int) -> str:
+        """Get the signature of a row, None if it is not signed."""
+        code = self.__codes[row]
+        if not code & TransactionTable.signed_flag:
+            return None
+        signature = self.__string(2 * row + 1)
+        if code & TransactionTable.raw_flag:
+            signature = binascii.b2a_base64(signature)
+        return str(signature, 'utf-8')
+
+    def users(self, row: int) -> list:
+        """Get the user indices of a row."""
+        return [u for u in self.__users[3 * row:3 * row + 3]
+                if u != TransactionTable.no_user]
+
+    def serialize(self, row: int) -> bytes:
+        """Give the same bytes as Transaction.serialize() for a row."""
+        pubks = [self.__cookiers[u].pubk for u in self.users(row)]
+        plaintext = '%s|%s|%s|%s|%s|%s' % (
+            self.protocol(row),
+            self.__block_hashes[self.__blocks[row]],
+            str(self.__string(2 * row), 'utf-8'),
+            ','.join(pubks),
+            self.__cookies[row],
+            EPOCH + self.__timestamps[row] * MICROSECOND)
+        return bytes(plaintext, 'utf-8')
+
+    def __getitem__(self, row: int) -> 'Transaction':
+        """Rebuild the transaction of a row.
+
+        The transaction shares its cookiers with the table.
+        """
+        if not -len(self.__codes) <= row < len(self.__codes):
+            raise IndexError('row out of range.')
+        row %= len(self.__codes)
+        cls, protocol = self.__kind(row)
+        t = cls.__new__(cls)
+        t._protocol = protocol
+        t._recent_block = self.__block_hashes[self.__blocks[row]]
+        t._content = str(self.__string(2 * row), 'utf-8')
+        t._cookiers = [self.__cookiers[u] for u in self.users(row)]
+        t._cookies = self.__cookies[row]
+        t._timestamp = EPOCH + self.__timestamps[row] * MICROSECOND
+        t._signature = self.signature(row)
+        t._serialized = None
+        t._pubk_changes = None
+        return t
+
+    def rows_of(self, cookier: 'Cookier', start: int = 0,
+                stop: int = None) -> list:
+        """Find the rows in [start, stop) involving a cookier.
+
+        Returns:
+        The rows in increasing order
+
+        """
+        user = self.__cookier_index.get((cookier.pubk, cookier.name))
+        if user is None:
+            return []
+        if stop is None:
+            stop = len(self.__codes)
+        rows = []
+        pos = 3 * max(start, 0)
+        end = 3 * min(stop, len(self.__codes))
+        while True:
+            try:
+                pos = self.__users.index(user, pos, end)
+            except ValueError:
+                return rows
+            rows.append(pos // 3)
+            pos = pos // 3 * 3 + 3
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""Audit the blockchain served by the server.
+
+Blocks are read as a stream, in chain order, and their hash linkage is
+checked in the calling process as Blockchain.generateCurrHash computes it.
+The signatures of their transactions are sent in chunks to a pool of
+processes, so they are checked on every core while the next blocks are
+read. A checkpoint file keeps the last block whose hash and signatures
+were all verified, and a later audit skips the blocks up to it:
+
+    PYTHONPATH=server python py/verifier.py chain.txt \\
+        --checkpoint audit.json
+
+A pct line of a block does not hold the recent_hash its invoker signed,
+so its signature cannot be checked and it is only counted.
+"""
+
+import os
+import json
+import time
+import argparse
+import collections
+import concurrent.futures
+
+import encryption
+import ledger
+import blocklog
+
+GENESIS_HASH = ledger.GENESIS_HASH
+
+# Protocols whose block line is the signed request followed by its
+# signature, with the invoker then ttime as first fields
+SIGNED_SIZES = {'gct': 8, 'rct': 8, 'cct': 9}
+
+
+def read_blockchain(f):
+    """Stream the blocks of a gbc response.
+
+    Keyword arguments:
+    f -- a text file holding the result of Blockchain.getBlockchain
+
+    Yields:
+    (prev_hash, curr_hash, lines) as in ledger.parse_blockchain
+
+    """
+    prev_hash = None
+    lines = []
+    for line in f:
+        line = line.rstrip('\n')
+        if line.startswith('prev\t') or line.startswith('head\t'):
+            if prev_hash is not None:
+                yield prev_hash, line[5:], lines
+            prev_hash = line[5:] if line.startswith('prev\t') else None
+            lines = []
+        elif line:
+            if prev_hash is None:
+                raise ValueError('transaction outside of a block.')
+            lines.append(line)
+    if prev_hash is not None:
+        raise ValueError('missing head hash.')
+
+
+def ttime_forms(ttime: str) -> list:
+    """Get the ways a ttime may have been written when it was signed.
+
+    The block gives the epoch of the stored timestamp with six decimals,
+    while the invoker may have signed it with fewer.
+    """
+    forms = []
+    whole, point, fraction = ttime.partition('.')
+    if point:
+        stripped = fraction.rstrip('0')
+        forms.append(whole + '.' + stripped if stripped else whole)
+        for digits in range(max(len(stripped), 1), len(fraction) + 1):
+            if digits > len(stripped):
+                forms.append(whole + '.' + fraction[:digits])
+    if ttime not in forms:
+        forms.append(ttime)
+    return forms
+
+
+def verify_line(line: str) -> bool:
+    """Check the signature of a gct, rct or cct line of a block."""
+    fields = line.split('\t')
+    if len(fields) != SIGNED_SIZES.get(fields[0]):
+        return False
+    pubkey = fields[1]
+    signature = fields[-1]
+    for ttime in ttime_forms(fields[2]):
+        message = '\t'.join(fields[:2] + [ttime] + fields[3:-1])
+        try:
+            if encryption.RSA_verify(message, signature, pubkey):
+                return True
+        except (ValueError, TypeError, IndexError):
+            # Malformed key or signature, or a signature that does not match
+            pass
+    return False
+
+
+def verify_chunk(chunk: list) -> list:
+    """Check the signatures of a chunk of lines in a pool process.
+
+    Keyword arguments:
+    chunk -- list of (reference, line)
+
+    Returns:
+    The references of the lines whose signature is wrong
+
+    """
+    return [ref for ref, line in chunk if not verify_line(line)]
+
+
+class ChainVerifier():
+    """Verify blocks in chain order, from a checkpoint if there is one."""
+
+    # Number of blocks between two checkpoint writes
+    checkpoint_interval = 1000
+
+    def __init__(self, checkpoint: str = None, workers: int = None,
+                 chunksize: int = 256):
+        """Constructor.
+
+        Keyword arguments:
+        checkpoint -- path of the checkpoint file, None to start from the
+          genesis block every time
+        workers -- number of processes checking signatures, default to
+          the number of cores, 0 to check them in the calling process
+        chunksize -- number of lines sent to a process at once
+        """
+        if not encryption.PYCRYPTO_INSTALLED:
+            raise ImportError('Module pycrypto not installed.')
+        self.__checkpoint = checkpoint
+        self.__workers = os.cpu_count() if workers is None else workers
+        self.__chunksize = chunksize
+        self.__head = GENESIS_HASH
+        self.__height = 0
+        self.__transactions = 0
+        if checkpoint is not None and os.path.exists(checkpoint):
+            with open(checkpoint) as f:
+                state = json.load(f)
+            self.__head = state['head']
+            self.__height = state['height']
+            self.__transactions = state['transactions']
+
+    @property
+    def head(self) -> str:
+        """Get the hash of the last verified block."""
+        return self.__head
+
+    @property
+    def height(self) -> int:
+        """Get the height of the last verified block."""
+        return self.__height
+
+    def save_checkpoint(self):
+        """Write the last verified block to the checkpoint file."""
+        if self.__checkpoint is None:
+            return
+        with open(self.__checkpoint + '.tmp', 'w') as f:
+            json.dump({'head': self.__head, 'height': self.__height,
+                       'transactions': self.__transactions}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.__checkpoint + '.tmp', self.__checkpoint)
+
+    def verify(self, blocks) -> dict:
+        """Verify the blocks following the last verified block.
+
+        Blocks up to the last verified block are skipped, so blocks may
+        be given from the genesis block or from the last verified one.
+        If blocks are given but none is or follows the last verified
+        block, nothing is verified and a failure is reported.
+        Verification stops at the first block that does not follow the
+        previous one or whose hash does not match its text. The last
+        verified block only moves past blocks without any failure.
+
+        Keyword arguments:
+        blocks -- iterable of (prev_hash, curr_hash, lines) in chain order
+
+        Returns:
+        The report of the audit
+
+        """
+        start = time.perf_counter()
+        report = {'start_height': self.__height, 'blocks': 0,
+                  'transactions': 0, 'signatures': 0, 'unverifiable': 0,
+                  'failures': []}
+        failed_height = None
+        # Blocks waiting for their signatures: (height, hash, lines in the
+        # block, number of chunks that must be done)
+        waiting = collections.deque()
+        # Chunks sent to the pool, in order
+        pending = collections.deque()
+        chunk = []
+        done = 0
+        sent = 0
+
+        executor = None
+        if self.__workers:
+            executor = concurrent.futures.ProcessPoolExecutor(self.__workers)
+
+        def send():
+            nonlocal chunk, sent
+            if executor is None:
+                pending.append(verify_chunk(chunk))
+            else:
+                pending.append(executor.submit(verify_chunk, chunk))
+            chunk = []
+            sent += 1
+
+        def collect():
+            nonlocal done, failed_height
+            result = pending.popleft()
+            if executor is not None:
+                result = result.result()
+            done += 1
+            for height, block_hash, index, line in result:
+                report['failures'].append({
+                    'height': height, 'hash': block_hash, 'line': index,
+                    'reason': 'bad signature', 'transaction': line})
+                if failed_height is None or height < failed_height:
+                    failed_height = height
+            advance()
+
+        def advance():
+            verified = None
+            while waiting and waiting[0][3] <= done:
+                height, block_hash, lines, _ = waiting.popleft()
+                if failed_height is not None and height >= failed_height:
+                    continue
+                self.__height = height
+                self.__head = block_hash
+                self.__transactions += lines
+                verified = height
+            if verified is not None and \
+                    verified % ChainVerifier.checkpoint_interval == 0:
+                self.save_checkpoint()
+
+        try:
+            following = False
+            # Blocks skipped, and whether one of them is the last verified
+            skipped = 0
+            head_found = False
+            head = self.__head
+            height = self.__height
+            for prev_hash, curr_hash, lines in blocks:
+                if not following:
+                    # Skip the blocks up to the last verified one
+                    head_found = head_found or curr_hash == head
+                    if prev_hash != head:
+                        skipped += 1
+                        continue
+                    following = True
+                height += 1
+                if prev_hash != head:
+                    failure = 'block does not follow the previous block'
+                elif ledger.block_hash(prev_hash, lines) != curr_hash:
+                    failure = 'block hash does not match its text'
+                else:
+                    failure = None
+                if failure is not None:
+                    report['failures'].append({
+                        'height': height, 'hash': curr_hash,
+                        'reason': failure})
+                    if failed_height is None or height < failed_height:
+                        failed_height = height
+                    break
+                for index, line in enumerate(lines):
+                    protocol = line.split('\t', 1)[0]
+                    if protocol in SIGNED_SIZES:
+                        chunk.append(((height, curr_hash, index, line), line))
+                        report['signatures'] += 1
+                        if len(chunk) >= self.__chunksize:
+                            send()
+                    elif protocol == 'pct':
+                        report['unverifiable'] += 1
+                # The block is done once the chunk holding its last line is
+                needed = sent + 1 if chunk else sent
+                waiting.append((height, curr_hash, len(lines), needed))
+                report['blocks'] += 1
+                report['transactions'] += len(lines)
+                head = curr_hash
+                # Bound the chunks in flight, and so the memory in use
+                while len(pending) > 2 * max(self.__workers, 1):
+                    collect()
+                advance()
+            if skipped and not following and not head_found:
+                report['failures'].append({
+                    'height': height, 'hash': head,
+                    'reason': 'last verified block not in the blocks'})
+            if chunk:
+                send()
+            while pending:
+                collect()
+            advance()
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+        self.save_checkpoint()
+        report['failures'].sort(key=lambda f: (f['height'], f.get('line', -1)))
+        report['head'] = self.__head
+        report['height'] = self.__height
+        report['elapsed_s'] = time.perf_counter() - start
+        return report
+
+
+def main():
+    """Audit a gbc response or a block log from the command line."""
+    parser = argparse.ArgumentParser(description='MoCookie chain verifier.')
+    parser.add_argument('chain', help='file holding a gbc response, or a '
+                                      'block log with --log')
+    parser.add_argument('--log', action='store_true',
+                        help='read the blocks from a BlockLog')
+    parser.add_argument('--checkpoint', help='checkpoint file')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunksize', type=int, default=256)
+    args = parser.parse_args()
+
+    verifier = ChainVerifier(args.checkpoint, args.workers, args.chunksize)
+    if args.log:
+        with blocklog.BlockLog(args.chain) as log:
+            start = log.find(verifier.head)
+            report = verifier.verify(log.blocks(start + 1 if start else 1))
+    else:
+        with open(args.chain) as f:
+            report = verifier.verify(read_blockchain(f))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,13 @@
 """Encryption related classes."""
 
 import os
+import time
+import struct
 import binascii
+import threading
+from collections import OrderedDict
+
+import metrics
 
 # Globals
 PYCRYPTO_INSTALLED = False
@@ -11,6 +17,7 @@ PYCRYPTO_INSTALLED = False
 try:
     from Crypto.PublicKey import RSA
     from Crypto.Cipher import PKCS1_OAEP
+    from Crypto.Cipher import AES
     from Crypto.Signature import PKCS1_PSS
     from Crypto.Hash import SHA512
     PYCRYPTO_INSTALLED = True
@@ -44,6 +51,83 @@ def base642bin(base64_str: bytes) -> bytes:
     return binascii.a2b_base64(base64_str)
 
 
+class VerifierCache():
+    """Bounded LRU cache of PKCS1_PSS verifiers keyed by public key."""
+
+    def __init__(self, maxsize: int = 256):
+        """Constructor.
+
+        Keyword arguments:
+        maxsize -- maximum number of public keys kept parsed
+        """
+        if not isinstance(maxsize, int):
+            raise TypeError('maxsize must be of type int.')
+        if maxsize < 1:
+            raise ValueError('maxsize must be positive.')
+        self.__maxsize = maxsize
+        self.__verifiers = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__misses = 0
+
+    def __len__(self) -> int:
+        """Get the number of cached public keys."""
+        return len(self.__verifiers)
+
+    @property
+    def maxsize(self) -> int:
+        """Get maxsize."""
+        return self.__maxsize
+
+    @property
+    def hits(self) -> int:
+        """Get the number of lookups served from the cache."""
+        return self.__hits
+
+    @property
+    def misses(self) -> int:
+        """Get the number of lookups that had to parse the public key."""
+        return self.__misses
+
+    def get(self, pubkey: str) -> 'PKCS1_PSS.PSS_SigScheme':
+        """Get the verifier of a public key, parsing the key on a miss.
+
+        Keyword arguments:
+        pubkey -- public key in base64 ascii string
+
+        Returns:
+        A PKCS1_PSS verifier for the key
+
+        """
+        with self.__lock:
+            verifier = self.__verifiers.get(pubkey)
+            if verifier is not None:
+                self.__verifiers.move_to_end(pubkey)
+                self.__hits += 1
+                return verifier
+            self.__misses += 1
+        # Parse outside the lock, DER parsing is the expensive part
+        key = RSA.importKey(base642bin(bytes(pubkey, 'ascii')))
+        verifier = PKCS1_PSS.new(key)
+        with self.__lock:
+            self.__verifiers[pubkey] = verifier
+            self.__verifiers.move_to_end(pubkey)
+            while len(self.__verifiers) > self.__maxsize:
+                self.__verifiers.popitem(last=False)
+        return verifier
+
+    def clear(self):
+        """Drop every cached verifier and reset the counters."""
+        with self.__lock:
+            self.__verifiers.clear()
+            self.__hits = 0
+            self.__misses = 0
+
+
+verifier_cache = VerifierCache()
+
+
+@metrics.timed('mocookie_rsa_verify_seconds')
 def RSA_verify(message: str, signature: str, pubkey: str) -> bool:
     """Verify a message using its signature.
 
@@ -64,16 +148,51 @@ def RSA_verify(message: str, signature: str, pubkey: str) -> bool:
         raise ValueError('pubkey not a string')
     # Decode parameters
     signature = base642bin(bytes(signature, 'ascii'))
-    pubkey = base642bin(bytes(pubkey, 'ascii'))
     # Verify
-    key = RSA.importKey(pubkey)
+    verifier = verifier_cache.get(pubkey)
     h = SHA512.new(bytes(message, 'utf-8'))
-    verifier = PKCS1_PSS.new(key)
     if verifier.verify(h, signature):
         return True
     return False
 
 
+def RSA_verify_many(items: list) -> list:
+    """Verify a batch of messages using their signatures.
+
+    Each distinct public key is looked up in the verifier cache once per
+    batch.
+
+    Keyword arguments:
+    items -- iterable of (message, signature, pubkey) tuples, in the same
+      format as the arguments of RSA_verify
+
+    Returns:
+    A list of booleans in the same order as items
+
+    """
+    start = time.perf_counter()
+    verifiers = {}
+    results = []
+    for message, signature, pubkey in items:
+        if not isinstance(message, str):
+            raise ValueError('message not a string')
+        if not isinstance(signature, str):
+            raise ValueError('signature not a string')
+        if not isinstance(pubkey, str):
+            raise ValueError('pubkey not a string')
+        verifier = verifiers.get(pubkey)
+        if verifier is None:
+            verifier = verifier_cache.get(pubkey)
+            verifiers[pubkey] = verifier
+        h = SHA512.new(bytes(message, 'utf-8'))
+        signature = base642bin(bytes(signature, 'ascii'))
+        results.append(bool(verifier.verify(h, signature)))
+    metrics.REGISTRY.observe_labels('mocookie_rsa_verify_seconds',
+                                    time.perf_counter() - start, (),
+                                    len(results))
+    return results
+
+
 def RSA_encrypt(message: str, pubk: str) -> str:
     """Encrypt a message using a given RSA public key.
 
@@ -94,6 +213,238 @@ def RSA_encrypt(message: str, pubk: str) -> str:
     return str(bin2base64(ciphertext), 'ascii')
 
 
+class Session():
+    """Symmetric key of a connection, sealing payloads in AES-GCM frames.
+
+    RSA only wraps the key, once per connection, so bulk payloads cost
+    AES-GCM rather than an RSA operation per 190 bytes. A payload is cut
+    into frames of at most framesize bytes:
+
+    header  4 bytes  plaintext length, the high bit set on the last frame
+    nonce  12 bytes  random
+    ciphertext
+    tag    16 bytes
+
+    Each side numbers the payloads it sends from 0. The header, the side
+    of the sender, the number of the payload and the number of the frame
+    in its payload are authenticated, so frames cannot be dropped,
+    reordered or cut short, and a payload cannot be replayed, sent back
+    to its sender or accepted out of order. A payload the receiver never
+    got makes the following ones fail, a new session starts over.
+    """
+
+    keylen = 32
+    framesize = 1 << 16
+    header = struct.Struct('>I')
+    # Associated data after the header: sender side, payload, frame
+    aad = struct.Struct('>cQQ')
+    noncelen = 12
+    taglen = 16
+    final = 0x80000000
+    server_side = b'S'
+    client_side = b'C'
+
+    def __init__(self, key: bytes = None, client: bool = False):
+        """Constructor.
+
+        Keyword arguments:
+        key -- the symmetric key, default to a new random key
+        client -- the session is the client side of the connection
+        """
+        if not PYCRYPTO_INSTALLED:
+            raise ImportError('Module Pycrypto not installed.')
+        if key is None:
+            key = os.urandom(Session.keylen)
+        if not isinstance(key, bytes):
+            raise TypeError('key must be of type bytes.')
+        if len(key) != Session.keylen:
+            raise ValueError('key must be %d bytes long.' % Session.keylen)
+        self.__key = key
+        if client:
+            self.__side, self.__peer = Session.client_side, Session.server_side
+        else:
+            self.__side, self.__peer = Session.server_side, Session.client_side
+        # Number of the next payload sent and of the next one received
+        self.__sent = 0
+        self.__received = 0
+
+    @property
+    def key(self) -> bytes:
+        """Get the symmetric key."""
+        return self.__key
+
+    @property
+    def sent(self) -> int:
+        """Get the number of payloads numbered for sending."""
+        return self.__sent
+
+    @property
+    def received(self) -> int:
+        """Get the number of payloads received."""
+        return self.__received
+
+    def wrap(self, pubk: str) -> str:
+        """Encrypt the key for the owner of a public key.
+
+        Keyword arguments:
+        pubk -- a public key in base64 ascii string
+
+        Returns:
+        The wrapped key in base64, opened by RSAUser.open_session
+
+        """
+        key = str(bin2base64(self.__key), 'ascii').rstrip('\n')
+        return RSA_encrypt(key, pubk).rstrip('\n')
+
+    def reserve(self) -> int:
+        """Number the next payload sent.
+
+        Payloads must be sent in the order of their numbers, whichever
+        order they are encrypted in.
+
+        Returns:
+        The number of the payload
+
+        """
+        seq = self.__sent
+        self.__sent += 1
+        return seq
+
+    def __seal(self, data: bytes, seq: int, index: int, last: bool) -> bytes:
+        """Encrypt a frame."""
+        header = Session.header.pack(len(data) |
+                                     (Session.final if last else 0))
+        nonce = os.urandom(Session.noncelen)
+        cipher = AES.new(self.__key, AES.MODE_GCM, nonce=nonce,
+                         mac_len=Session.taglen)
+        cipher.update(header + Session.aad.pack(self.__side, seq, index))
+        ciphertext, tag = cipher.encrypt_and_digest(data)
+        return b''.join((header, nonce, ciphertext, tag))
+
+    def encrypt_stream(self, chunks, seq: int = None):
+        """Encrypt a payload given in chunks of any size.
+
+        Keyword arguments:
+        chunks -- iterable of bytes
+        seq -- number of the payload given by reserve(), default to the
+          next number
+
+        Returns:
+        An iterator over the frames of the payload
+
+        """
+        if seq is None:
+            seq = self.reserve()
+        return self.__frames(chunks, seq)
+
+    def __frames(self, chunks, seq: int):
+        """Yield the frames of a payload, see encrypt_stream()."""
+        buf = bytearray()
+        index = 0
+        for chunk in chunks:
+            buf += chunk
+            # Keep a frame back, so the last one can be marked
+            while len(buf) > Session.framesize:
+                yield self.__seal(bytes(buf[:Session.framesize]), seq,
+                                  index, False)
+                del buf[:Session.framesize]
+                index += 1
+        yield self.__seal(bytes(buf), seq, index, True)
+
+    def encrypt(self, data: bytes, seq: int = None) -> bytes:
+        """Encrypt a whole payload into its frames, see encrypt_stream()."""
+        return b''.join(self.encrypt_stream((data,), seq))
+
+    @staticmethod
+    def frame_size(header: bytes) -> tuple:
+        """Parse a frame header.
+
+        Returns:
+        (number of bytes of the frame after the header, last frame)
+
+        """
+        length, = Session.header.unpack(header)
+        last = bool(length & Session.final)
+        length &= ~Session.final
+        return Session.noncelen + length + Session.taglen, last
+
+    def decrypt_frame(self, frame: bytes, seq: int, index: int) -> tuple:
+        """Decrypt a frame sent by the other side, header included.
+
+        Keyword arguments:
+        frame -- the frame
+        seq -- number of the payload
+        index -- number of the frame in its payload
+
+        Returns:
+        (plaintext, last frame)
+
+        """
+        header = frame[:Session.header.size]
+        size, last = Session.frame_size(header)
+        if len(frame) != Session.header.size + size:
+            raise ValueError('frame length does not match its header.')
+        nonce = frame[Session.header.size:
+                      Session.header.size + Session.noncelen]
+        cipher = AES.new(self.__key, AES.MODE_GCM, nonce=nonce,
+                         mac_len=Session.taglen)
+        cipher.update(header + Session.aad.pack(self.__peer, seq, index))
+        try:
+            data = cipher.decrypt_and_verify(
+                frame[Session.header.size + Session.noncelen:
+                      -Session.taglen],
+                frame[-Session.taglen:])
+        except ValueError:
+            raise ValueError('frame %d of payload %d is tampered with, '
+                             'replayed or out of order.' % (index, seq))
+        return data, last
+
+    def decrypt_stream(self, read):
+        """Decrypt the next payload as its frames are read.
+
+        The payload is counted as received once its last frame is
+        verified.
+
+        Keyword arguments:
+        read -- function returning the given number of bytes, such as the
+          read method of a binary file
+
+        Yields:
+        The plaintext of each frame
+
+        """
+        seq = self.__received
+        index = 0
+        last = False
+        while not last:
+            header = read(Session.header.size)
+            if len(header) != Session.header.size:
+                raise ValueError('payload cut short.')
+            size, _ = Session.frame_size(header)
+            body = read(size)
+            if len(body) != size:
+                raise ValueError('payload cut short.')
+            data, last = self.decrypt_frame(header + body, seq, index)
+            index += 1
+            if last:
+                self.__received = seq + 1
+            yield data
+
+    def decrypt(self, data: bytes) -> bytes:
+        """Decrypt a whole payload given by encrypt()."""
+        view = memoryview(data)
+        pos = 0
+
+        def read(n: int) -> bytes:
+            nonlocal pos
+            pos += n
+            return bytes(view[pos - n:pos])
+        plaintext = b''.join(self.decrypt_stream(read))
+        if pos != len(data):
+            raise ValueError('trailing data after the payload.')
+        return plaintext
+
+
 class RSAUser():
     """Create an RSA user."""
 
@@ -108,15 +459,27 @@ class RSAUser():
 
         self.__pubkey = None
         self.__privkey = None
+        # Derived from the keys once, see set_keys()
+        self.__pubkey_str = None
+        self.__signer = None
+
+    def set_keys(self, pubkey: 'RSA.RsaKey', privkey: 'RSA.RsaKey'):
+        """Use a pair of keys, caching their encoding and signer."""
+        self.__pubkey = pubkey
+        self.__privkey = privkey
+        self.__pubkey_str = None
+        if pubkey:
+            key = pubkey.exportKey('DER')
+            self.__pubkey_str = str(bin2base64(key), 'ascii')
+        self.__signer = PKCS1_PSS.new(privkey) if privkey else None
 
     def retrieve_keys(self, pubkey_path: str, privkey_path: str):
         """Retrieve keys from given files."""
         with open(pubkey_path, 'r') as f:
-            key = base642bin(f.read().encode())
-            self.__pubkey = RSA.importKey(key)
+            pubkey = RSA.importKey(base642bin(f.read().encode()))
         with open(privkey_path, 'r') as f:
-            key = base642bin(f.read().encode())
-            self.__privkey = RSA.importKey(key)
+            privkey = RSA.importKey(base642bin(f.read().encode()))
+        self.set_keys(pubkey, privkey)
 
     def generate_keys(self, pubkey_path: str, privkey_path: str):
         """Generate new keys and store the keys in DER format."""
@@ -124,8 +487,8 @@ class RSAUser():
         if not os.path.exists(os.path.dirname(pubkey_path)):
             os.makedirs(os.path.dirname(pubkey_path))
         # Generate new priv/pub keys
-        self.__privkey = RSA.generate(RSAUser.keylen)
-        self.__pubkey = self.__privkey.publickey()
+        privkey = RSA.generate(RSAUser.keylen)
+        self.set_keys(privkey.publickey(), privkey)
         with open(pubkey_path, 'w') as f:
             key = self.__pubkey.exportKey('DER')
             f.write(str(bin2base64(key), 'ascii'))
@@ -136,10 +499,7 @@ class RSAUser():
     @property
     def pubkey(self) -> str:
         """Get the string representation of the public key."""
-        if not self.__pubkey:
-            return None
-        key = self.__pubkey.exportKey('DER')
-        return str(bin2base64(key), 'ascii')
+        return self.__pubkey_str
 
     def decrypt(self, ciphertext: str) -> str:
         """Decrypt a ciphertext using self's private key.
@@ -160,6 +520,19 @@ class RSAUser():
         cipher = PKCS1_OAEP.new(self.__privkey)
         return str(cipher.decrypt(ciphertext), 'utf-8')
 
+    def open_session(self, wrapped: str) -> 'Session':
+        """Open the session of a key wrapped by Session.wrap for self.
+
+        Keyword arguments:
+        wrapped -- the wrapped key in base64 ascii string
+
+        Returns:
+        The client side of the session
+
+        """
+        key = self.decrypt(wrapped)
+        return Session(base642bin(bytes(key, 'ascii')), client=True)
+
     def sign(self, message: str) -> str:
         """Sign a message.
 
@@ -172,9 +545,25 @@ class RSAUser():
         """
         if not isinstance(message, str):
             raise TypeError("message is not a string")
-        if not self.__privkey:
+        if not self.__signer:
             raise ValueError('Private key does not exist.')
         h = SHA512.new(bytes(message, 'utf-8'))
-        signer = PKCS1_PSS.new(self.__privkey)
-        signature = signer.sign(h)
+        signature = self.__signer.sign(h)
         return str(bin2base64(signature), 'ascii')
+
+    def sign_many(self, messages: list,
+                  executor: 'concurrent.futures.Executor' = None) -> list:
+        """Sign a batch of messages.
+
+        Keyword arguments:
+        messages -- list of messages in utf-8 string
+        executor -- thread pool signing the messages in parallel, None to
+          sign them one after the other
+
+        Returns:
+        The signatures as base64 strings, in the same order as messages
+
+        """
+        if executor is None:
+            return [self.sign(message) for message in messages]
+        return list(executor.map(self.sign, messages))
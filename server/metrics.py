@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""Time the hot paths and export the timings in the Prometheus format.
+
+Timings are kept per process as Prometheus summaries, a count and a sum
+of seconds for each set of labels, so the mean of an interval is
+rate(name_sum) / rate(name_count):
+
+    @metrics.timed('mocookie_rsa_verify_seconds')
+    def RSA_verify(message, signature, pubkey):
+        ...
+
+    with metrics.REGISTRY.time('mocookie_request_seconds', protocol='gct'):
+        ...
+
+A process pool keeps the timings of its workers, which are not exported:
+time the call to the pool in the calling process instead.
+"""
+
+import time
+import asyncio
+import functools
+import threading
+
+
+def escape(value: str) -> str:
+    """Escape a label value of the text format."""
+    return (str(value).replace('\\', '\\\\').replace('\n', '\\n')
+            .replace('"', '\\"'))
+
+
+def format_labels(labels: tuple) -> str:
+    """Format ((name, value), ...) as {name="value",...}."""
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, escape(value))
+                             for name, value in labels)
+
+
+def format_summary(name: str, help_text: str, samples: dict) -> str:
+    """Format a summary in the text format.
+
+    Keyword arguments:
+    name -- name of the metric
+    help_text -- description of the metric
+    samples -- {labels: (count, sum)} where labels is ((name, value), ...)
+    """
+    lines = ['# HELP %s %s' % (name, help_text),
+             '# TYPE %s summary' % name]
+    for labels, (count, total) in sorted(samples.items()):
+        lines.append('%s_count%s %d' % (name, format_labels(labels), count))
+        lines.append('%s_sum%s %r' % (name, format_labels(labels),
+                                      float(total)))
+    return '\n'.join(lines) + '\n'
+
+
+def format_gauge(name: str, help_text: str, samples: dict) -> str:
+    """Format a gauge in the text format.
+
+    Keyword arguments:
+    name -- name of the metric
+    help_text -- description of the metric
+    samples -- {labels: value} where labels is ((name, value), ...)
+    """
+    lines = ['# HELP %s %s' % (name, help_text),
+             '# TYPE %s gauge' % name]
+    for labels, value in sorted(samples.items()):
+        lines.append('%s%s %r' % (name, format_labels(labels),
+                                  float(value)))
+    return '\n'.join(lines) + '\n'
+
+
+class Timer():
+    """Context manager adding the time of its block to a registry."""
+
+    __slots__ = ('_registry', '_name', '_labels', '_start')
+
+    def __init__(self, registry: 'Registry', name: str, labels: tuple):
+        self._registry = registry
+        self._name = name
+        self._labels = labels
+        self._start = None
+
+    def __enter__(self) -> 'Timer':
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._registry.observe_labels(self._name,
+                                      time.perf_counter() - self._start,
+                                      self._labels)
+
+
+class Registry():
+    """Summaries of the timings of a process."""
+
+    def __init__(self):
+        """Constructor, without any timing."""
+        # name -> {labels: [count, sum]}
+        self.__summaries = {}
+        self.__help = {}
+        self.__lock = threading.Lock()
+
+    def describe(self, name: str, help_text: str):
+        """Set the description of a metric."""
+        self.__help[name] = help_text
+
+    def observe(self, name: str, seconds: float, count: int = 1, **labels):
+        """Add the timing of count events to a summary."""
+        self.observe_labels(name, seconds, tuple(sorted(labels.items())),
+                            count)
+
+    def observe_labels(self, name: str, seconds: float, labels: tuple,
+                       count: int = 1):
+        """Add the timing of count events to a summary.
+
+        Keyword arguments:
+        name -- name of the summary
+        seconds -- time spent
+        labels -- ((name, value), ...) sorted by name
+        count -- number of events timed
+        """
+        with self.__lock:
+            samples = self.__summaries.get(name)
+            if samples is None:
+                samples = self.__summaries[name] = {}
+            sample = samples.get(labels)
+            if sample is None:
+                sample = samples[labels] = [0, 0.0]
+            sample[0] += count
+            sample[1] += seconds
+
+    def time(self, name: str, **labels) -> 'Timer':
+        """Get a context manager timing its block."""
+        return Timer(self, name, tuple(sorted(labels.items())))
+
+    def summary(self, name: str) -> dict:
+        """Get {labels: (count, sum)} of a summary."""
+        with self.__lock:
+            return {labels: tuple(sample) for labels, sample
+                    in self.__summaries.get(name, {}).items()}
+
+    def clear(self):
+        """Drop every timing."""
+        with self.__lock:
+            self.__summaries.clear()
+
+    def render(self) -> str:
+        """Format every summary in the text format."""
+        with self.__lock:
+            names = sorted(self.__summaries)
+        return ''.join(format_summary(name, self.__help.get(name, name),
+                                      self.summary(name))
+                       for name in names)
+
+
+# Registry of the process
+REGISTRY = Registry()
+REGISTRY.describe('mocookie_rsa_verify_seconds',
+                  'Time spent verifying RSA signatures.')
+REGISTRY.describe('mocookie_block_hash_seconds',
+                  'Time spent hashing blocks in Block.calculate_hash.')
+
+
+def timed(name: str, registry: 'Registry' = None):
+    """Decorate a function so that its calls are added to a summary.
+
+    Keyword arguments:
+    name -- name of the summary
+    registry -- registry of the summary, default to REGISTRY
+    """
+    if registry is None:
+        registry = REGISTRY
+
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return f(*args, **kwargs)
+            finally:
+                registry.observe_labels(name, time.perf_counter() - start,
+                                        ())
+        return wrapper
+    return decorator
+
+
+async def serve(collect, host: str = '127.0.0.1',
+                port: int = 9187) -> 'asyncio.base_events.Server':
+    """Serve the metrics over HTTP at /metrics.
+
+    Keyword arguments:
+    collect -- coroutine function giving the metrics in the text format
+    host -- address to listen on, keep it local
+    port -- port to listen on
+
+    Returns:
+    The listening server
+
+    """
+    async def handle(reader: 'asyncio.StreamReader',
+                     writer: 'asyncio.StreamWriter'):
+        try:
+            request = await reader.readline()
+            # Skip the headers
+            while (await reader.readline()).strip():
+                pass
+            method, _, rest = request.partition(b' ')
+            path = rest.split(b' ', 1)[0].split(b'?', 1)[0]
+            if method != b'GET' or path not in (b'/metrics', b'/'):
+                status = b'404 Not Found'
+                body = b'not found\n'
+            else:
+                status = b'200 OK'
+                body = bytes(await collect(), 'utf-8')
+            writer.write(b'HTTP/1.0 ' + status + b'\r\n'
+                         b'Content-Type: text/plain; version=0.0.4\r\n'
+                         b'Content-Length: ' +
+                         bytes(str(len(body)), 'ascii') + b'\r\n\r\n' + body)
+            await writer.drain()
+        except (ValueError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+    return await asyncio.start_server(handle, host, port)
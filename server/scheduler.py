@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+"""Decide when the server commits the pool into a block.
+
+A block is closed when the first of these targets is reached:
+
+size -- the pool holds max_size pending transactions
+latency -- the oldest pending transaction would wait more than
+  max_latency_ms by the time its block is committed
+cost -- committing the pool is expected to take more than cost_budget_ms
+
+Pending transactions are the ones no commit has left in the pool yet, see
+Blockchain.getPoolState: an incomplete ccct or cpct, or a rct waiting for
+its gct, only counts until a commit tries it, so it cannot make every
+step commit while it waits for the transactions it needs.
+
+The cost of a commit is learned from the last blocks, as a fixed cost per
+block plus a cost per included transaction. Small blocks pay the fixed
+cost more often, large blocks hold their transactions longer: max_size
+and max_latency_ms bound the wait under light load, while the cost
+budget keeps a spike from building a block whose commit holds the
+database for too long.
+
+Every expire_interval_ms the scheduler also drops the transactions that
+outlived PoolConfig.timeout, so they leave the pool while no block is
+committed.
+"""
+
+import time
+import asyncio
+import collections
+
+import metrics
+
+# Globals
+ASYNCPG_INSTALLED = False
+
+# Check if asyncpg is installed
+try:
+    import asyncpg
+    ASYNCPG_INSTALLED = True
+except ImportError:
+    pass
+
+# Query giving the size of the pool and the age of its oldest transaction,
+# for every pooled transaction and for the pending ones
+POOL_STATE_QUERY = '''
+    SELECT pool_size, oldest_age, pending_size, pending_age
+      FROM Blockchain.getPoolState()
+'''
+
+# Stored procedure committing the pool, giving the size of the block
+COMMIT_QUERY = 'SELECT Blockchain.commitPool()'
+
+# Stored procedure dropping the expired transactions of the pool
+EXPIRE_QUERY = 'SELECT Blockchain.expirePool()'
+
+metrics.REGISTRY.describe('mocookie_commit_seconds',
+                          'Time spent committing the pool, by reason.')
+
+
+class CostModel():
+    """Commit time of a block as fixed_ms + per_transaction_ms * size.
+
+    Both terms are fitted by least squares over the last blocks. Until
+    blocks of two different sizes have been seen, the fixed cost keeps its
+    initial value and only the cost per transaction is learned.
+    """
+
+    def __init__(self, history: int = 32, fixed_ms: float = 5.0,
+                 per_transaction_ms: float = 0.5):
+        """Constructor.
+
+        Keyword arguments:
+        history -- number of blocks the model is fitted on
+        fixed_ms -- initial cost of committing a block
+        per_transaction_ms -- initial cost of each transaction of a block
+        """
+        self.__samples = collections.deque(maxlen=history)
+        self.__fixed_ms = fixed_ms
+        self.__per_transaction_ms = per_transaction_ms
+
+    @property
+    def fixed_ms(self) -> float:
+        """Get the cost of committing a block."""
+        return self.__fixed_ms
+
+    @property
+    def per_transaction_ms(self) -> float:
+        """Get the cost of each transaction of a block."""
+        return self.__per_transaction_ms
+
+    @property
+    def samples(self) -> list:
+        """Get the (size, elapsed_ms) of the blocks the model is fitted on."""
+        return list(self.__samples)
+
+    def add(self, size: int, elapsed_ms: float):
+        """Learn from the commit of a block of size transactions."""
+        self.__samples.append((size, elapsed_ms))
+        n = len(self.__samples)
+        mean_size = sum(s for s, _ in self.__samples) / n
+        mean_ms = sum(ms for _, ms in self.__samples) / n
+        var = sum((s - mean_size) ** 2 for s, _ in self.__samples)
+        if var > 0:
+            cov = sum((s - mean_size) * (ms - mean_ms)
+                      for s, ms in self.__samples)
+            per_transaction = max(cov / var, 0.0)
+            self.__fixed_ms = max(mean_ms - per_transaction * mean_size, 0.0)
+            self.__per_transaction_ms = per_transaction
+        elif mean_size > 0:
+            self.__per_transaction_ms = max(
+                (mean_ms - self.__fixed_ms) / mean_size, 0.0)
+
+    def estimate(self, size: int) -> float:
+        """Get the expected time to commit a block of size transactions."""
+        return self.__fixed_ms + self.__per_transaction_ms * size
+
+
+class CommitScheduler():
+    """Commit the pool of the database when a target is reached.
+
+    The scheduler reads the state of the pool, commits it if a target is
+    reached and otherwise sleeps until the latency target could be
+    reached, or until notify reports that the size target may be.
+    """
+
+    def __init__(self, max_size: int = 1000, max_latency_ms: float = 2000,
+                 cost_budget_ms: float = 500, poll_interval_ms: float = 1000,
+                 model: 'CostModel' = None, history: int = 100,
+                 expire_interval_ms: float = 60000):
+        """Constructor.
+
+        Keyword arguments:
+        max_size -- number of pending transactions closing a block
+        max_latency_ms -- longest wait of a transaction for its block
+        cost_budget_ms -- longest expected commit of a block
+        poll_interval_ms -- longest time between two reads of the pool
+        model -- cost model of the commits, default to a new CostModel
+        history -- number of decisions kept
+        expire_interval_ms -- time between two expiries of the pool
+        """
+        if not ASYNCPG_INSTALLED:
+            raise ImportError('Module asyncpg not installed.')
+        if max_size <= 0 or max_latency_ms <= 0 or cost_budget_ms <= 0:
+            raise ValueError('targets must be positive.')
+        self.__max_size = max_size
+        self.__max_latency_ms = max_latency_ms
+        self.__cost_budget_ms = cost_budget_ms
+        self.__poll_interval_ms = poll_interval_ms
+        self.__model = model if model is not None else CostModel()
+        self.__decisions = collections.deque(maxlen=history)
+        self.__expire_interval_ms = expire_interval_ms
+        self.__expired_at = None
+        # Transactions pooled since the pool was last read
+        self.__added = 0
+        self.__size = 0
+        self.__wakeup = None
+
+    @property
+    def model(self) -> 'CostModel':
+        """Get the cost model of the commits."""
+        return self.__model
+
+    @property
+    def policy(self) -> dict:
+        """Get the targets and the current cost model."""
+        return {'max_size': self.__max_size,
+                'max_latency_ms': self.__max_latency_ms,
+                'cost_budget_ms': self.__cost_budget_ms,
+                'poll_interval_ms': self.__poll_interval_ms,
+                'expire_interval_ms': self.__expire_interval_ms,
+                'fixed_ms': self.__model.fixed_ms,
+                'per_transaction_ms': self.__model.per_transaction_ms}
+
+    @property
+    def decisions(self) -> list:
+        """Get the last commits, oldest first.
+
+        Each decision holds its time, reason, the size and oldest_ms of the
+        pending transactions, the estimate_ms and elapsed_ms of the commit,
+        and the number of transactions included in the block or the error
+        that stopped it.
+        """
+        return list(self.__decisions)
+
+    def decide(self, size: int, oldest_ms: float) -> str:
+        """Get the target reached by a pool, None if the pool should wait.
+
+        Keyword arguments:
+        size -- number of pending transactions
+        oldest_ms -- age of the oldest pending transaction
+        """
+        if size <= 0:
+            return None
+        if size >= self.__max_size:
+            return 'size'
+        if oldest_ms + self.__model.estimate(size) >= self.__max_latency_ms:
+            return 'latency'
+        if self.__model.estimate(size) >= self.__cost_budget_ms:
+            return 'cost'
+        return None
+
+    def wait_ms(self, size: int, oldest_ms: float) -> float:
+        """Get the time until the latency target of a pool is reached."""
+        if size <= 0:
+            return self.__poll_interval_ms
+        left = (self.__max_latency_ms - self.__model.estimate(size) -
+                oldest_ms)
+        return min(max(left, 0.0), self.__poll_interval_ms)
+
+    def notify(self, count: int = 1):
+        """Report transactions added to the pool since it was last read."""
+        self.__added += count
+        size = self.__size + self.__added
+        if size >= self.__max_size or \
+                self.__model.estimate(size) >= self.__cost_budget_ms:
+            self.wake()
+
+    def wake(self):
+        """Read the pool now instead of at the end of the current wait."""
+        if self.__wakeup is not None:
+            self.__wakeup.set()
+
+    async def commit(self, db: 'asyncpg.pool.Pool', reason: str, size: int,
+                     oldest_ms: float) -> dict:
+        """Commit the pool and learn the cost of the commit.
+
+        Only commits including transactions are learned from: the cost of
+        a block follows the transactions it includes, not the size of the
+        pool.
+
+        Returns:
+        The decision
+
+        """
+        decision = {'time': time.time(), 'reason': reason, 'size': size,
+                    'oldest_ms': oldest_ms,
+                    'estimate_ms': self.__model.estimate(size)}
+        start = time.perf_counter()
+        try:
+            decision['included'] = await db.fetchval(COMMIT_QUERY) or 0
+        except (asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+            decision['included'] = 0
+            decision['error'] = str(e)
+        decision['committed'] = decision['included'] > 0
+        decision['elapsed_ms'] = (time.perf_counter() - start) * 1000
+        if 'error' in decision:
+            outcome = 'error'
+        else:
+            outcome = 'block' if decision['committed'] else 'empty'
+        metrics.REGISTRY.observe('mocookie_commit_seconds',
+                                 decision['elapsed_ms'] / 1000,
+                                 reason=reason, outcome=outcome)
+        if decision['committed']:
+            self.__model.add(decision['included'], decision['elapsed_ms'])
+        self.__decisions.append(decision)
+        return decision
+
+    async def expire(self, db: 'asyncpg.pool.Pool') -> int:
+        """Drop the expired transactions if expire_interval_ms has passed.
+
+        Returns:
+        The number of transactions dropped, None if it was too soon
+
+        """
+        now = time.monotonic()
+        if self.__expired_at is not None and \
+                (now - self.__expired_at) * 1000 < self.__expire_interval_ms:
+            return None
+        self.__expired_at = now
+        return await db.fetchval(EXPIRE_QUERY)
+
+    async def step(self, db: 'asyncpg.pool.Pool') -> float:
+        """Read the pool once and commit it if a target is reached.
+
+        Returns:
+        The time to wait before the next step
+
+        """
+        await self.expire(db)
+        self.__added = 0
+        state = await db.fetchrow(POOL_STATE_QUERY)
+        size = state['pending_size']
+        oldest_ms = (state['pending_age'] or 0.0) * 1000
+        self.__size = size
+        reason = self.decide(size, oldest_ms)
+        if reason is None:
+            return self.wait_ms(size, oldest_ms)
+        decision = await self.commit(db, reason, size, oldest_ms)
+        self.__size = 0
+        if not decision['committed']:
+            # Nothing could be committed, the pool waits for a new target
+            return self.__poll_interval_ms
+        # Transactions left in the pool are read again at once
+        return 0.0
+
+    async def run(self, db: 'asyncpg.pool.Pool'):
+        """Commit the pool of a database until cancelled.
+
+        Keyword arguments:
+        db -- connection pool of the database, with a role allowed to
+          commit blocks
+        """
+        self.__wakeup = asyncio.Event()
+        try:
+            while True:
+                try:
+                    wait = await self.step(db)
+                except (asyncpg.PostgresError, asyncpg.InterfaceError,
+                        OSError):
+                    # Database unavailable, try again later
+                    wait = self.__poll_interval_ms
+                if wait > 0:
+                    try:
+                        await asyncio.wait_for(self.__wakeup.wait(),
+                                               wait / 1000)
+                    except asyncio.TimeoutError:
+                        pass
+                self.__wakeup.clear()
+        finally:
+            self.__wakeup = None
+
@@ -0,0 +1,512 @@
+#!/usr/bin/env python3
+"""Asyncio TCP server speaking the protocol in doc/server.md."""
+
+import time
+import argparse
+import asyncio
+import concurrent.futures
+
+import encryption
+import metrics
+import scheduler
+
+# Globals
+ASYNCPG_INSTALLED = False
+
+# Check if asyncpg is installed
+try:
+    import asyncpg
+    ASYNCPG_INSTALLED = True
+except ImportError:
+    pass
+
+COMPACT_INSTALLED = False
+
+# Check if py/compact.py is on the path, for gbcz
+try:
+    import compact
+    COMPACT_INSTALLED = True
+except ImportError:
+    pass
+
+# protocol -> (number of fields after the protocol, stored procedure)
+PROTOCOLS = {
+    'gct': (7, 'SELECT Blockchain.addGCT($1, $2, $3, $4, $5, $6, $7)'),
+    'rct': (7, 'SELECT Blockchain.addRCT($1, $2, $3, $4, $5, $6, $7)'),
+    'cct': (8, 'SELECT Blockchain.addCCT($1, $2, $3, $4, $5, $6, $7, $8)'),
+    'pct': (6, 'SELECT Blockchain.addPCT($1, $2, $3, $4, $5, $6)'),
+    'gbc': (1, 'SELECT Blockchain.getBlockchain($1)'),
+    # Answered by the server, see MoCookieServer.start_session
+    'ses': (1, None),
+}
+if COMPACT_INSTALLED:
+    # gbc answered in the compact form of py/compact.py
+    PROTOCOLS['gbcz'] = PROTOCOLS['gbc']
+
+# protocol -> (index of ttime, index of num_cookies) in the fields
+NUMERIC_FIELDS = {
+    'gct': (1, 4),
+    'rct': (1, 4),
+    'cct': (1, 6),
+    'pct': (2, 4),
+}
+
+# SQLSTATE raised by the database when the pool is full, see
+# doc/database.md
+POOL_FULL = '45004'
+
+# Calls of the stored procedures, see doc/database.md
+STATS_QUERY = '''
+    SELECT name, outcome, calls, total_ms FROM Blockchain.getStats()
+'''
+
+# Reasons of err responses kept as metric labels, others are 'malformed'
+ERROR_LABELS = ('bad signature', 'pool full', 'server failure')
+
+metrics.REGISTRY.describe('mocookie_request_seconds',
+                          'Time spent answering requests.')
+metrics.REGISTRY.describe('mocookie_signature_check_seconds',
+                          'Time spent verifying a request signature in '
+                          'the executor, queueing included.')
+
+
+class MessageError(ValueError):
+    """A request does not follow the protocol."""
+
+
+def parse_message(line: str) -> tuple:
+    """Parse one tab separated request.
+
+    Keyword arguments:
+    line -- a request without its trailing newline
+
+    Returns:
+    (protocol, fields) where fields holds the arguments of the stored
+    procedure, with ttime as a float and num_cookies as an int
+
+    """
+    protocol, _, rest = line.partition('\t')
+    if protocol not in PROTOCOLS:
+        raise MessageError('unknown protocol')
+    fields = rest.split('\t')
+    if len(fields) != PROTOCOLS[protocol][0]:
+        raise MessageError('wrong number of fields')
+    if protocol in NUMERIC_FIELDS:
+        ttime, num_cookies = NUMERIC_FIELDS[protocol]
+        try:
+            fields[ttime] = float(fields[ttime])
+            fields[num_cookies] = int(fields[num_cookies])
+        except ValueError:
+            raise MessageError('ttime and num_cookies must be numbers')
+    return protocol, fields
+
+
+def signed_part(line: str) -> str:
+    """Give the part of a transaction request covered by its signature."""
+    return line.rpartition('\t')[0]
+
+
+def request_labels(line: bytes, response: bytes) -> tuple:
+    """Give the metric labels of a request and its response.
+
+    Returns:
+    (('protocol', protocol), ('response', response))
+
+    """
+    protocol = str(line.partition(b'\t')[0].rstrip(b'\r\n'), 'ascii',
+                   'replace')
+    if protocol not in PROTOCOLS:
+        protocol = 'unknown'
+    kind, _, rest = response.partition(b'\n')[0].partition(b'\t')
+    kind = str(kind, 'ascii', 'replace')
+    if kind == 'err':
+        reason = str(rest, 'utf-8', 'replace')
+        kind = reason if reason in ERROR_LABELS else 'malformed'
+    return (('protocol', protocol), ('response', kind))
+
+
+class MoCookieServer():
+    """Serve pipelined requests from many clients over TCP.
+
+    Requests are newline terminated. Each connection may send requests
+    without waiting for responses; they are processed concurrently and
+    the responses are written back in request order:
+
+    ok -- the transaction was added to the pool
+    no -- the database refused the transaction
+    err\\t<reason> -- the request was malformed or its signature is wrong
+    gbc\\t<length> followed by <length> bytes -- a getBlockchain result
+    gbcz\\t<length> followed by <length> bytes -- the same, encoded by
+      compact.Codec
+    ses\\t<wrapped key>[\\t<signature>] -- the key of the session
+
+    After a ses request, the getBlockchain results of the connection are
+    sent as encryption.Session frames.
+    """
+
+    def __init__(self, dsn: str, host: str = '127.0.0.1', port: int = 8765,
+                 db_pool_size: int = 20, max_pipeline: int = 64,
+                 executor: 'concurrent.futures.Executor' = None,
+                 rsa_user: 'encryption.RSAUser' = None,
+                 commit_scheduler: 'scheduler.CommitScheduler' = None,
+                 metrics_host: str = '127.0.0.1', metrics_port: int = None):
+        """Constructor.
+
+        Keyword arguments:
+        dsn -- connection URI of the MoCookie database
+        host -- address to listen on
+        port -- port to listen on
+        db_pool_size -- maximum number of database connections
+        max_pipeline -- maximum number of in-flight requests per connection
+        executor -- executor verifying signatures. Default to a process
+          pool with one process per core.
+        rsa_user -- keys of the server, signing the session keys
+        commit_scheduler -- scheduler committing the pool, None to leave
+          the commits to another process
+        metrics_host -- address the metrics are served on
+        metrics_port -- port the metrics are served on, None to not serve
+          them
+        """
+        if not ASYNCPG_INSTALLED:
+            raise ImportError('Module asyncpg not installed.')
+        self.__dsn = dsn
+        self.__host = host
+        self.__port = port
+        self.__db_pool_size = db_pool_size
+        self.__max_pipeline = max_pipeline
+        self.__executor = executor
+        self.__rsa_user = rsa_user
+        self.__scheduler = commit_scheduler
+        self.__scheduler_task = None
+        self.__metrics_host = metrics_host
+        self.__metrics_port = metrics_port
+        self.__metrics_server = None
+        self.__db = None
+        self.__server = None
+
+    @property
+    def db(self) -> 'asyncpg.pool.Pool':
+        """Get the database connection pool."""
+        return self.__db
+
+    @property
+    def scheduler(self) -> 'scheduler.CommitScheduler':
+        """Get the scheduler committing the pool."""
+        return self.__scheduler
+
+    async def start(self):
+        """Connect to the database and start listening."""
+        if not self.__executor:
+            self.__executor = concurrent.futures.ProcessPoolExecutor()
+        self.__db = await asyncpg.create_pool(
+            self.__dsn, min_size=1, max_size=self.__db_pool_size)
+        if self.__scheduler:
+            self.__scheduler_task = asyncio.ensure_future(
+                self.__scheduler.run(self.__db))
+        if self.__metrics_port is not None:
+            self.__metrics_server = await metrics.serve(
+                self.collect_metrics, self.__metrics_host,
+                self.__metrics_port)
+        self.__server = await asyncio.start_server(
+            self.handle_connection, self.__host, self.__port)
+
+    async def serve_forever(self):
+        """Start the server if needed and serve until cancelled."""
+        if not self.__server:
+            await self.start()
+        async with self.__server:
+            await self.__server.serve_forever()
+
+    async def close(self):
+        """Stop listening and release the database connections."""
+        if self.__server:
+            self.__server.close()
+            await self.__server.wait_closed()
+            self.__server = None
+        if self.__metrics_server:
+            self.__metrics_server.close()
+            await self.__metrics_server.wait_closed()
+            self.__metrics_server = None
+        if self.__scheduler_task:
+            self.__scheduler_task.cancel()
+            try:
+                await self.__scheduler_task
+            except asyncio.CancelledError:
+                pass
+            self.__scheduler_task = None
+        if self.__db:
+            await self.__db.close()
+            self.__db = None
+        if self.__executor:
+            self.__executor.shutdown()
+            self.__executor = None
+
+    async def collect_metrics(self) -> str:
+        """Give the timings of the server and the stats of the database.
+
+        Returns:
+        The metrics in the Prometheus text format
+
+        """
+        text = [metrics.REGISTRY.render()]
+        up = 1
+        try:
+            stats = await self.__db.fetch(STATS_QUERY)
+            pool_state = await self.__db.fetchrow(
+                scheduler.POOL_STATE_QUERY)
+        except (asyncpg.PostgresError, asyncpg.InterfaceError, OSError):
+            up = 0
+        else:
+            text.append(metrics.format_summary(
+                'mocookie_db_call_seconds',
+                'Time spent in the stored procedures, by outcome. '
+                'commitTransaction and expirePool count pool entries.',
+                {(('function', row['name']), ('outcome', row['outcome'])):
+                 (row['calls'], row['total_ms'] / 1000) for row in stats}))
+            text.append(metrics.format_gauge(
+                'mocookie_pool_size', 'Number of pooled transactions.',
+                {(): pool_state['pool_size']}))
+            text.append(metrics.format_gauge(
+                'mocookie_pool_oldest_seconds',
+                'Age of the oldest pooled transaction.',
+                {(): pool_state['oldest_age'] or 0}))
+            text.append(metrics.format_gauge(
+                'mocookie_pool_pending',
+                'Number of pooled transactions no commit has tried.',
+                {(): pool_state['pending_size']}))
+            text.append(metrics.format_gauge(
+                'mocookie_pool_pending_oldest_seconds',
+                'Age of the oldest pooled transaction no commit has tried.',
+                {(): pool_state['pending_age'] or 0}))
+        text.append(metrics.format_gauge(
+            'mocookie_db_up', 'Whether the database answered.', {(): up}))
+        if self.__scheduler:
+            text.append(metrics.format_gauge(
+                'mocookie_commit_policy',
+                'Targets of the commit scheduler and its fitted costs.',
+                {(('setting', name),): value
+                 for name, value in self.__scheduler.policy.items()}))
+        return ''.join(text)
+
+    async def handle_connection(self, reader: 'asyncio.StreamReader',
+                                writer: 'asyncio.StreamWriter'):
+        """Read pipelined requests and write the responses in order."""
+        responses = asyncio.Queue(self.__max_pipeline)
+        sender = asyncio.ensure_future(self.send_responses(responses, writer))
+        session = None
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, ConnectionError):
+                    # Line over the stream limit or connection reset
+                    break
+                if not line:
+                    break
+                if line.partition(b'\t')[0].rstrip(b'\r\n') == b'ses':
+                    # Requests after this one use the new session
+                    session, task = self.start_session(line, session)
+                else:
+                    task = asyncio.ensure_future(self.dispatch(line,
+                                                               session))
+                # Blocks once max_pipeline requests are in flight
+                await responses.put(task)
+        except asyncio.CancelledError:
+            # Server shutting down
+            sender.cancel()
+            raise
+        await responses.put(None)
+        await sender
+
+    async def send_responses(self, responses: 'asyncio.Queue',
+                             writer: 'asyncio.StreamWriter'):
+        """Write the result of each request task in order."""
+        try:
+            while True:
+                task = await responses.get()
+                if task is None:
+                    break
+                writer.write(await task)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def start_session(self, line: bytes, session: 'encryption.Session'
+                      ) -> tuple:
+        """Create the session asked for by a ses request.
+
+        The key is wrapped at once, so that the following requests of the
+        connection can use the session while the key is being signed.
+
+        Keyword arguments:
+        line -- the ses request
+        session -- the current session of the connection
+
+        Returns:
+        (session of the connection, task of the response)
+
+        """
+        future = asyncio.get_running_loop().create_future()
+        try:
+            _, (pubk,) = parse_message(str(line, 'utf-8').rstrip('\r\n'))
+        except (UnicodeDecodeError, MessageError) as e:
+            future.set_result(bytes('err\t%s\n' % e, 'utf-8'))
+            return session, future
+        new_session = encryption.Session()
+        try:
+            wrapped = new_session.wrap(pubk)
+        except (ValueError, IndexError, TypeError):
+            future.set_result(b'err\tbad public key\n')
+            return session, future
+
+        async def respond() -> bytes:
+            fields = ['ses', wrapped]
+            if self.__rsa_user:
+                loop = asyncio.get_running_loop()
+                fields.append((await loop.run_in_executor(
+                    None, self.__rsa_user.sign, wrapped)).rstrip('\n'))
+            return bytes('\t'.join(fields) + '\n', 'ascii')
+        return new_session, asyncio.ensure_future(respond())
+
+    async def dispatch(self, line: bytes,
+                       session: 'encryption.Session' = None) -> bytes:
+        """Process one request and time it.
+
+        Keyword arguments:
+        line -- the request
+        session -- session of the connection, None if there is none
+
+        Returns:
+        The encoded response
+
+        """
+        start = time.perf_counter()
+        response = await self.process(line, session)
+        metrics.REGISTRY.observe_labels('mocookie_request_seconds',
+                                        time.perf_counter() - start,
+                                        request_labels(line, response))
+        return response
+
+    async def process(self, line: bytes,
+                      session: 'encryption.Session' = None) -> bytes:
+        """Process one request.
+
+        Keyword arguments:
+        line -- the request
+        session -- session of the connection, None if there is none
+
+        Returns:
+        The encoded response
+
+        """
+        try:
+            line = str(line, 'utf-8').rstrip('\r\n')
+            protocol, fields = parse_message(line)
+        except (UnicodeDecodeError, MessageError) as e:
+            return bytes('err\t%s\n' % e, 'utf-8')
+        try:
+            if protocol in ('gbc', 'gbcz'):
+                # Numbered before the first await, so that the payloads of
+                # pipelined requests are numbered in request order
+                seq = session.reserve() if session else None
+                blocks = await self.__db.fetchval(PROTOCOLS[protocol][1],
+                                                  *fields)
+                loop = asyncio.get_running_loop()
+                if protocol == 'gbcz':
+                    # A new codec refers to the users and blocks of the
+                    # response only, the client decodes it the same way
+                    payload = await loop.run_in_executor(
+                        None, compact.Codec().encode_blockchain,
+                        blocks or '')
+                else:
+                    payload = bytes(blocks or '', 'utf-8')
+                if session:
+                    payload = await loop.run_in_executor(
+                        None, session.encrypt, payload, seq)
+                return bytes('%s\t%d\n' % (protocol, len(payload)),
+                             'ascii') + payload
+            # Verify the invoker's signature off the event loop
+            loop = asyncio.get_running_loop()
+            start = time.perf_counter()
+            try:
+                valid = await loop.run_in_executor(self.__executor,
+                                                   encryption.RSA_verify,
+                                                   signed_part(line),
+                                                   fields[-1], fields[0])
+            except ValueError:
+                valid = False
+            metrics.REGISTRY.observe_labels(
+                'mocookie_signature_check_seconds',
+                time.perf_counter() - start, ())
+            if not valid:
+                return b'err\tbad signature\n'
+            if await self.__db.fetchval(PROTOCOLS[protocol][1], *fields):
+                if self.__scheduler:
+                    self.__scheduler.notify()
+                return b'ok\n'
+            return b'no\n'
+        except asyncpg.PostgresError as e:
+            if getattr(e, 'sqlstate', None) == POOL_FULL:
+                if self.__scheduler:
+                    self.__scheduler.wake()
+                return b'err\tpool full\n'
+            return b'err\tserver failure\n'
+
+
+def main():
+    """Run the server from the command line."""
+    parser = argparse.ArgumentParser(description='MoCookie server.')
+    parser.add_argument('--dsn',
+                        default='postgresql:///mocookie?user=mc_server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--db-pool-size', type=int, default=20)
+    parser.add_argument('--max-pipeline', type=int, default=64)
+    parser.add_argument('--pubkey', help='public key file of the server')
+    parser.add_argument('--privkey', help='private key file of the server')
+    parser.add_argument('--no-commit', action='store_true',
+                        help='leave the commits to another process')
+    parser.add_argument('--commit-size', type=int, default=1000,
+                        help='pool size closing a block')
+    parser.add_argument('--commit-latency-ms', type=float, default=2000,
+                        help='longest wait of a transaction for its block')
+    parser.add_argument('--commit-budget-ms', type=float, default=500,
+                        help='longest expected commit of a block')
+    parser.add_argument('--expire-interval-ms', type=float, default=60000,
+                        help='time between two expiries of the pool')
+    parser.add_argument('--metrics-host', default='127.0.0.1')
+    parser.add_argument('--metrics-port', type=int,
+                        help='serve the metrics at /metrics on this port')
+    args = parser.parse_args()
+    rsa_user = None
+    if args.pubkey and args.privkey:
+        rsa_user = encryption.RSAUser()
+        rsa_user.retrieve_keys(args.pubkey, args.privkey)
+    commit_scheduler = None
+    if not args.no_commit:
+        commit_scheduler = scheduler.CommitScheduler(
+            args.commit_size, args.commit_latency_ms, args.commit_budget_ms,
+            expire_interval_ms=args.expire_interval_ms)
+    server = MoCookieServer(args.dsn, args.host, args.port,
+                            args.db_pool_size, args.max_pipeline,
+                            rsa_user=rsa_user,
+                            commit_scheduler=commit_scheduler,
+                            metrics_host=args.metrics_host,
+                            metrics_port=args.metrics_port)
+
+    async def run():
+        try:
+            await server.serve_forever()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""Find the pair cancels and chain collapses that simplify the debts."""
+
+import json
+import asyncio
+import argparse
+
+# Globals
+SCIPY_INSTALLED = False
+ASYNCPG_INSTALLED = False
+
+# Check if numpy and scipy are installed
+try:
+    import numpy as np
+    import scipy.sparse
+    SCIPY_INSTALLED = True
+except ImportError:
+    pass
+
+# Check if asyncpg is installed
+try:
+    import asyncpg
+    ASYNCPG_INSTALLED = True
+except ImportError:
+    pass
+
+# Debts between valid users, as read by DebtGraph.load
+DEBT_QUERY = '''
+    SELECT d.sender_pubk, d.receiver_pubk, d.cookies_owed
+      FROM Blockchain.Debt d
+      JOIN Blockchain.CookieUser s ON (s.pubk = d.sender_pubk)
+      JOIN Blockchain.CookieUser r ON (r.pubk = d.receiver_pubk)
+     WHERE s.valid AND r.valid
+'''
+
+
+def top(cleared: 'np.ndarray', limit: int) -> 'np.ndarray':
+    """Get the indices of the limit largest values, largest first.
+
+    Keyword arguments:
+    cleared -- cookies cleared by each proposal
+    limit -- number of indices, None for all of them
+    """
+    if limit is not None and limit < len(cleared):
+        best = np.argpartition(-cleared, limit)[:limit]
+    else:
+        best = np.arange(len(cleared))
+    return best[np.argsort(-cleared[best], kind='stable')]
+
+
+class DebtGraph():
+    """Sparse matrix of the cookies each user owes another.
+
+    D[i, j] is the number of cookies user i owes user j. Proposals are
+    found for all users at once with array operations on D:
+
+    pair cancel -- i and j owe each other, min(D, D^T) cancels on both
+      sides, which clears twice that many cookies.
+    chain collapse -- i owes j and j owes k, the non-zero terms of the
+      product D @ D. Collapsing min(D[i, j], D[j, k]) turns two debts into
+      one and clears that many cookies.
+    """
+
+    # Number of chains examined at once by chain_collapses
+    chunksize = 1 << 22
+
+    def __init__(self, users: list, matrix: 'scipy.sparse.csr_matrix'):
+        """Constructor.
+
+        Keyword arguments:
+        users -- public key of each row and column of the matrix
+        matrix -- square matrix of the cookies owed
+        """
+        if not SCIPY_INSTALLED:
+            raise ImportError('Modules numpy and scipy not installed.')
+        if matrix.shape != (len(users), len(users)):
+            raise ValueError('matrix must be square with a row per user.')
+        self.__users = list(users)
+        self.__matrix = scipy.sparse.csr_matrix(matrix, dtype=np.int64)
+        self.__matrix.eliminate_zeros()
+
+    @classmethod
+    def from_rows(cls, rows) -> 'DebtGraph':
+        """Create the graph of debt rows.
+
+        Keyword arguments:
+        rows -- iterable of (sender, receiver, cookies_owed)
+        """
+        if not SCIPY_INSTALLED:
+            raise ImportError('Modules numpy and scipy not installed.')
+        index = {}
+        senders, receivers, cookies = [], [], []
+        for sender, receiver, owed in rows:
+            senders.append(index.setdefault(sender, len(index)))
+            receivers.append(index.setdefault(receiver, len(index)))
+            cookies.append(owed)
+        matrix = scipy.sparse.coo_matrix(
+            (np.array(cookies, dtype=np.int64), (senders, receivers)),
+            shape=(len(index), len(index)))
+        return cls(list(index), matrix.tocsr())
+
+    @classmethod
+    async def load(cls, db) -> 'DebtGraph':
+        """Create the graph of the debts between valid users.
+
+        Keyword arguments:
+        db -- an asyncpg connection or pool to the MoCookie database
+        """
+        return cls.from_rows(await db.fetch(DEBT_QUERY))
+
+    @property
+    def users(self) -> list:
+        """Get the public key of each row and column."""
+        return self.__users
+
+    @property
+    def matrix(self) -> 'scipy.sparse.csr_matrix':
+        """Get the matrix of the cookies owed."""
+        return self.__matrix
+
+    def pair_cancels(self, limit: int = None) -> list:
+        """Find every pair of users who owe each other.
+
+        Keyword arguments:
+        limit -- return only this many proposals, None for all
+
+        Returns:
+        A list of ('pct', user_a, user_b, num_cookies, cleared), most
+        cookies cleared first
+
+        """
+        mutual = scipy.sparse.triu(
+            self.__matrix.minimum(self.__matrix.T), k=1).tocoo()
+        cleared = 2 * mutual.data
+        return [('pct', self.__users[mutual.row[i]],
+                 self.__users[mutual.col[i]], int(mutual.data[i]),
+                 int(cleared[i]))
+                for i in top(cleared, limit)]
+
+    def chain_collapses(self, limit: int = None) -> list:
+        """Find every chain of three users where each owes the next.
+
+        Chains are built for each middle user from the debts owed to them
+        and the debts they owe, chunksize chains at a time.
+
+        Keyword arguments:
+        limit -- return only this many proposals, None for all
+
+        Returns:
+        A list of ('cct', start_user, mid_user, end_user, num_cookies,
+        cleared), most cookies cleared first
+
+        """
+        owed_to = self.__matrix.tocsc()
+        owes = self.__matrix
+        in_degree = np.diff(owed_to.indptr)
+        out_degree = np.diff(owes.indptr)
+        chains = in_degree * out_degree
+        ends = np.cumsum(chains)
+        total = int(ends[-1]) if len(ends) else 0
+        found = []
+        for chunk_start in range(0, total, DebtGraph.chunksize):
+            chunk_stop = min(chunk_start + DebtGraph.chunksize, total)
+            # Chain number n goes through the middle user whose range of
+            # chain numbers holds n
+            n = np.arange(chunk_start, chunk_stop)
+            mid = np.searchsorted(ends, n, side='right')
+            k = n - (ends[mid] - chains[mid])
+            start_pos = owed_to.indptr[mid] + k // out_degree[mid]
+            end_pos = owes.indptr[mid] + k % out_degree[mid]
+            start = owed_to.indices[start_pos]
+            end = owes.indices[end_pos]
+            cookies = np.minimum(owed_to.data[start_pos], owes.data[end_pos])
+            # A chain back to its start is a pair cancel
+            keep = start != end
+            start, mid, end, cookies = (start[keep], mid[keep], end[keep],
+                                        cookies[keep])
+            best = top(cookies, limit)
+            found.append((start[best], mid[best], end[best], cookies[best]))
+            if limit is not None:
+                # Keep only the best limit chains seen so far
+                found = [tuple(np.concatenate(a) for a in zip(*found))]
+                best = top(found[0][3], limit)
+                found = [tuple(a[best] for a in found[0])]
+        if not found:
+            return []
+        start, mid, end, cookies = (np.concatenate(a) for a in zip(*found))
+        return [('cct', self.__users[start[i]], self.__users[mid[i]],
+                 self.__users[end[i]], int(cookies[i]), int(cookies[i]))
+                for i in top(cookies, limit)]
+
+    def proposals(self, limit: int = None) -> list:
+        """Find pair cancels and chain collapses.
+
+        Proposals may share debts, applying one can make another fail.
+
+        Keyword arguments:
+        limit -- return only this many proposals, None for all
+
+        Returns:
+        The proposals of pair_cancels() and chain_collapses(), most
+        cookies cleared first
+
+        """
+        proposals = self.pair_cancels(limit) + self.chain_collapses(limit)
+        proposals.sort(key=lambda p: p[-1], reverse=True)
+        return proposals[:limit]
+
+
+def main():
+    """Print the best proposals of the MoCookie database as JSON."""
+    parser = argparse.ArgumentParser(description='MoCookie settlements.')
+    parser.add_argument('--dsn', default='postgresql:///mocookie')
+    parser.add_argument('--limit', type=int, default=100)
+    args = parser.parse_args()
+    if not ASYNCPG_INSTALLED:
+        raise ImportError('Module asyncpg not installed.')
+
+    async def run() -> list:
+        conn = await asyncpg.connect(args.dsn)
+        try:
+            graph = await DebtGraph.load(conn)
+        finally:
+            await conn.close()
+        return graph.proposals(args.limit)
+
+    keys = {'pct': ('protocol', 'user_a', 'user_b', 'num_cookies',
+                    'cleared'),
+            'cct': ('protocol', 'start_user', 'mid_user', 'end_user',
+                    'num_cookies', 'cleared')}
+    print(json.dumps([dict(zip(keys[p[0]], p)) for p in asyncio.run(run())],
+                     indent=2))
+
+
+if __name__ == '__main__':
+    main()
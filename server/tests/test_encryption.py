@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Payloads sealed by a Session, from the server to the client.
+
+Run from the repository root with python -m pytest server/tests.
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import encryption  # noqa: E402
+from encryption import Session  # noqa: E402
+
+
+@unittest.skipUnless(encryption.PYCRYPTO_INSTALLED, 'needs pycryptodome')
+class TestSession(unittest.TestCase):
+
+    def setUp(self):
+        self.server = Session()
+        self.client = Session(self.server.key, client=True)
+        # Three frames, the last one partial
+        self.data = os.urandom(2 * Session.framesize + 100)
+
+    def test_round_trip(self):
+        for data in (self.data, b'', b'blocks'):
+            self.assertEqual(self.client.decrypt(self.server.encrypt(data)),
+                             data)
+        self.assertEqual(self.server.sent, 3)
+        self.assertEqual(self.client.received, 3)
+
+    def test_stream_in_chunks(self):
+        chunks = [self.data[i:i + 1000]
+                  for i in range(0, len(self.data), 1000)]
+        frames = list(self.server.encrypt_stream(chunks))
+        self.assertEqual(len(frames), 3)
+        self.assertEqual(self.client.decrypt(b''.join(frames)), self.data)
+
+    def test_tampered_frame(self):
+        payload = bytearray(self.server.encrypt(self.data))
+        payload[Session.header.size + Session.noncelen] ^= 1
+        with self.assertRaises(ValueError):
+            self.client.decrypt(bytes(payload))
+        self.assertEqual(self.client.received, 0)
+
+    def test_truncated_payload(self):
+        payload = self.server.encrypt(self.data)
+        size, _ = Session.frame_size(payload[:Session.header.size])
+        # Whole frames only, the last one dropped
+        with self.assertRaises(ValueError):
+            self.client.decrypt(payload[:2 * (Session.header.size + size)])
+        with self.assertRaises(ValueError):
+            self.client.decrypt(payload[:-1])
+
+    def test_replayed_payload(self):
+        first = self.server.encrypt(b'first')
+        second = self.server.encrypt(b'second')
+        self.assertEqual(self.client.decrypt(first), b'first')
+        with self.assertRaises(ValueError):
+            self.client.decrypt(first)
+        self.assertEqual(self.client.decrypt(second), b'second')
+
+    def test_reordered_payloads(self):
+        first = self.server.encrypt(b'first')
+        second = self.server.encrypt(b'second')
+        with self.assertRaises(ValueError):
+            self.client.decrypt(second)
+        self.assertEqual(self.client.decrypt(first), b'first')
+
+    def test_reserved_numbers(self):
+        first = self.server.reserve()
+        second = self.server.reserve()
+        # Encrypted out of order, sent in order
+        late = self.server.encrypt(b'second', second)
+        early = self.server.encrypt(b'first', first)
+        self.assertEqual(self.client.decrypt(early), b'first')
+        self.assertEqual(self.client.decrypt(late), b'second')
+
+    def test_reflected_payload(self):
+        payload = self.server.encrypt(b'blocks')
+        with self.assertRaises(ValueError):
+            self.server.decrypt(payload)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Decisions of the CommitScheduler on a pool holding waiting entries.
+
+Run from the repository root with python -m pytest server/tests.
+"""
+
+import os
+import sys
+import asyncio
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import scheduler  # noqa: E402
+
+
+class Database():
+    """Answer the queries of the scheduler with a fixed pool state."""
+
+    def __init__(self, pool_size: int, oldest_age: float, pending_size: int,
+                 pending_age: float, included: int):
+        self.state = {'pool_size': pool_size, 'oldest_age': oldest_age,
+                      'pending_size': pending_size,
+                      'pending_age': pending_age}
+        self.included = included
+        self.queries = []
+
+    async def fetchrow(self, query: str) -> dict:
+        self.queries.append(query)
+        return self.state
+
+    async def fetchval(self, query: str):
+        self.queries.append(query)
+        if query == scheduler.COMMIT_QUERY:
+            return self.included
+        return 0
+
+
+@unittest.skipUnless(scheduler.ASYNCPG_INSTALLED, 'asyncpg not installed')
+class TestCommitScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = scheduler.CommitScheduler(
+            max_size=100, max_latency_ms=2000, cost_budget_ms=500,
+            poll_interval_ms=1000)
+
+    def test_attempted_entries_do_not_commit(self):
+        # Incomplete combined transactions waiting for hours, none pending
+        db = Database(500, 3600.0, 0, None, 0)
+        wait = asyncio.run(self.scheduler.step(db))
+        self.assertEqual(wait, 1000)
+        self.assertNotIn(scheduler.COMMIT_QUERY, db.queries)
+        self.assertEqual(self.scheduler.decisions, [])
+
+    def test_pending_entry_reaches_latency(self):
+        db = Database(500, 3600.0, 1, 2.5, 1)
+        wait = asyncio.run(self.scheduler.step(db))
+        self.assertEqual(wait, 0.0)
+        decision = self.scheduler.decisions[-1]
+        self.assertEqual(decision['reason'], 'latency')
+        self.assertEqual(decision['size'], 1)
+        self.assertEqual(decision['included'], 1)
+
+    def test_model_learns_included_transactions(self):
+        db = Database(500, 3600.0, 10, 2.5, 3)
+        asyncio.run(self.scheduler.commit(db, 'latency', 10, 2500.0))
+        self.assertEqual([size for size, _ in self.scheduler.model.samples],
+                         [3])
+
+    def test_model_skips_empty_commits(self):
+        db = Database(500, 3600.0, 10, 2.5, 0)
+        decision = asyncio.run(
+            self.scheduler.commit(db, 'latency', 10, 2500.0))
+        self.assertFalse(decision['committed'])
+        self.assertEqual(self.scheduler.model.samples, [])
+
+    def test_expire_interval(self):
+        db = Database(0, None, 0, None, 0)
+        self.assertEqual(asyncio.run(self.scheduler.expire(db)), 0)
+        self.assertIsNone(asyncio.run(self.scheduler.expire(db)))
+        self.assertEqual(db.queries.count(scheduler.EXPIRE_QUERY), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,134 +1,64 @@
 BEGIN TRANSACTION;
-CREATE OR REPLACE FUNCTION Blockchain.getFormattedAUT(tid INT)
-  RETURNS TEXT AS
-  /* get all information associated to a AUT.
-
-  Returns:
-  A string in the format that the protocol is signed.
-  */
-  $$
-  BEGIN
-    RETURN (SELECT FORMAT(E'aut\t%s',user_pubk)
-            FROM Blockchain.AddUserTransaction
-            WHERE id = tid);
-  END
-  $$ LANGUAGE plpgsql SECURITY DEFINER;
-
-CREATE OR REPLACE FUNCTION Blockchain.getFormattedRUT(tid INT)
-  RETURNS TEXT AS
-  /* get all information associated to a RUT.
+CREATE OR REPLACE FUNCTION Blockchain.recordStat(fn TEXT,
+                                                 outcome TEXT,
+                                                 started TIMESTAMPTZ,
+                                                 n BIGINT DEFAULT 1)
+  RETURNS VOID AS
+  /* Count calls of a stored procedure and the time spent in them.
 
-  Returns:
-  A string in the format that the protocol is signed.
+  Arguments:
+  fn: name of the stored procedure.
+  outcome: result of the calls.
+  started: clock_timestamp() when the calls started.
+  n: number of calls, or of pool entries handled.
   */
   $$
-  BEGIN
-    RETURN (SELECT FORMAT(E'rut\t%s',user_pubk)
-            FROM Blockchain.RemoveUserTransaction
-            WHERE id = tid);
-  END
-  $$ LANGUAGE plpgsql SECURITY DEFINER;
-
-CREATE OR REPLACE FUNCTION Blockchain.getFormattedGCT(tid INT)
-  RETURNS TEXT AS
-  /* get all information associated to a CCT.
+    INSERT INTO Blockchain.Stat AS s(name, outcome, slot, calls, total_ms)
+      VALUES (fn, outcome, pg_backend_pid() % 16, n,
+              extract(epoch FROM clock_timestamp() - started) * 1000)
+    ON CONFLICT (name, outcome, slot) DO UPDATE
+      SET calls = s.calls + EXCLUDED.calls,
+          total_ms = s.total_ms + EXCLUDED.total_ms;
+  $$ LANGUAGE sql SECURITY DEFINER;
 
-  Returns:
-  A string in the format that the protocol is signed
-  */
-  $$
-  BEGIN
-    RETURN (SELECT FORMAT(E'gct\t%s\t%s\t%s\t%s\t%s\t%s\t%s',
-                          invoker,
-                          extract(epoch FROM transaction_time),
-                          receiver,
-                          b.curr_hash,
-                          num_cookies,
-                          reason,
-                          signature)
-            FROM Blockchain.GiveCookieTransaction gct
-            JOIN Blockchain.Block b ON (gct.recent_block = b.id)
-            WHERE gct.id = tid);
-  END
-  $$ LANGUAGE plpgsql SECURITY DEFINER;
-
-CREATE OR REPLACE FUNCTION Blockchain.getFormattedRCT(tid INT)
-  RETURNS TEXT AS
-  /* get all information associated to a RCT.
-
-  Returns:
-  A string in the format that the protocol is signed.
-  */
-  $$
-  BEGIN
-    RETURN (SELECT FORMAT(E'rct\t%s\t%s\t%s\t%s\t%s\t%s\t%s',
-                          invoker,
-                          extract(epoch FROM transaction_time),
-                          sender,
-                          b.curr_hash,
-                          num_cookies,
-                          cookie_type,
-                          signature)
-            FROM Blockchain.ReceiveCookieTransaction rct
-            JOIN Blockchain.Block b ON (rct.recent_block = b.id)
-            WHERE rct.id = tid);
-  END
-  $$ LANGUAGE plpgsql SECURITY DEFINER;
+CREATE OR REPLACE FUNCTION Blockchain.recordStats(fn TEXT,
+                                                  outcomes TEXT[],
+                                                  counts BIGINT[],
+                                                  spent DOUBLE PRECISION[])
+  RETURNS VOID AS
+  /* Count the calls of a stored procedure by outcome in one statement.
 
-CREATE OR REPLACE FUNCTION Blockchain.getFormattedCCT(tid INT)
-  RETURNS TEXT AS
-  /* get all information associated to a CCT.
+  Loops over many entries count their outcomes in local arrays and call
+  this once at their end, instead of updating the same Stat rows once per
+  entry. Outcomes without any call are skipped.
 
-  Returns:
-  A string in the format that the protocol is signed.
+  Arguments:
+  fn: name of the stored procedure.
+  outcomes: results of the calls.
+  counts: number of calls of each outcome.
+  spent: milliseconds spent in the calls of each outcome.
   */
   $$
-  BEGIN
-    RETURN (SELECT FORMAT(E'cct\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s',
-                          invoker,
-                          extract(epoch FROM transaction_time),
-                          b.curr_hash,
-                          start_user,
-                          mid_user,
-                          end_user,
-                          num_cookies,
-                          signature)
-            FROM Blockchain.ChainCollapseTransaction cct
-            JOIN Blockchain.CombinedChainCollapseTransaction ccct
-              ON (cct.id = ccct.start_user_transaction OR
-                  cct.id = ccct.mid_user_transaction OR
-                  cct.id = ccct.end_user_transaction)
-            JOIN Blockchain.Block b ON (cct.recent_block = b.id)
-            WHERE cct.id = tid);
-  END
-  $$ LANGUAGE plpgsql SECURITY DEFINER;
+    INSERT INTO Blockchain.Stat AS s(name, outcome, slot, calls, total_ms)
+      SELECT fn, o.outcome, pg_backend_pid() % 16, o.calls, o.total_ms
+        FROM unnest(outcomes, counts, spent) AS o(outcome, calls, total_ms)
+       WHERE o.calls > 0
+    ON CONFLICT (name, outcome, slot) DO UPDATE
+      SET calls = s.calls + EXCLUDED.calls,
+          total_ms = s.total_ms + EXCLUDED.total_ms;
+  $$ LANGUAGE sql SECURITY DEFINER;
 
-CREATE OR REPLACE FUNCTION Blockchain.getFormattedPCT(tid INT)
-  RETURNS TEXT AS
-  /* get all information associated to a PCT.
-
-  Returns:
-  A string in the format that the protocol is signed.
-  */
+CREATE OR REPLACE FUNCTION Blockchain.getStats()
+  RETURNS TABLE (name TEXT, outcome TEXT, calls BIGINT,
+                 total_ms DOUBLE PRECISION) AS
+  /* Return the calls of each stored procedure by outcome, since the
+  database was created. */
   $$
-  BEGIN
-    RETURN (SELECT FORMAT(E'pct\t%s\t%s\t%s\t%s\t%s',
-                          invoker,
-                          extract(epoch FROM transaction_time),
-                          CASE WHEN pct.id = cpct.user_a_transaction
-                            THEN cpct.user_b
-                            ELSE cpct.user_a
-                          END, -- other
-                          num_cookies,
-                          signature)
-            FROM Blockchain.PairCancelTransaction pct
-            JOIN Blockchain.CombinedPairCancelTransaction cpct
-              ON (pct.id = cpct.user_a_transaction OR
-                  pct.id = cpct.user_b_transaction)
-            JOIN Blockchain.Block b ON (pct.recent_block = b.id)
-            WHERE pct.id = tid);
-  END
-  $$ LANGUAGE plpgsql SECURITY DEFINER;
+    SELECT s.name, s.outcome, sum(s.calls)::BIGINT, sum(s.total_ms)
+      FROM Blockchain.Stat s
+     GROUP BY s.name, s.outcome
+     ORDER BY s.name, s.outcome;
+  $$ LANGUAGE sql STABLE SECURITY DEFINER;
 
 CREATE OR REPLACE FUNCTION Blockchain.getFormattedBlock(bid INT)
   RETURNS TEXT AS
@@ -139,76 +69,41 @@ CREATE OR REPLACE FUNCTION Blockchain.getFormattedBlock(bid INT)
   t2\t
   ...
   tn\t
+
+  Transactions are formatted in a single pass over
+  Blockchain.FormattedTransaction. The view is probed once per included
+  transaction (OFFSET 0 keeps it from being flattened into a hash join
+  over every subclass table).
   */
   $$
-  DECLARE
-    plaintext TEXT := '';
-    partial_plaintext TEXT;
-    tid INT;
-    protocol VARCHAR(4);
-  BEGIN
-  SELECT CONCAT(E'prev\t', curr_hash, E'\n') INTO plaintext
-    FROM Blockchain.Block
-    WHERE id < bid
-    ORDER BY id DESC
-    LIMIT 1;
-  FOR tid, protocol IN SELECT transaction_id, t.protocol
-                       FROM Blockchain.IncludeTransaction
-                       JOIN Blockchain.Transaction t ON (id = transaction_id)
-                       WHERE block = bid
-                       ORDER BY transaction_id LOOP
-    IF (protocol = 'aut') THEN
-      SELECT Blockchain.getFormattedAUT(tid) INTO partial_plaintext;
-      SELECT CONCAT(plaintext, partial_plaintext, E'\n') INTO plaintext;
-    ELSEIF (protocol = 'rut') THEN
-      SELECT Blockchain.getFormattedRUT(tid) INTO partial_plaintext;
-      SELECT CONCAT(plaintext, partial_plaintext, E'\n') INTO plaintext;
-    ELSEIF (protocol = 'gct') THEN
-      SELECT Blockchain.getFormattedGCT(tid) INTO partial_plaintext;
-      SELECT CONCAT(plaintext, partial_plaintext, E'\n') INTO plaintext;
-    ELSEIF (protocol = 'rct') THEN
-      SELECT Blockchain.getFormattedRCT(tid) INTO partial_plaintext;
-      SELECT CONCAT(plaintext, partial_plaintext, E'\n') INTO plaintext;
-    ELSEIF (protocol = 'ccct') THEN
-      SELECT string_agg(Blockchain.getFormattedCCT(cct.id), E'\n')
-      INTO partial_plaintext
-      FROM Blockchain.CombinedChainCollapseTransaction ccct
-      JOIN Blockchain.ChainCollapseTransaction cct ON
-        (start_user = invoker OR
-         mid_user = invoker OR
-         end_user = invoker)
-      WHERE ccct.id = tid
-      GROUP BY ccct.start_user, ccct.mid_user, ccct.end_user, cct.invoker
-      ORDER BY CASE WHEN invoker = start_user THEN 1
-                    WHEN invoker = mid_user THEN 2
-                    WHEN invoker = end_user THEN 3
-               END;
-      SELECT CONCAT(plaintext, partial_plaintext, E'\n') INTO plaintext;
-    ELSEIF (protocol = 'cpct') THEN
-      SELECT string_agg(Blockchain.getFormattedPCT(pct.id), E'\n')
-      INTO partial_plaintext
-      FROM Blockchain.CombinedPairCancelTransaction cpct
-      JOIN Blockchain.PairCancelTransaction pct ON
-        (user_a = invoker OR user_b = invoker)
-      WHERE cpct.id = tid
-      GROUP BY cpct.user_a, cpct.user_b, pct.invoker
-      ORDER BY CASE WHEN invoker = user_a THEN 1
-                    WHEN invoker = user_b THEN 2
-               END;
-      SELECT CONCAT(plaintext, partial_plaintext, E'\n') INTO plaintext;
-    END IF;
-  END LOOP;
-  RETURN plaintext;
-  END
-  $$ LANGUAGE plpgsql SECURITY DEFINER;
+    SELECT (SELECT CONCAT(E'prev\t', curr_hash, E'\n')
+            FROM Blockchain.Block
+            WHERE id < bid
+            ORDER BY id DESC
+            LIMIT 1) ||
+           COALESCE((SELECT string_agg(f.line || E'\n', ''
+                                       ORDER BY i.transaction_id, f.position)
+                     FROM Blockchain.IncludeTransaction i
+                     CROSS JOIN LATERAL (
+                       SELECT *
+                         FROM Blockchain.FormattedTransaction f
+                        WHERE f.transaction_id = i.transaction_id
+                       OFFSET 0) f
+                     WHERE i.block = bid),
+                    '');
+  $$ LANGUAGE sql STABLE SECURITY DEFINER;
 
 CREATE OR REPLACE FUNCTION Blockchain.generateCurrHash(bid INT)
   RETURNS TEXT AS
-  /* Generate the hash for a block*/
+  /* Generate the hash for a block, from its stored plaintext if any */
   $$
   BEGIN
-    RETURN encode(Blockchain.digest(Blockchain.getFormattedBlock(bid),
-                                    TEXT 'SHA256'),
+    RETURN encode(Blockchain.digest(
+                    COALESCE((SELECT plaintext
+                              FROM Blockchain.Block
+                              WHERE id = bid),
+                             Blockchain.getFormattedBlock(bid)),
+                    TEXT 'SHA256'),
                   'base64');
   END
   $$ LANGUAGE plpgsql SECURITY DEFINER;
@@ -227,11 +122,13 @@ CREATE OR REPLACE FUNCTION Blockchain.createTransaction(protocol VARCHAR(4))
   transaction_protocol_check
   */
   $$
+  DECLARE
+    tid INT;
   BEGIN
-  INSERT INTO Blockchain.Transaction(protocol) VALUES (protocol);
-  -- Obtain transaction_id
-  RETURN (SELECT id FROM Blockchain.Transaction
-          ORDER BY id DESC LIMIT 1);
+  -- RETURNING gives this insert's id even with concurrent submitters
+  INSERT INTO Blockchain.Transaction(protocol) VALUES (protocol)
+    RETURNING id INTO tid;
+  RETURN tid;
   END
   $$ LANGUAGE plpgsql SECURITY DEFINER;
 
@@ -255,6 +152,7 @@ CREATE OR REPLACE FUNCTION Blockchain.addAUT(new_pubk TEXT)
     INSERT INTO Blockchain.Pool(transaction_id) VALUES (tid);
     RETURN TRUE;
   EXCEPTION
+    WHEN SQLSTATE '45004' THEN RAISE; -- Pool full
     WHEN unique_violation THEN RETURN FALSE;
     WHEN SQLSTATE '45000' THEN RETURN FALSE;
     WHEN SQLSTATE '45001' THEN RETURN FALSE;
@@ -282,6 +180,7 @@ CREATE OR REPLACE FUNCTION Blockchain.addRUT(user_pubk TEXT)
     INSERT INTO Blockchain.Pool(transaction_id) VALUES (tid);
     RETURN TRUE;
   EXCEPTION
+    WHEN SQLSTATE '45004' THEN RAISE; -- Pool full
     WHEN unique_violation THEN RETURN FALSE;
     WHEN check_violation THEN RETURN FALSE;
     WHEN SQLSTATE '45000' THEN RETURN FALSE;
@@ -289,7 +188,7 @@ CREATE OR REPLACE FUNCTION Blockchain.addRUT(user_pubk TEXT)
   END
   $$ LANGUAGE plpgsql SECURITY DEFINER;
 
-CREATE OR REPLACE FUNCTION Blockchain.addGCT(
+CREATE OR REPLACE FUNCTION Blockchain.insertGCT(
       invoker TEXT,
       transaction_time DOUBLE PRECISION, -- unix time
       receiver TEXT,
@@ -298,20 +197,24 @@ CREATE OR REPLACE FUNCTION Blockchain.addGCT(
       reason VARCHAR(100),
       signature TEXT)
   RETURNS BOOLEAN AS
+  /* Add a GiveCookieTransaction and put it into the pool like
+  Blockchain.addGCT, without counting the call in Blockchain.Stat.
+  */
   $$
     DECLARE
       tid INT;
       bid INT;
       ttime TIMESTAMPTZ;
     BEGIN
-      -- Create a generic transaction
-      SELECT Blockchain.CreateTransaction('gct') INTO tid;
       -- Obtain block_id
       SELECT id INTO bid
         FROM Blockchain.Block
         WHERE curr_hash = recent_hash;
-      IF (bid IS NULL) THEN RETURN FALSE;
+      IF (bid IS NULL) THEN
+        RETURN FALSE;
       END IF;
+      -- Create a generic transaction
+      SELECT Blockchain.CreateTransaction('gct') INTO tid;
       -- Convert unix time into TIMESTAMPTZ format
       SELECT to_timestamp(transaction_time) INTO ttime;
       -- Create GiveCookieTransaction
@@ -323,15 +226,47 @@ CREATE OR REPLACE FUNCTION Blockchain.addGCT(
       -- Add transaction into pool
       INSERT INTO Blockchain.Pool VALUES (tid);
       RETURN TRUE;
-    EXCEPTION WHEN unique_violation THEN RETURN FALSE;
-              WHEN check_violation THEN RETURN FALSE;
-              WHEN SQLSTATE '45000' THEN RETURN FALSE;
-              WHEN SQLSTATE '45001' THEN RETURN FALSE;
+    EXCEPTION WHEN SQLSTATE '45004' THEN RAISE; -- Pool full
+              WHEN unique_violation OR check_violation OR
+                   SQLSTATE '45000' OR SQLSTATE '45001' THEN
+                RETURN FALSE;
+  END
+  $$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION Blockchain.addGCT(
+      invoker TEXT,
+      transaction_time DOUBLE PRECISION, -- unix time
+      receiver TEXT,
+      recent_hash TEXT,
+      num_cookies INT,
+      reason VARCHAR(100),
+      signature TEXT)
+  RETURNS BOOLEAN AS
+  /* Add a GiveCookieTransaction and put it into the pool.
 
+  Returns:
+  TRUE if the transaction is added, FALSE otherwise.
+  */
+  $$
+  DECLARE
+    started TIMESTAMPTZ := clock_timestamp();
+    added BOOLEAN;
+  BEGIN
+    added := Blockchain.insertGCT(invoker,
+                                  transaction_time,
+                                  receiver,
+                                  recent_hash,
+                                  num_cookies,
+                                  reason,
+                                  signature);
+    PERFORM Blockchain.recordStat('addGCT',
+                                  CASE WHEN added THEN 'ok' ELSE 'no' END,
+                                  started);
+    RETURN added;
   END
   $$ LANGUAGE plpgsql SECURITY DEFINER;
 
-CREATE OR REPLACE FUNCTION Blockchain.addRCT(
+CREATE OR REPLACE FUNCTION Blockchain.insertRCT(
       invoker TEXT,
       transaction_time DOUBLE PRECISION,
       sender TEXT,
@@ -340,14 +275,15 @@ CREATE OR REPLACE FUNCTION Blockchain.addRCT(
       cookie_type VARCHAR(100),
       signature TEXT)
   RETURNS BOOLEAN AS
+  /* Add a ReceiveCookieTransaction and put it into the pool like
+  Blockchain.addRCT, without counting the call in Blockchain.Stat.
+  */
   $$
   DECLARE
     tid INT;
     bid INT;
     ttime TIMESTAMPTZ;
   BEGIN
-    -- Create a generic transaction
-    SELECT Blockchain.CreateTransaction('rct') INTO tid;
     -- Obtain block_id
     SELECT id INTO bid
       FROM Blockchain.Block
@@ -355,6 +291,8 @@ CREATE OR REPLACE FUNCTION Blockchain.addRCT(
     IF (bid IS NULL) THEN
       RETURN FALSE;
     END IF;
+    -- Create a generic transaction
+    SELECT Blockchain.CreateTransaction('rct') INTO tid;
     -- Convert unix time into TIMESTAMPTZ format
     SELECT to_timestamp(transaction_time) INTO ttime;
     -- Create GiveCookieTransaction
@@ -366,15 +304,47 @@ CREATE OR REPLACE FUNCTION Blockchain.addRCT(
     -- Add transaction to Pool
     INSERT INTO Blockchain.Pool VALUES (tid);
     RETURN TRUE;
-  EXCEPTION WHEN unique_violation THEN RETURN FALSE;
-            WHEN check_violation THEN RETURN FALSE;
-            WHEN SQLSTATE '45000' THEN RETURN FALSE;
-            WHEN SQLSTATE '45001' THEN RETURN FALSE;
+  EXCEPTION WHEN SQLSTATE '45004' THEN RAISE; -- Pool full
+            WHEN unique_violation OR check_violation OR
+                 SQLSTATE '45000' OR SQLSTATE '45001' THEN
+              RETURN FALSE;
+  END
+  $$ LANGUAGE plpgsql SECURITY DEFINER;
 
+CREATE OR REPLACE FUNCTION Blockchain.addRCT(
+      invoker TEXT,
+      transaction_time DOUBLE PRECISION,
+      sender TEXT,
+      recent_hash TEXT,
+      num_cookies INT,
+      cookie_type VARCHAR(100),
+      signature TEXT)
+  RETURNS BOOLEAN AS
+  /* Add a ReceiveCookieTransaction and put it into the pool.
+
+  Returns:
+  TRUE if the transaction is added, FALSE otherwise.
+  */
+  $$
+  DECLARE
+    started TIMESTAMPTZ := clock_timestamp();
+    added BOOLEAN;
+  BEGIN
+    added := Blockchain.insertRCT(invoker,
+                                  transaction_time,
+                                  sender,
+                                  recent_hash,
+                                  num_cookies,
+                                  cookie_type,
+                                  signature);
+    PERFORM Blockchain.recordStat('addRCT',
+                                  CASE WHEN added THEN 'ok' ELSE 'no' END,
+                                  started);
+    RETURN added;
   END
   $$ LANGUAGE plpgsql SECURITY DEFINER;
 
-CREATE OR REPLACE FUNCTION Blockchain.addCCT(
+CREATE OR REPLACE FUNCTION Blockchain.insertCCT(
       param_invoker TEXT,
       param_transaction_time DOUBLE PRECISION,
       param_recent_hash TEXT,
@@ -384,6 +354,9 @@ CREATE OR REPLACE FUNCTION Blockchain.addCCT(
       param_num_cookies INT,
       param_signature TEXT)
   RETURNS BOOLEAN AS
+  /* Add a ChainCollapseTransaction and put it into the pool like
+  Blockchain.addCCT, without counting the call in Blockchain.Stat.
+  */
   $$
     DECLARE
       tid INT;
@@ -391,8 +364,6 @@ CREATE OR REPLACE FUNCTION Blockchain.addCCT(
       ttime TIMESTAMPTZ;
       ccct_id INT;
     BEGIN
-      -- Create a generic transaction
-      SELECT Blockchain.CreateTransaction('cct') INTO tid;
       -- Obtain block_id
       SELECT id INTO bid
         FROM Blockchain.Block
@@ -400,12 +371,18 @@ CREATE OR REPLACE FUNCTION Blockchain.addCCT(
       IF (bid IS NULL) THEN
         RETURN FALSE;
       END IF;
+      -- Create a generic transaction
+      SELECT Blockchain.CreateTransaction('cct') INTO tid;
       -- Obtain ttime in TIMESTAMPTZ format
       SELECT to_timestamp(param_transaction_time) INTO ttime;
       -- Create ChainCollapseTransaction
       INSERT INTO Blockchain.ChainCollapseTransaction(
         id, invoker, transaction_time, recent_block, signature
       ) VALUES (tid, param_invoker, ttime, bid, param_signature);
+      -- Serialise submitters of the same chain so only one creates the ccct
+      PERFORM pg_advisory_xact_lock(
+        hashtext(concat_ws(E'\t', 'ccct', param_start_user, param_mid_user,
+                           param_end_user, param_num_cookies)));
       -- Check if CombinedChainCollapseTransaction exists
       SELECT id INTO ccct_id
         FROM Blockchain.CombinedChainCollapseTransaction ccct
@@ -424,6 +401,10 @@ CREATE OR REPLACE FUNCTION Blockchain.addCCT(
                   NULL, NULL, NULL, param_num_cookies);
         -- Insert ccct into pool
         INSERT INTO Blockchain.Pool VALUES (ccct_id);
+      ELSE
+        -- The next commit may succeed where the last one did not
+        UPDATE Blockchain.Pool SET attempted = FALSE
+        WHERE transaction_id = ccct_id AND attempted;
       END IF;
       -- Update ccct
       IF (param_invoker = param_start_user) THEN
@@ -441,15 +422,49 @@ CREATE OR REPLACE FUNCTION Blockchain.addCCT(
       END IF;
       RETURN TRUE;
     EXCEPTION
-      WHEN unique_violation THEN RETURN FALSE;
-      WHEN check_violation THEN RETURN FALSE;
-      WHEN SQLSTATE '45000' THEN RETURN FALSE;
-      WHEN SQLSTATE '45001' THEN RETURN FALSE;
-
+      WHEN SQLSTATE '45004' THEN RAISE; -- Pool full
+      WHEN unique_violation OR check_violation OR
+           SQLSTATE '45000' OR SQLSTATE '45001' THEN
+        RETURN FALSE;
     END
   $$ LANGUAGE plpgsql SECURITY DEFINER;
 
-CREATE OR REPLACE FUNCTION Blockchain.addPCT(
+CREATE OR REPLACE FUNCTION Blockchain.addCCT(
+      param_invoker TEXT,
+      param_transaction_time DOUBLE PRECISION,
+      param_recent_hash TEXT,
+      param_start_user TEXT,
+      param_mid_user TEXT,
+      param_end_user TEXT,
+      param_num_cookies INT,
+      param_signature TEXT)
+  RETURNS BOOLEAN AS
+  /* Add a ChainCollapseTransaction and put it into the pool.
+
+  Returns:
+  TRUE if the transaction is added, FALSE otherwise.
+  */
+  $$
+  DECLARE
+    started TIMESTAMPTZ := clock_timestamp();
+    added BOOLEAN;
+  BEGIN
+    added := Blockchain.insertCCT(param_invoker,
+                                  param_transaction_time,
+                                  param_recent_hash,
+                                  param_start_user,
+                                  param_mid_user,
+                                  param_end_user,
+                                  param_num_cookies,
+                                  param_signature);
+    PERFORM Blockchain.recordStat('addCCT',
+                                  CASE WHEN added THEN 'ok' ELSE 'no' END,
+                                  started);
+    RETURN added;
+  END
+  $$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION Blockchain.insertPCT(
   param_invoker TEXT,
   param_other TEXT,
   param_transaction_time DOUBLE PRECISION,
@@ -457,6 +472,9 @@ CREATE OR REPLACE FUNCTION Blockchain.addPCT(
   param_num_cookies INT,
   param_signature TEXT)
   RETURNS BOOLEAN AS
+  /* Add a PairCancelTransaction and put it into the pool like
+  Blockchain.addPCT, without counting the call in Blockchain.Stat.
+  */
   $$
   DECLARE
     tid INT;
@@ -464,8 +482,6 @@ CREATE OR REPLACE FUNCTION Blockchain.addPCT(
     ttime TIMESTAMPTZ;
     cpct_id INT;
   BEGIN
-    -- Create a generic transaction
-    SELECT Blockchain.createTransaction('pct') INTO tid;
     -- Obtain block_id
     SELECT id INTO bid
       FROM Blockchain.Block
@@ -473,6 +489,8 @@ CREATE OR REPLACE FUNCTION Blockchain.addPCT(
     IF (bid IS NULL) THEN
       RETURN FALSE;
     END IF;
+    -- Create a generic transaction
+    SELECT Blockchain.createTransaction('pct') INTO tid;
     -- Obtain ttime in TIMESTAMPTZ format
     SELECT to_timestamp(param_transaction_time) INTO ttime;
     -- Create PCT
@@ -480,6 +498,11 @@ CREATE OR REPLACE FUNCTION Blockchain.addPCT(
     INSERT INTO Blockchain.PairCancelTransaction(
       id, invoker, transaction_time, recent_block, signature
     ) VALUES (tid, param_invoker, ttime, bid, param_signature);
+    -- Serialise both users of the pair so only one creates the cpct
+    PERFORM pg_advisory_xact_lock(
+      hashtext(concat_ws(E'\t', 'cpct', LEAST(param_invoker, param_other),
+                         GREATEST(param_invoker, param_other),
+                         param_num_cookies)));
     -- Obtain cpct
     SELECT id INTO cpct_id
       FROM Blockchain.CombinedPairCancelTransaction cpct
@@ -502,13 +525,358 @@ CREATE OR REPLACE FUNCTION Blockchain.addPCT(
       UPDATE Blockchain.CombinedPairCancelTransaction cpct
       SET user_b_transaction = tid
       WHERE cpct.id = cpct_id;
+      -- The next commit may succeed where the last one did not
+      UPDATE Blockchain.Pool SET attempted = FALSE
+      WHERE transaction_id = cpct_id AND attempted;
     END IF;
     RETURN TRUE;
   EXCEPTION
-    WHEN unique_violation THEN RETURN FALSE;
-    WHEN check_violation THEN RETURN FALSE;
-    WHEN SQLSTATE '45000' THEN RETURN FALSE;
-    WHEN SQLSTATE '45001' THEN RETURN FALSE;
+    WHEN SQLSTATE '45004' THEN RAISE; -- Pool full
+    WHEN unique_violation OR check_violation OR
+         SQLSTATE '45000' OR SQLSTATE '45001' THEN
+      RETURN FALSE;
+  END
+  $$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION Blockchain.addPCT(
+  param_invoker TEXT,
+  param_other TEXT,
+  param_transaction_time DOUBLE PRECISION,
+  param_recent_hash TEXT,
+  param_num_cookies INT,
+  param_signature TEXT)
+  RETURNS BOOLEAN AS
+  /* Add a PairCancelTransaction and put it into the pool.
+
+  Returns:
+  TRUE if the transaction is added, FALSE otherwise.
+  */
+  $$
+  DECLARE
+    started TIMESTAMPTZ := clock_timestamp();
+    added BOOLEAN;
+  BEGIN
+    added := Blockchain.insertPCT(param_invoker,
+                                  param_other,
+                                  param_transaction_time,
+                                  param_recent_hash,
+                                  param_num_cookies,
+                                  param_signature);
+    PERFORM Blockchain.recordStat('addPCT',
+                                  CASE WHEN added THEN 'ok' ELSE 'no' END,
+                                  started);
+    RETURN added;
+  END
+  $$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION Blockchain.addGCTBatch(
+      invokers TEXT[],
+      transaction_times DOUBLE PRECISION[],
+      receivers TEXT[],
+      recent_hashes TEXT[],
+      num_cookies INT[],
+      reasons VARCHAR(100)[],
+      signatures TEXT[])
+  RETURNS BOOLEAN[] AS
+  /* Add many GiveCookieTransactions in one call.
+
+  Element i of every array are the arguments of one Blockchain.addGCT
+  call. Transactions are added in array order, each on its own, so a
+  rejected transaction does not affect the others. Once the pool is full,
+  the remaining transactions are not added.
+
+  Returns:
+  An array where element i is the result of adding transaction i, NULL if
+  the pool was full.
+  */
+  $$
+  DECLARE
+    n INT := COALESCE(array_length(invokers, 1), 0);
+    result BOOLEAN[] := '{}';
+    added BOOLEAN;
+    -- Calls and milliseconds by outcome, counted once at the end
+    counts BIGINT[] := '{0, 0}';
+    spent DOUBLE PRECISION[] := '{0, 0}';
+    lap TIMESTAMPTZ := clock_timestamp();
+    k INT;
+  BEGIN
+    IF (COALESCE(array_length(transaction_times, 1), 0) != n OR
+        COALESCE(array_length(receivers, 1), 0) != n OR
+        COALESCE(array_length(recent_hashes, 1), 0) != n OR
+        COALESCE(array_length(num_cookies, 1), 0) != n OR
+        COALESCE(array_length(reasons, 1), 0) != n OR
+        COALESCE(array_length(signatures, 1), 0) != n) THEN
+      RAISE EXCEPTION 'Arrays must have the same length.' USING
+        ERRCODE = 'invalid_parameter_value';
+    END IF;
+    FOR i IN 1..n LOOP
+      BEGIN
+        added := Blockchain.insertGCT(invokers[i],
+                                      transaction_times[i],
+                                      receivers[i],
+                                      recent_hashes[i],
+                                      num_cookies[i],
+                                      reasons[i],
+                                      signatures[i]);
+      EXCEPTION WHEN SQLSTATE '45004' THEN
+        -- Pool full, the remaining transactions are not added
+        result := result || array_fill(NULL::BOOLEAN, ARRAY[n - i + 1]);
+        EXIT;
+      END;
+      result := result || added;
+      k := CASE WHEN added THEN 1 ELSE 2 END;
+      counts[k] := counts[k] + 1;
+      spent[k] := spent[k] +
+        extract(epoch FROM clock_timestamp() - lap) * 1000;
+      lap := clock_timestamp();
+    END LOOP;
+    PERFORM Blockchain.recordStats('addGCT', ARRAY['ok', 'no'], counts,
+                                   spent);
+    RETURN result;
+  END
+  $$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION Blockchain.addRCTBatch(
+      invokers TEXT[],
+      transaction_times DOUBLE PRECISION[],
+      senders TEXT[],
+      recent_hashes TEXT[],
+      num_cookies INT[],
+      cookie_types VARCHAR(100)[],
+      signatures TEXT[])
+  RETURNS BOOLEAN[] AS
+  /* Add many ReceiveCookieTransactions in one call.
+
+  Element i of every array are the arguments of one Blockchain.addRCT
+  call, see Blockchain.addGCTBatch.
+
+  Returns:
+  An array where element i is the result of adding transaction i, NULL if
+  the pool was full.
+  */
+  $$
+  DECLARE
+    n INT := COALESCE(array_length(invokers, 1), 0);
+    result BOOLEAN[] := '{}';
+    added BOOLEAN;
+    -- Calls and milliseconds by outcome, counted once at the end
+    counts BIGINT[] := '{0, 0}';
+    spent DOUBLE PRECISION[] := '{0, 0}';
+    lap TIMESTAMPTZ := clock_timestamp();
+    k INT;
+  BEGIN
+    IF (COALESCE(array_length(transaction_times, 1), 0) != n OR
+        COALESCE(array_length(senders, 1), 0) != n OR
+        COALESCE(array_length(recent_hashes, 1), 0) != n OR
+        COALESCE(array_length(num_cookies, 1), 0) != n OR
+        COALESCE(array_length(cookie_types, 1), 0) != n OR
+        COALESCE(array_length(signatures, 1), 0) != n) THEN
+      RAISE EXCEPTION 'Arrays must have the same length.' USING
+        ERRCODE = 'invalid_parameter_value';
+    END IF;
+    FOR i IN 1..n LOOP
+      BEGIN
+        added := Blockchain.insertRCT(invokers[i],
+                                      transaction_times[i],
+                                      senders[i],
+                                      recent_hashes[i],
+                                      num_cookies[i],
+                                      cookie_types[i],
+                                      signatures[i]);
+      EXCEPTION WHEN SQLSTATE '45004' THEN
+        -- Pool full, the remaining transactions are not added
+        result := result || array_fill(NULL::BOOLEAN, ARRAY[n - i + 1]);
+        EXIT;
+      END;
+      result := result || added;
+      k := CASE WHEN added THEN 1 ELSE 2 END;
+      counts[k] := counts[k] + 1;
+      spent[k] := spent[k] +
+        extract(epoch FROM clock_timestamp() - lap) * 1000;
+      lap := clock_timestamp();
+    END LOOP;
+    PERFORM Blockchain.recordStats('addRCT', ARRAY['ok', 'no'], counts,
+                                   spent);
+    RETURN result;
+  END
+  $$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION Blockchain.addCCTBatch(
+      invokers TEXT[],
+      transaction_times DOUBLE PRECISION[],
+      recent_hashes TEXT[],
+      start_users TEXT[],
+      mid_users TEXT[],
+      end_users TEXT[],
+      num_cookies INT[],
+      signatures TEXT[])
+  RETURNS BOOLEAN[] AS
+  /* Add many ChainCollapseTransactions in one call.
+
+  Element i of every array are the arguments of one Blockchain.addCCT
+  call, see Blockchain.addGCTBatch.
+
+  Returns:
+  An array where element i is the result of adding transaction i, NULL if
+  the pool was full.
+  */
+  $$
+  DECLARE
+    n INT := COALESCE(array_length(invokers, 1), 0);
+    result BOOLEAN[] := '{}';
+    added BOOLEAN;
+    -- Calls and milliseconds by outcome, counted once at the end
+    counts BIGINT[] := '{0, 0}';
+    spent DOUBLE PRECISION[] := '{0, 0}';
+    lap TIMESTAMPTZ := clock_timestamp();
+    k INT;
+  BEGIN
+    IF (COALESCE(array_length(transaction_times, 1), 0) != n OR
+        COALESCE(array_length(recent_hashes, 1), 0) != n OR
+        COALESCE(array_length(start_users, 1), 0) != n OR
+        COALESCE(array_length(mid_users, 1), 0) != n OR
+        COALESCE(array_length(end_users, 1), 0) != n OR
+        COALESCE(array_length(num_cookies, 1), 0) != n OR
+        COALESCE(array_length(signatures, 1), 0) != n) THEN
+      RAISE EXCEPTION 'Arrays must have the same length.' USING
+        ERRCODE = 'invalid_parameter_value';
+    END IF;
+    FOR i IN 1..n LOOP
+      BEGIN
+        added := Blockchain.insertCCT(invokers[i],
+                                      transaction_times[i],
+                                      recent_hashes[i],
+                                      start_users[i],
+                                      mid_users[i],
+                                      end_users[i],
+                                      num_cookies[i],
+                                      signatures[i]);
+      EXCEPTION WHEN SQLSTATE '45004' THEN
+        -- Pool full, the remaining transactions are not added
+        result := result || array_fill(NULL::BOOLEAN, ARRAY[n - i + 1]);
+        EXIT;
+      END;
+      result := result || added;
+      k := CASE WHEN added THEN 1 ELSE 2 END;
+      counts[k] := counts[k] + 1;
+      spent[k] := spent[k] +
+        extract(epoch FROM clock_timestamp() - lap) * 1000;
+      lap := clock_timestamp();
+    END LOOP;
+    PERFORM Blockchain.recordStats('addCCT', ARRAY['ok', 'no'], counts,
+                                   spent);
+    RETURN result;
+  END
+  $$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION Blockchain.addPCTBatch(
+      invokers TEXT[],
+      others TEXT[],
+      transaction_times DOUBLE PRECISION[],
+      recent_hashes TEXT[],
+      num_cookies INT[],
+      signatures TEXT[])
+  RETURNS BOOLEAN[] AS
+  /* Add many PairCancelTransactions in one call.
+
+  Element i of every array are the arguments of one Blockchain.addPCT
+  call, see Blockchain.addGCTBatch.
+
+  Returns:
+  An array where element i is the result of adding transaction i, NULL if
+  the pool was full.
+  */
+  $$
+  DECLARE
+    n INT := COALESCE(array_length(invokers, 1), 0);
+    result BOOLEAN[] := '{}';
+    added BOOLEAN;
+    -- Calls and milliseconds by outcome, counted once at the end
+    counts BIGINT[] := '{0, 0}';
+    spent DOUBLE PRECISION[] := '{0, 0}';
+    lap TIMESTAMPTZ := clock_timestamp();
+    k INT;
+  BEGIN
+    IF (COALESCE(array_length(others, 1), 0) != n OR
+        COALESCE(array_length(transaction_times, 1), 0) != n OR
+        COALESCE(array_length(recent_hashes, 1), 0) != n OR
+        COALESCE(array_length(num_cookies, 1), 0) != n OR
+        COALESCE(array_length(signatures, 1), 0) != n) THEN
+      RAISE EXCEPTION 'Arrays must have the same length.' USING
+        ERRCODE = 'invalid_parameter_value';
+    END IF;
+    FOR i IN 1..n LOOP
+      BEGIN
+        added := Blockchain.insertPCT(invokers[i],
+                                      others[i],
+                                      transaction_times[i],
+                                      recent_hashes[i],
+                                      num_cookies[i],
+                                      signatures[i]);
+      EXCEPTION WHEN SQLSTATE '45004' THEN
+        -- Pool full, the remaining transactions are not added
+        result := result || array_fill(NULL::BOOLEAN, ARRAY[n - i + 1]);
+        EXIT;
+      END;
+      result := result || added;
+      k := CASE WHEN added THEN 1 ELSE 2 END;
+      counts[k] := counts[k] + 1;
+      spent[k] := spent[k] +
+        extract(epoch FROM clock_timestamp() - lap) * 1000;
+      lap := clock_timestamp();
+    END LOOP;
+    PERFORM Blockchain.recordStats('addPCT', ARRAY['ok', 'no'], counts,
+                                   spent);
+    RETURN result;
+  END
+  $$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION Blockchain.getDebt(sender TEXT, receiver TEXT)
+  RETURNS INT AS
+  /* Return the number of cookies sender owes receiver.
+
+  Arguments:
+  sender: public key of the user owing cookies.
+  receiver: public key of the user owed cookies.
+
+  Returns:
+  The debt, 0 if the pair has no Debt row.
+  */
+  $$
+    SELECT COALESCE((SELECT cookies_owed
+                     FROM Blockchain.Debt
+                     WHERE sender_pubk = sender AND
+                           receiver_pubk = receiver), 0);
+  $$ LANGUAGE sql STABLE SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION Blockchain.changeDebt(sender TEXT,
+                                                 receiver TEXT,
+                                                 delta INT)
+  RETURNS VOID AS
+  /* Add delta to the number of cookies sender owes receiver.
+
+  The Debt row is created when the debt becomes positive and deleted when
+  it drops to 0. A debt going negative violates debt_cookies_owed_check.
+
+  Arguments:
+  sender: public key of the user owing cookies.
+  receiver: public key of the user owed cookies.
+  delta: change in the number of cookies owed.
+  */
+  $$
+  BEGIN
+    DELETE FROM Blockchain.Debt
+     WHERE sender_pubk = sender AND receiver_pubk = receiver AND
+           cookies_owed + delta = 0;
+    IF (NOT FOUND) THEN
+      UPDATE Blockchain.Debt
+         SET cookies_owed = cookies_owed + delta
+       WHERE sender_pubk = sender AND receiver_pubk = receiver;
+      IF (NOT FOUND) THEN
+        INSERT INTO Blockchain.Debt(sender_pubk, receiver_pubk, cookies_owed)
+          VALUES (sender, receiver, delta);
+      END IF;
+    END IF;
   END
   $$ LANGUAGE plpgsql SECURITY DEFINER;
 
@@ -527,9 +895,7 @@ CREATE OR REPLACE FUNCTION Blockchain.executeGCT(tid INT)
     -- Check again to see if the user is still valid
     IF ((SELECT Blockchain.isValidUser(invoker)) AND
         (SELECT Blockchain.IsValidUser(receiver))) THEN
-      UPDATE Blockchain.Debt
-         SET cookies_owed = cookies_owed + num_cookies
-       WHERE sender_pubk = invoker AND receiver_pubk = receiver;
+      PERFORM Blockchain.changeDebt(invoker, receiver, num_cookies);
     ELSE
       RAISE EXCEPTION SQLSTATE '45001' USING
         MESSAGE = 'Users are no longer valid.';
@@ -551,13 +917,8 @@ CREATE OR REPLACE FUNCTION Blockchain.executeRCT(tid INT)
      WHERE rct.id = tid;
     IF ((SELECT Blockchain.isValidUser(invoker)) AND
         (SELECT Blockchain.isValidUser(sender))) THEN
-      IF (num_cookies <= (SELECT cookies_owed
-                          FROM Blockchain.Debt
-                          WHERE sender_pubk = sender AND
-                          receiver_pubk = invoker)) THEN
-        UPDATE Blockchain.Debt
-        SET cookies_owed = cookies_owed - num_cookies
-        WHERE sender_pubk = sender AND receiver_pubk = invoker;
+      IF (num_cookies <= Blockchain.getDebt(sender, invoker)) THEN
+        PERFORM Blockchain.changeDebt(sender, invoker, -num_cookies);
       ELSE
         RAISE EXCEPTION SQLSTATE '45000' USING
           MESSAGE = 'Number of cookies owed is less than cookies received.';
@@ -594,28 +955,14 @@ CREATE OR REPLACE FUNCTION Blockchain.executeCCCT(tid INT)
           (SELECT Blockchain.isValidUser(mid_user)) AND
           (SELECT Blockchain.isValidUser(end_user))) THEN
         -- Check that A owes B (and B owes C) enough cookies
-        IF ((SELECT d1.cookies_owed >= num_cookies AND
-                   d2.cookies_owed >= num_cookies
-            FROM Blockchain.Debt d1, Blockchain.Debt d2
-            WHERE d1.sender_pubk = start_user AND
-                  d1.receiver_pubk = mid_user AND
-                  d2.sender_pubk = mid_user AND
-                  d2.receiver_pubk = end_user)) THEN
+        IF (Blockchain.getDebt(start_user, mid_user) >= num_cookies AND
+            Blockchain.getDebt(mid_user, end_user) >= num_cookies) THEN
           -- Decrement the number of cookies A owes B
-          UPDATE Blockchain.Debt
-          SET cookies_owed = cookies_owed - num_cookies
-          WHERE sender_pubk = start_user AND
-                receiver_pubk = mid_user;
+          PERFORM Blockchain.changeDebt(start_user, mid_user, -num_cookies);
           -- Decrement the number of cookies B owes C
-          UPDATE Blockchain.Debt
-          SET cookies_owed = cookies_owed - num_cookies
-          WHERE sender_pubk = mid_user AND
-                receiver_pubk = end_user;
+          PERFORM Blockchain.changeDebt(mid_user, end_user, -num_cookies);
           -- Increment the number of cookies A owes C
-          UPDATE Blockchain.Debt
-          SET cookies_owed = cookies_owed + num_cookies
-          WHERE sender_pubk = start_user AND
-                receiver_pubk = end_user;
+          PERFORM Blockchain.changeDebt(start_user, end_user, num_cookies);
         ELSE
           RAISE EXCEPTION SQLSTATE '45000' USING
             MESSAGE = 'User(s) does not have enough debt.';
@@ -653,23 +1000,12 @@ CREATE OR REPLACE FUNCTION Blockchain.executeCPCT(tid INT)
       IF ((SELECT Blockchain.isValidUser(user_a)) AND
           (SELECT Blockchain.isValidUser(user_b))) THEN
         -- Check that A owes B (and B owes A) enough cookies
-        IF (SELECT d1.cookies_owed >= num_cookies AND
-                   d2.cookies_owed >= num_cookies
-            FROM Blockchain.Debt d1, Blockchain.Debt d2
-            WHERE d1.sender_pubk = user_a AND
-                  d1.receiver_pubk = user_b AND
-                  d2.sender_pubk = user_b AND
-                  d2.receiver_pubk = user_a) THEN
+        IF (Blockchain.getDebt(user_a, user_b) >= num_cookies AND
+            Blockchain.getDebt(user_b, user_a) >= num_cookies) THEN
           -- Decrement the number of cookies A owes B
-          UPDATE Blockchain.Debt
-          SET cookies_owed = cookies_owed - num_cookies
-          WHERE sender_pubk = user_a AND
-                receiver_pubk = user_b;
-          -- Decrement the number of cookies B owes C
-          UPDATE Blockchain.Debt
-          SET cookies_owed = cookies_owed - num_cookies
-          WHERE sender_pubk = user_b AND
-                receiver_pubk = user_a;
+          PERFORM Blockchain.changeDebt(user_a, user_b, -num_cookies);
+          -- Decrement the number of cookies B owes A
+          PERFORM Blockchain.changeDebt(user_b, user_a, -num_cookies);
         ELSE
           RAISE EXCEPTION SQLSTATE '45000' USING
             MESSAGE = 'User(s) does not have enough debt.';
@@ -687,8 +1023,8 @@ CREATE OR REPLACE FUNCTION Blockchain.executeCPCT(tid INT)
 
 CREATE OR REPLACE FUNCTION Blockchain.executeAUT(tid INT)
   RETURNS VOID AS
-  /* Add a user into the database, then add a debt record for this user
-  and every other users.
+  /* Add a user into the database. Debt rows are only created once the
+  user owes or is owed cookies.
 
   Arguments:
   tid: transaction id of the tid.
@@ -696,22 +1032,12 @@ CREATE OR REPLACE FUNCTION Blockchain.executeAUT(tid INT)
   $$
   DECLARE
     new_pubk TEXT;
-    other_pubk TEXT;
   BEGIN
     SELECT aut.user_pubk INTO new_pubk
       FROM Blockchain.AddUserTransaction aut
       WHERE aut.id = tid;
     -- Create User
     INSERT INTO Blockchain.CookieUser(pubk) VALUES (new_pubk);
-    -- Create debts
-    FOR other_pubk IN SELECT u.pubk
-                      FROM Blockchain.CookieUser u
-                      WHERE u.pubk != new_pubk AND u.valid LOOP
-      INSERT INTO Blockchain.Debt(sender_pubk, receiver_pubk, cookies_owed)
-        VALUES (other_pubk, new_pubk, 0);
-      INSERT INTO Blockchain.Debt(sender_pubk, receiver_pubk, cookies_owed)
-        VALUES (new_pubk, other_pubk, 0);
-    END LOOP;
   END
   $$ LANGUAGE plpgsql SECURITY DEFINER;
 
@@ -741,74 +1067,80 @@ CREATE OR REPLACE FUNCTION Blockchain.executeRUT(tid INT)
   END
   $$ LANGUAGE plpgsql SECURITY DEFINER;
 
-CREATE OR REPLACE FUNCTION Blockchain.commitBlock()
-  RETURNS BOOLEAN AS
-  $$
-  /* Commit every transaction in the pool
+CREATE OR REPLACE FUNCTION Blockchain.commitTransaction(bid INT, tid INT)
+  RETURNS TEXT AS
+  /* Execute a pooled transaction and include it in a block if successful.
+
+  Transactions failing with SQLSTATE 45000 stay in the pool until they are
+  older than PoolConfig.timeout, transactions failing with SQLSTATE 45001
+  are discarded. The caller removes the transaction from the pool, see
+  Blockchain.dropPooled. The caller counts the outcome in Blockchain.Stat.
+
+  Arguments:
+  bid: id of the block being committed.
+  tid: id of the transaction.
 
   Returns:
-  TRUE if a block is committed successfully, FALSE otherwise.
+  'committed', 'postponed', or 'discarded' and 'expired' when the
+  transaction must be deleted.
   */
+  $$
   DECLARE
-    last_hash TEXT;
-    bid INT;
     protocol VARCHAR(4);
-    insert_time TIMESTAMPTZ;
-    tid INT;
-    timeout INTERVAL := INTERVAL '12 hours';
   BEGIN
-
-    SELECT curr_hash INTO last_hash
-      FROM Blockchain.Block ORDER BY id DESC LIMIT 1;
-    -- Create a new block
-    INSERT INTO Blockchain.Block(prev_hash) VALUES (last_hash);
-    SELECT id INTO bid
-      FROM Blockchain.Block
-      ORDER BY id DESC
-      LIMIT 1;
-    -- Add transactions to the new block if successful
-    FOR insert_time, tid IN SELECT p.insert_time, transaction_id
-                            FROM Blockchain.Pool p
-                            ORDER BY p.insert_time LOOP
-      -- Check how long the transaction has been in the pool
-      IF (NOW() - insert_time > timeout) THEN
-        DELETE FROM Blockchain.Pool WHERE transaction_id = tid;
-        CONTINUE;
+    -- Obtain protocol
+    SELECT t.protocol INTO protocol
+      FROM Blockchain.Transaction t
+      WHERE t.id = tid;
+    BEGIN -- Execute code based on protocol
+      IF (protocol = 'gct') THEN
+        PERFORM Blockchain.executeGCT(tid);
+      ELSEIF (protocol = 'rct') THEN
+        PERFORM Blockchain.executeRCT(tid);
+      ELSEIF (protocol = 'ccct') THEN
+        PERFORM Blockchain.executeCCCT(tid);
+      ELSEIF (protocol = 'cpct') THEN
+        PERFORM Blockchain.executeCPCT(tid);
+      ELSEIF (protocol = 'aut') THEN
+        PERFORM Blockchain.executeAUT(tid);
+      ELSEIF (protocol = 'rut') THEN
+        PERFORM Blockchain.executeRUT(tid);
       END IF;
-      -- Obtain protocol
-      SELECT t.protocol INTO protocol
-        FROM Blockchain.Transaction t
-        WHERE t.id = tid;
-      BEGIN -- Execute code based on protocol
-        IF (protocol = 'gct') THEN
-          PERFORM Blockchain.executeGCT(tid);
-        ELSEIF (protocol = 'rct') THEN
-          PERFORM Blockchain.executeRCT(tid);
-        ELSEIF (protocol = 'ccct') THEN
-          PERFORM Blockchain.executeCCCT(tid);
-        ELSEIF (protocol = 'cpct') THEN
-          PERFORM Blockchain.executeCPCT(tid);
-        ELSEIF (protocol = 'aut') THEN
-          PERFORM Blockchain.executeAUT(tid);
-        ELSEIF (protocol = 'rut') THEN
-          PERFORM Blockchain.executeRUT(tid);
+      -- Insert transaction into the block
+      INSERT INTO Blockchain.IncludeTransaction(block, transaction_id)
+        VALUES (bid, tid);
+      RETURN 'committed';
+    EXCEPTION
+      -- 45001 must come first: a SQLSTATE ending in 000 names a class, so
+      -- '45000' also matches every 45xxx state.
+      WHEN SQLSTATE '45001' THEN -- Discard transaction
+        RETURN 'discarded';
+      WHEN SQLSTATE '45000' THEN
+        IF ((SELECT timeout FROM Blockchain.PoolConfig) <
+            (SELECT NOW() - p.insert_time
+               FROM Blockchain.Pool p
+              WHERE p.transaction_id = tid)) THEN
+          RETURN 'expired';
         END IF;
-        -- Insert transaction into the block
-        INSERT INTO Blockchain.IncludeTransaction(block, transaction_id)
-          VALUES (bid, tid);
-        -- Remove transaction from pool
-        DELETE FROM Blockchain.Pool WHERE transaction_id = tid;
-      EXCEPTION
-        WHEN SQLSTATE '45000' THEN
-          IF (INTERVAL '12 hours' < (SELECT NOW() - p.insert_time
-                                     FROM Blockchain.Pool p
-                                     WHERE p.transaction_id = tid)) THEN
-            DELETE FROM Blockchain.Transaction WHERE id = tid;
-          END IF;
-        WHEN SQLSTATE '45001' THEN -- Discard transaction
-          DELETE FROM Blockchain.Transaction WHERE id = tid;
-      END;
-    END LOOP;
+        RETURN 'postponed';
+    END;
+  END
+  $$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION Blockchain.sealBlock(bid INT)
+  RETURNS BOOLEAN AS
+  /* Store the plaintext and hash of a block, or delete it if it is empty.
+
+  Arguments:
+  bid: id of the block being committed.
+
+  Returns:
+  TRUE if the block includes any transaction, FALSE otherwise.
+  */
+  $$
+  DECLARE
+    started TIMESTAMPTZ;
+  BEGIN
     -- Check if any transaction is submitted, rollback if none.
     IF (NOT EXISTS (SELECT * FROM Blockchain.IncludeTransaction
                 WHERE block = bid)) THEN
@@ -816,14 +1148,378 @@ CREATE OR REPLACE FUNCTION Blockchain.commitBlock()
       DELETE FROM Blockchain.Block WHERE id = bid;
       RETURN FALSE;
     END IF;
+    -- Format the block once, the plaintext is hashed and served as is
+    UPDATE Blockchain.Block
+      SET plaintext = Blockchain.getFormattedBlock(bid)
+    WHERE id = bid;
     -- Calculate block's curr_hash
+    started := clock_timestamp();
     UPDATE Blockchain.Block
       SET curr_hash = Blockchain.generateCurrHash(bid)
     WHERE id = bid;
+    PERFORM Blockchain.recordStat('generateCurrHash', 'ok', started);
     RETURN TRUE;
   END
   $$ LANGUAGE plpgsql SECURITY DEFINER;
 
+CREATE OR REPLACE FUNCTION Blockchain.dropPooled(bid INT, dropped INT[],
+                                                 postponed INT[])
+  RETURNS VOID AS
+  /* Remove the transactions handled by a commit from the pool.
+
+  Called once at the end of a commit: every DELETE on the pool updates the
+  PoolSize row of the committer, which stays locked until the commit ends
+  and blocks the submitters sharing it.
+
+  Arguments:
+  bid: id of the block being committed.
+  dropped: ids of the discarded and expired transactions, deleted.
+  postponed: ids of the transactions left in the pool, marked attempted.
+  */
+  $$
+  BEGIN
+    UPDATE Blockchain.Pool p SET attempted = TRUE
+     WHERE p.transaction_id = ANY(postponed) AND NOT p.attempted;
+    DELETE FROM Blockchain.Pool p
+     WHERE p.transaction_id = ANY(dropped) OR
+           p.transaction_id IN (SELECT i.transaction_id
+                                  FROM Blockchain.IncludeTransaction i
+                                 WHERE i.block = bid);
+    DELETE FROM Blockchain.Transaction WHERE id = ANY(dropped);
+    PERFORM Blockchain.expirePool();
+  END
+  $$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION Blockchain.expirePool()
+  RETURNS INT AS
+  /* Drop the transactions pooled for longer than PoolConfig.timeout.
+
+  Expired transactions are found by a range scan of pool_insert_time_idx
+  and deleted in one statement, so the cost follows the number of expired
+  transactions and not the size of the pool. Called at the end of each
+  commit, and by the commit scheduler of the server between commits.
+
+  Returns:
+  The number of transactions dropped.
+  */
+  $$
+  DECLARE
+    started TIMESTAMPTZ := clock_timestamp();
+    expiry TIMESTAMPTZ := NOW() - (SELECT timeout
+                                     FROM Blockchain.PoolConfig);
+    dropped INT;
+  BEGIN
+    DELETE FROM Blockchain.Pool p WHERE p.insert_time < expiry;
+    GET DIAGNOSTICS dropped = ROW_COUNT;
+    PERFORM Blockchain.recordStat('expirePool', 'expired', started,
+                                  dropped);
+    RETURN dropped;
+  END
+  $$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION Blockchain.getPoolState(
+  OUT pool_size BIGINT, OUT oldest_age DOUBLE PRECISION,
+  OUT pending_size BIGINT, OUT pending_age DOUBLE PRECISION) AS
+  /* Return the size of the pool and the age of its oldest transaction.
+
+  The size is the sum of PoolSize and the oldest transaction is the first
+  entry of pool_insert_time_idx, so this does not scan the pool. Pending
+  transactions are the ones a commit has not left in the pool yet, such as
+  incomplete ccct and cpct or a rct before its gct, read from
+  pool_pending_idx: only they can make the next commit differ from the
+  last one.
+
+  Returns:
+  pool_size: number of pooled transactions.
+  oldest_age: seconds since the oldest transaction was pooled, NULL if the
+    pool is empty.
+  pending_size: number of pending transactions.
+  pending_age: seconds since the oldest pending transaction was pooled,
+    NULL if there is none.
+  */
+  $$
+    SELECT (SELECT COALESCE(sum(size), 0)::BIGINT FROM Blockchain.PoolSize),
+           (SELECT extract(epoch FROM clock_timestamp() - min(insert_time))
+                     ::DOUBLE PRECISION
+              FROM Blockchain.Pool),
+           pending.size,
+           pending.age
+      FROM (SELECT count(*) AS size,
+                   extract(epoch FROM clock_timestamp() - min(insert_time))
+                     ::DOUBLE PRECISION AS age
+              FROM Blockchain.Pool
+             WHERE NOT attempted) pending;
+  $$ LANGUAGE sql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION Blockchain.commitBlock()
+  RETURNS BOOLEAN AS
+  $$
+  /* Commit every transaction in the pool
+
+  Returns:
+  TRUE if a block is committed successfully, FALSE otherwise.
+  */
+  DECLARE
+    started TIMESTAMPTZ := clock_timestamp();
+    last_hash TEXT;
+    bid INT;
+    expiry TIMESTAMPTZ := NOW() - (SELECT timeout
+                                     FROM Blockchain.PoolConfig);
+    tid INT;
+    outcome TEXT;
+    dropped INT[] := '{}';
+    postponed INT[] := '{}';
+    -- Calls and milliseconds of commitTransaction by outcome, counted once
+    -- at the end
+    outcomes TEXT[] := ARRAY['committed', 'postponed', 'discarded',
+                             'expired'];
+    counts BIGINT[] := '{0, 0, 0, 0}';
+    spent DOUBLE PRECISION[] := '{0, 0, 0, 0}';
+    lap TIMESTAMPTZ;
+    k INT;
+    committed BOOLEAN;
+  BEGIN
+
+    SELECT curr_hash INTO last_hash
+      FROM Blockchain.Block ORDER BY id DESC LIMIT 1;
+    -- Create a new block
+    INSERT INTO Blockchain.Block(prev_hash) VALUES (last_hash)
+      RETURNING id INTO bid;
+    -- Add transactions to the new block if successful, expired ones are
+    -- dropped by expirePool
+    lap := clock_timestamp();
+    FOR tid IN SELECT transaction_id
+                 FROM Blockchain.Pool p
+                WHERE p.insert_time >= expiry
+                ORDER BY p.insert_time, p.transaction_id LOOP
+      outcome := Blockchain.commitTransaction(bid, tid);
+      IF outcome = 'postponed' THEN
+        postponed := postponed || tid;
+      ELSEIF outcome <> 'committed' THEN
+        dropped := dropped || tid;
+      END IF;
+      k := array_position(outcomes, outcome);
+      counts[k] := counts[k] + 1;
+      spent[k] := spent[k] +
+        extract(epoch FROM clock_timestamp() - lap) * 1000;
+      lap := clock_timestamp();
+    END LOOP;
+    committed := Blockchain.sealBlock(bid);
+    PERFORM Blockchain.dropPooled(bid, dropped, postponed);
+    PERFORM Blockchain.recordStats('commitTransaction', outcomes, counts,
+                                   spent);
+    PERFORM Blockchain.recordStat(
+      'commitBlock', CASE WHEN committed THEN 'block' ELSE 'empty' END,
+      started);
+    RETURN committed;
+  END
+  $$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION Blockchain.commitBlockBatch()
+  RETURNS BOOLEAN AS
+  $$
+  /* Commit every transaction in the pool, applying debts in bulk.
+
+  The result is the same as commitBlock. A pooled gct, rct, ccct or cpct
+  cannot fail if its users are valid, it is complete, and the debt of
+  each pair it changes never goes negative when every pooled transaction
+  on that pair is applied in insert_time order. Those transactions are
+  applied with one aggregated UPDATE of Debt. The others, and every
+  transaction sharing a debt pair with them, are committed one by one
+  by commitTransaction in insert_time order.
+
+  Returns:
+  TRUE if a block is committed successfully, FALSE otherwise.
+  */
+  DECLARE
+    started TIMESTAMPTZ := clock_timestamp();
+    applied TIMESTAMPTZ;
+    last_hash TEXT;
+    bid INT;
+    expiry TIMESTAMPTZ := NOW() - (SELECT timeout
+                                     FROM Blockchain.PoolConfig);
+    tid INT;
+    fast_ids INT[];
+    outcome TEXT;
+    dropped INT[] := '{}';
+    postponed INT[] := '{}';
+    -- Calls and milliseconds of commitTransaction by outcome, counted once
+    -- at the end
+    outcomes TEXT[] := ARRAY['committed', 'postponed', 'discarded',
+                             'expired'];
+    counts BIGINT[] := '{0, 0, 0, 0}';
+    spent DOUBLE PRECISION[] := '{0, 0, 0, 0}';
+    lap TIMESTAMPTZ;
+    k INT;
+    committed BOOLEAN;
+  BEGIN
+    SELECT curr_hash INTO last_hash
+      FROM Blockchain.Block ORDER BY id DESC LIMIT 1;
+    -- Create a new block
+    INSERT INTO Blockchain.Block(prev_hash) VALUES (last_hash)
+      RETURNING id INTO bid;
+    -- Find the transactions that cannot fail, expired ones are dropped by
+    -- expirePool
+    applied := clock_timestamp();
+    WITH RECURSIVE pooled AS (
+      SELECT p.transaction_id, p.insert_time, t.protocol
+        FROM Blockchain.Pool p
+        JOIN Blockchain.Transaction t ON (t.id = p.transaction_id)
+       WHERE p.insert_time >= expiry
+    ), delta AS (
+      -- Probe DebtDelta per pooled transaction instead of scanning it
+      SELECT d.*, pooled.insert_time
+        FROM pooled
+        CROSS JOIN LATERAL (
+          SELECT *
+            FROM Blockchain.DebtDelta d
+           WHERE d.transaction_id = pooled.transaction_id
+          OFFSET 0) d
+    ), removed AS (
+      SELECT rut.user_pubk
+        FROM pooled
+        JOIN Blockchain.RemoveUserTransaction rut
+          ON (rut.id = pooled.transaction_id)
+    ), balance AS (
+      -- Debt of the pair after each transaction if none of them fail
+      SELECT delta.transaction_id,
+             COALESCE(debt.cookies_owed, 0) +
+               SUM(delta.cookies_delta)
+                 OVER (PARTITION BY delta.sender_pubk, delta.receiver_pubk
+                       ORDER BY delta.insert_time, delta.transaction_id)
+               AS cookies_owed
+        FROM delta
+        LEFT JOIN Blockchain.Debt debt
+          ON (debt.sender_pubk = delta.sender_pubk AND
+              debt.receiver_pubk = delta.receiver_pubk)
+    ), unsafe AS (
+      SELECT transaction_id
+        FROM pooled
+       WHERE protocol NOT IN ('gct', 'rct', 'ccct', 'cpct')
+      UNION
+      SELECT ccct.id
+        FROM pooled
+        JOIN Blockchain.CombinedChainCollapseTransaction ccct
+          ON (ccct.id = pooled.transaction_id)
+       WHERE start_user_transaction IS NULL OR
+             mid_user_transaction IS NULL OR
+             end_user_transaction IS NULL
+      UNION
+      SELECT cpct.id
+        FROM pooled
+        JOIN Blockchain.CombinedPairCancelTransaction cpct
+          ON (cpct.id = pooled.transaction_id)
+       WHERE user_a_transaction IS NULL OR
+             user_b_transaction IS NULL
+      UNION
+      SELECT delta.transaction_id
+        FROM delta
+        LEFT JOIN Blockchain.CookieUser s ON (s.pubk = delta.sender_pubk)
+        LEFT JOIN Blockchain.CookieUser r ON (r.pubk = delta.receiver_pubk)
+       WHERE s.valid IS NOT TRUE OR
+             r.valid IS NOT TRUE OR
+             delta.sender_pubk IN (SELECT user_pubk FROM removed) OR
+             delta.receiver_pubk IN (SELECT user_pubk FROM removed)
+      UNION
+      SELECT transaction_id
+        FROM balance
+       WHERE cookies_owed < 0
+    ), slow(transaction_id) AS (
+      -- Every transaction sharing a debt pair with a slow transaction
+      SELECT transaction_id FROM unsafe
+      UNION
+      SELECT d2.transaction_id
+        FROM slow
+        JOIN delta d1 USING (transaction_id)
+        JOIN delta d2
+          ON (d2.sender_pubk = d1.sender_pubk AND
+              d2.receiver_pubk = d1.receiver_pubk)
+    )
+    SELECT COALESCE(array_agg(transaction_id), '{}') INTO fast_ids
+      FROM pooled
+     WHERE transaction_id NOT IN (SELECT transaction_id FROM slow);
+    -- Apply the net debt change of each pair at once: settled pairs are
+    -- deleted, other existing pairs updated and new pairs inserted
+    WITH net AS (
+      SELECT sender_pubk, receiver_pubk, SUM(cookies_delta) AS cookies_delta
+        FROM Blockchain.DebtDelta
+       WHERE transaction_id = ANY(fast_ids)
+       GROUP BY sender_pubk, receiver_pubk
+      HAVING SUM(cookies_delta) != 0
+    ), settled AS (
+      DELETE FROM Blockchain.Debt debt
+       USING net
+       WHERE debt.sender_pubk = net.sender_pubk AND
+             debt.receiver_pubk = net.receiver_pubk AND
+             debt.cookies_owed + net.cookies_delta = 0
+    ), changed AS (
+      UPDATE Blockchain.Debt debt
+         SET cookies_owed = debt.cookies_owed + net.cookies_delta
+        FROM net
+       WHERE debt.sender_pubk = net.sender_pubk AND
+             debt.receiver_pubk = net.receiver_pubk AND
+             debt.cookies_owed + net.cookies_delta != 0
+    )
+    INSERT INTO Blockchain.Debt(sender_pubk, receiver_pubk, cookies_owed)
+      SELECT net.sender_pubk, net.receiver_pubk, net.cookies_delta
+        FROM net
+       WHERE NOT EXISTS (SELECT 1
+                           FROM Blockchain.Debt debt
+                          WHERE debt.sender_pubk = net.sender_pubk AND
+                                debt.receiver_pubk = net.receiver_pubk);
+    INSERT INTO Blockchain.IncludeTransaction(block, transaction_id)
+      SELECT bid, unnest(fast_ids);
+    PERFORM Blockchain.recordStat('commitTransaction', 'bulk', applied,
+                                  COALESCE(array_length(fast_ids, 1), 0));
+    -- Commit the remaining transactions one by one
+    lap := clock_timestamp();
+    FOR tid IN SELECT transaction_id
+                 FROM Blockchain.Pool p
+                WHERE p.insert_time >= expiry AND
+                      p.transaction_id <> ALL(fast_ids)
+                ORDER BY p.insert_time, p.transaction_id LOOP
+      outcome := Blockchain.commitTransaction(bid, tid);
+      IF outcome = 'postponed' THEN
+        postponed := postponed || tid;
+      ELSEIF outcome <> 'committed' THEN
+        dropped := dropped || tid;
+      END IF;
+      k := array_position(outcomes, outcome);
+      counts[k] := counts[k] + 1;
+      spent[k] := spent[k] +
+        extract(epoch FROM clock_timestamp() - lap) * 1000;
+      lap := clock_timestamp();
+    END LOOP;
+    committed := Blockchain.sealBlock(bid);
+    PERFORM Blockchain.dropPooled(bid, dropped, postponed);
+    PERFORM Blockchain.recordStats('commitTransaction', outcomes, counts,
+                                   spent);
+    PERFORM Blockchain.recordStat(
+      'commitBlockBatch', CASE WHEN committed THEN 'block' ELSE 'empty' END,
+      started);
+    RETURN committed;
+  END
+  $$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION Blockchain.commitPool()
+  RETURNS INT AS
+  $$
+  /* Commit the pool with Blockchain.commitBlockBatch.
+
+  Returns:
+  The number of transactions in the committed block, 0 if no block is
+  committed.
+  */
+  BEGIN
+    IF NOT Blockchain.commitBlockBatch() THEN
+      RETURN 0;
+    END IF;
+    RETURN (SELECT count(*)
+              FROM Blockchain.IncludeTransaction i
+             WHERE i.block = (SELECT max(id) FROM Blockchain.Block));
+  END
+  $$ LANGUAGE plpgsql SECURITY DEFINER;
+
 CREATE OR REPLACE FUNCTION Blockchain.getBlockchain(last_hash TEXT)
   RETURNS TEXT AS
   /* Return all transaction ids and protocols up to "hash"
@@ -849,8 +1545,9 @@ CREATE OR REPLACE FUNCTION Blockchain.getBlockchain(last_hash TEXT)
       FROM Blockchain.Block
       WHERE curr_hash = last_hash;
     RETURN (SELECT string_agg(TRIM(trailing E'\n' FROM
-                              Blockchain.getFormattedBlock(id)),
-                              E'\n') ||
+                                   COALESCE(plaintext,
+                                            Blockchain.getFormattedBlock(id))),
+                              E'\n' ORDER BY id) ||
                    (SELECT E'\n' || E'head\t' || curr_hash FROM Blockchain.Block
                    ORDER BY id desc LIMIT 1)
             FROM Blockchain.Block
@@ -903,7 +1600,41 @@ GRANT EXECUTE ON FUNCTION Blockchain.addGCT(invoker TEXT,
                                             recent_hash TEXT,
                                             num_cookies INT,
                                             signature TEXT),
+                          Blockchain.addGCTBatch(invokers TEXT[],
+                                 transaction_times DOUBLE PRECISION[],
+                                 receivers TEXT[],
+                                 recent_hashes TEXT[],
+                                 num_cookies INT[],
+                                 reasons VARCHAR(100)[],
+                                 signatures TEXT[]),
+                          Blockchain.addRCTBatch(invokers TEXT[],
+                                 transaction_times DOUBLE PRECISION[],
+                                 senders TEXT[],
+                                 recent_hashes TEXT[],
+                                 num_cookies INT[],
+                                 cookie_types VARCHAR(100)[],
+                                 signatures TEXT[]),
+                          Blockchain.addCCTBatch(invokers TEXT[],
+                                 transaction_times DOUBLE PRECISION[],
+                                 recent_hashes TEXT[],
+                                 start_users TEXT[],
+                                 mid_users TEXT[],
+                                 end_users TEXT[],
+                                 num_cookies INT[],
+                                 signatures TEXT[]),
+                          Blockchain.addPCTBatch(invokers TEXT[],
+                                 others TEXT[],
+                                 transaction_times DOUBLE PRECISION[],
+                                 recent_hashes TEXT[],
+                                 num_cookies INT[],
+                                 signatures TEXT[]),
                           Blockchain.commitBlock(),
+                          Blockchain.commitBlockBatch(),
+                          Blockchain.commitPool(),
+                          Blockchain.expirePool(),
+                          Blockchain.getPoolState(),
+                          Blockchain.getStats(),
+                          Blockchain.getDebt(sender TEXT, receiver TEXT),
                           Blockchain.getBlockchain(last_hash TEXT)
               TO mc_server;
 COMMIT;
@@ -18,25 +18,45 @@ CREATE TABLE IF NOT EXISTS Blockchain.CookieUser (
 CREATE TABLE IF NOT EXISTS Blockchain.Transaction (
   /* Generic transaction class.
 
+  Each subclass table references (id, protocol) and fixes its protocol, so
+  a transaction can only have a row in the subclass named by its protocol.
+
   Constraints:
     transaction_protocol_check: Check that protocol is recognized
+    transaction_id_protocol_key: Referenced by the subclass tables.
   */
   id SERIAL PRIMARY KEY,
   protocol VARCHAR(5) NOT NULL,
   CONSTRAINT transaction_protocol_check CHECK (protocol IN
-    ('gct', 'rct', 'cct', 'ccct', 'pct', 'cpct', 'aut', 'rut'))
+    ('gct', 'rct', 'cct', 'ccct', 'pct', 'cpct', 'aut', 'rut')),
+  CONSTRAINT transaction_id_protocol_key UNIQUE (id, protocol)
 );
 
 CREATE TABLE IF NOT EXISTS Blockchain.Block (
   /* Represents a block in the blockchain.
 
-  Triggers:
-    block_prev_hash_fkey: Check that prev_hash is either all 0s or references
-      the previous curr_hash.
+  plaintext is the formatted block that curr_hash is computed from, stored
+  once when the block is committed so it can be served without being
+  formatted again.
+
+  Constraints:
+    block_prev_hash_fkey: prev_hash references the curr_hash of a block.
+    block_prev_hash_key: A block is the previous block of at most one
+      block, so blocks form a single chain and a new block must follow the
+      last one.
+    block_genesis_check: Only the genesis block has a NULL prev_hash.
   */
   id SERIAL PRIMARY KEY,
   curr_hash TEXT UNIQUE,
-  prev_hash TEXT
+  prev_hash TEXT,
+  plaintext TEXT,
+  CONSTRAINT block_prev_hash_fkey FOREIGN KEY (prev_hash)
+    REFERENCES Blockchain.Block(curr_hash),
+  CONSTRAINT block_prev_hash_key UNIQUE (prev_hash),
+  CONSTRAINT block_genesis_check CHECK (
+    (prev_hash IS NULL) =
+    (curr_hash IS NOT DISTINCT FROM
+     'GENESIS/BLOCK/=============================='))
 );
 
 CREATE TABLE IF NOT EXISTS Blockchain.GiveCookieTransaction (
@@ -46,12 +66,14 @@ CREATE TABLE IF NOT EXISTS Blockchain.GiveCookieTransaction (
     gct_invoker_ttime_key: Ensure no duplicated transaction.
     gct_num_cookies_check: Number of cookies cannot be 0 or negative.
     gct_invoker_receiver_check: invoker cannot be the same as receiver.
+    gct_protocol_check: protocol is gct.
+    gct_transaction_fkey: References the transaction with this id and
+      protocol, so it is not of another subclass.
   Trigger:
-    gct_protocol_check: Ensure all transactions are mutually exclusive.
     gct_user_check: Ensure all users are valid.
   */
-  id INT PRIMARY KEY REFERENCES Blockchain.Transaction(id)
-    ON DELETE CASCADE ON UPDATE CASCADE,
+  id INT PRIMARY KEY,
+  protocol VARCHAR(5) NOT NULL DEFAULT 'gct',
   invoker TEXT REFERENCES Blockchain.CookieUser(pubk) NOT NULL,
   transaction_time TIMESTAMPTZ NOT NULL,
   receiver TEXT REFERENCES Blockchain.CookieUser(pubk) NOT NULL,
@@ -66,7 +88,11 @@ CREATE TABLE IF NOT EXISTS Blockchain.GiveCookieTransaction (
   CONSTRAINT gct_num_cookies_check CHECK (num_cookies > 0),
   CONSTRAINT gct_invoker_receiver_check CHECK (invoker != receiver),
   CONSTRAINT gct_transaction_time_check
-    CHECK (NOW() - transaction_time < INTERVAL '1 hour')
+    CHECK (NOW() - transaction_time < INTERVAL '1 hour'),
+  CONSTRAINT gct_protocol_check CHECK (protocol = 'gct'),
+  CONSTRAINT gct_transaction_fkey FOREIGN KEY (id, protocol)
+    REFERENCES Blockchain.Transaction(id, protocol)
+    ON DELETE CASCADE ON UPDATE CASCADE
 );
 
 CREATE TABLE IF NOT EXISTS Blockchain.ReceiveCookieTransaction (
@@ -75,13 +101,15 @@ CREATE TABLE IF NOT EXISTS Blockchain.ReceiveCookieTransaction (
   Constraints:
     rct_invoker_ttime_key: Ensure no duplicated transaction.
     rct_num_cookies_check: Number of cookies cannot be 0 or negative.
+    rct_protocol_check: protocol is rct.
+    rct_transaction_fkey: References the transaction with this id and
+      protocol, so it is not of another subclass.
   Trigger:
-    rct_protocol_check: Ensure all transactions are mutually exclusive.
     rct_user_check: Ensure all users are valid.
     rct_invoker_sender_check: Invoker cannot be the same as sender.
   */
-  id INT PRIMARY KEY REFERENCES Blockchain.Transaction(id)
-    ON DELETE CASCADE ON UPDATE CASCADE,
+  id INT PRIMARY KEY,
+  protocol VARCHAR(5) NOT NULL DEFAULT 'rct',
   invoker TEXT REFERENCES Blockchain.CookieUser(pubk) NOT NULL,
   transaction_time TIMESTAMPTZ NOT NULL,
   sender TEXT REFERENCES Blockchain.CookieUser(pubk) NOT NULL,
@@ -96,7 +124,11 @@ CREATE TABLE IF NOT EXISTS Blockchain.ReceiveCookieTransaction (
   CONSTRAINT rct_num_cookies_check CHECK (num_cookies > 0),
   CONSTRAINT rct_invoker_sender_check CHECK (invoker != sender),
   CONSTRAINT gct_transaction_time_check
-    CHECK (NOW() - transaction_time < INTERVAL '1 hour')
+    CHECK (NOW() - transaction_time < INTERVAL '1 hour'),
+  CONSTRAINT rct_protocol_check CHECK (protocol = 'rct'),
+  CONSTRAINT rct_transaction_fkey FOREIGN KEY (id, protocol)
+    REFERENCES Blockchain.Transaction(id, protocol)
+    ON DELETE CASCADE ON UPDATE CASCADE
 );
 
 CREATE TABLE IF NOT EXISTS Blockchain.ChainCollapseTransaction (
@@ -104,12 +136,14 @@ CREATE TABLE IF NOT EXISTS Blockchain.ChainCollapseTransaction (
 
   Constraints:
     cct_invoker_ttime_key: Ensure no duplicated transaction.
+    cct_protocol_check: protocol is cct.
+    cct_transaction_fkey: References the transaction with this id and
+      protocol, so it is not of another subclass.
   Trigger:
-    cct_protocol_check: Ensure all transactions are mutually exclusive.
     cct_user_check: Ensure all users are valid.
   */
-  id INT PRIMARY KEY REFERENCES Blockchain.Transaction(id)
-    ON DELETE CASCADE ON UPDATE CASCADE,
+  id INT PRIMARY KEY,
+  protocol VARCHAR(5) NOT NULL DEFAULT 'cct',
   invoker TEXT REFERENCES Blockchain.CookieUser(pubk) NOT NULL,
   transaction_time TIMESTAMPTZ NOT NULL,
   recent_block INT REFERENCES Blockchain.Block(id)
@@ -118,7 +152,11 @@ CREATE TABLE IF NOT EXISTS Blockchain.ChainCollapseTransaction (
   -- Primary key
   CONSTRAINT cct_invoker_ttime_key UNIQUE(invoker, transaction_time),
   CONSTRAINT gct_transaction_time_check
-    CHECK (NOW() - transaction_time < INTERVAL '1 hour')
+    CHECK (NOW() - transaction_time < INTERVAL '1 hour'),
+  CONSTRAINT cct_protocol_check CHECK (protocol = 'cct'),
+  CONSTRAINT cct_transaction_fkey FOREIGN KEY (id, protocol)
+    REFERENCES Blockchain.Transaction(id, protocol)
+    ON DELETE CASCADE ON UPDATE CASCADE
 );
 
 CREATE TABLE IF NOT EXISTS Blockchain.CombinedChainCollapseTransaction (
@@ -127,14 +165,16 @@ CREATE TABLE IF NOT EXISTS Blockchain.CombinedChainCollapseTransaction (
   Constraints:
     ccct_num_cookies_check: Number of cookies cannot be 0 or negative.
     ccct_user_check: All three users are different.
+    ccct_protocol_check: protocol is ccct.
+    ccct_transaction_fkey: References the transaction with this id and
+      protocol, so it is not of another subclass.
   Trigger:
-    ccct_protocol_check: Ensure all transactions are mutually exclusive.
     ccct_user_check: Ensure all users are valid.
     ccct_individual_transaction_check: Ensure all sub-transactions are from
       expected users.
   */
-  id INT PRIMARY KEY REFERENCES Blockchain.Transaction(id)
-    ON DELETE CASCADE ON UPDATE CASCADE,
+  id INT PRIMARY KEY,
+  protocol VARCHAR(5) NOT NULL DEFAULT 'ccct',
   start_user TEXT REFERENCES Blockchain.CookieUser(pubk) NOT NULL,
   mid_user TEXT REFERENCES Blockchain.CookieUser(pubk) NOT NULL,
   end_user TEXT REFERENCES Blockchain.CookieUser(pubk) NOT NULL,
@@ -149,7 +189,11 @@ CREATE TABLE IF NOT EXISTS Blockchain.CombinedChainCollapseTransaction (
   CONSTRAINT ccct_num_cookies_check CHECK (num_cookies > 0),
   CONSTRAINT ccct_user_check CHECK (start_user != mid_user AND
                                     mid_user != end_user AND
-                                    start_user != end_user)
+                                    start_user != end_user),
+  CONSTRAINT ccct_protocol_check CHECK (protocol = 'ccct'),
+  CONSTRAINT ccct_transaction_fkey FOREIGN KEY (id, protocol)
+    REFERENCES Blockchain.Transaction(id, protocol)
+    ON DELETE CASCADE ON UPDATE CASCADE
 );
 
 CREATE TABLE IF NOT EXISTS Blockchain.PairCancelTransaction (
@@ -157,12 +201,14 @@ CREATE TABLE IF NOT EXISTS Blockchain.PairCancelTransaction (
 
   Constraints:
     pct_invoker_ttime_key: Ensure no duplicated transaction.
+    pct_protocol_check: protocol is pct.
+    pct_transaction_fkey: References the transaction with this id and
+      protocol, so it is not of another subclass.
   Trigger:
-    pct_protocol_check: Ensure all transactions are mutually exclusive.
     pct_user_check: Ensure all users are valid.
   */
-  id INT PRIMARY KEY REFERENCES Blockchain.Transaction(id)
-    ON DELETE CASCADE ON UPDATE CASCADE,
+  id INT PRIMARY KEY,
+  protocol VARCHAR(5) NOT NULL DEFAULT 'pct',
   invoker TEXT REFERENCES Blockchain.CookieUser(pubk) NOT NULL,
   transaction_time TIMESTAMPTZ NOT NULL,
   recent_block INT REFERENCES Blockchain.Block(id)
@@ -171,7 +217,11 @@ CREATE TABLE IF NOT EXISTS Blockchain.PairCancelTransaction (
   -- Constraints
   CONSTRAINT pct_invoker_ttime_key UNIQUE(invoker, transaction_time),
   CONSTRAINT gct_transaction_time_check
-    CHECK (NOW() - transaction_time < INTERVAL '1 hour')
+    CHECK (NOW() - transaction_time < INTERVAL '1 hour'),
+  CONSTRAINT pct_protocol_check CHECK (protocol = 'pct'),
+  CONSTRAINT pct_transaction_fkey FOREIGN KEY (id, protocol)
+    REFERENCES Blockchain.Transaction(id, protocol)
+    ON DELETE CASCADE ON UPDATE CASCADE
 );
 
 CREATE TABLE IF NOT EXISTS Blockchain.CombinedPairCancelTransaction (
@@ -180,14 +230,16 @@ CREATE TABLE IF NOT EXISTS Blockchain.CombinedPairCancelTransaction (
   Constraints:
     cpct_num_cookies_check: Number of cookies cannot be 0 or negative.
     cpct_user_check: User a and b are different
+    cpct_protocol_check: protocol is cpct.
+    cpct_transaction_fkey: References the transaction with this id and
+      protocol, so it is not of another subclass.
   Trigger:
-    cpct_protocol_check: Ensure all transactions are mutually exclusive.
     cpct_user_check: Ensure all users are valid.
     cpct_individual_transaction_check: Ensure all sub-transactions are from
       expected users.
   */
-  id INT PRIMARY KEY REFERENCES Blockchain.Transaction(id)
-    ON DELETE CASCADE ON UPDATE CASCADE,
+  id INT PRIMARY KEY,
+  protocol VARCHAR(5) NOT NULL DEFAULT 'cpct',
   user_a_transaction INT REFERENCES Blockchain.PairCancelTransaction(id),
   user_b_transaction INT REFERENCES Blockchain.PairCancelTransaction(id),
   user_a TEXT REFERENCES Blockchain.CookieUser(pubk),
@@ -195,31 +247,47 @@ CREATE TABLE IF NOT EXISTS Blockchain.CombinedPairCancelTransaction (
   num_cookies INT NOT NULL,
   -- Constraints
   CONSTRAINT cpct_num_cookies_check CHECK (num_cookies > 0),
-  CONSTRAINT cpct_user_check CHECK (user_a != user_b)
+  CONSTRAINT cpct_user_check CHECK (user_a != user_b),
+  CONSTRAINT cpct_protocol_check CHECK (protocol = 'cpct'),
+  CONSTRAINT cpct_transaction_fkey FOREIGN KEY (id, protocol)
+    REFERENCES Blockchain.Transaction(id, protocol)
+    ON DELETE CASCADE ON UPDATE CASCADE
 );
 
 CREATE TABLE IF NOT EXISTS Blockchain.AddUserTransaction (
   /* Represents a au transaction.
 
-  Trigger:
-    aut_protocol_check: Ensure all transactions are mutually exclusive.
+  Constraints:
+    aut_protocol_check: protocol is aut.
+    aut_transaction_fkey: References the transaction with this id and
+      protocol, so it is not of another subclass.
   */
-  id INT PRIMARY KEY REFERENCES Blockchain.Transaction(id)
-    ON DELETE CASCADE ON UPDATE CASCADE,
+  id INT PRIMARY KEY,
+  protocol VARCHAR(5) NOT NULL DEFAULT 'aut',
   join_time TIMESTAMPTZ NOT NULL,
-  user_pubk TEXT UNIQUE NOT NULL
+  user_pubk TEXT UNIQUE NOT NULL,
+  CONSTRAINT aut_protocol_check CHECK (protocol = 'aut'),
+  CONSTRAINT aut_transaction_fkey FOREIGN KEY (id, protocol)
+    REFERENCES Blockchain.Transaction(id, protocol)
+    ON DELETE CASCADE ON UPDATE CASCADE
 );
 
 CREATE TABLE IF NOT EXISTS Blockchain.RemoveUserTransaction (
   /* Represents a ru transaction.
 
-  Trigger:
-    rut_protocol_check: Ensure all transactions are mutually exclusive.
+  Constraints:
+    rut_protocol_check: protocol is rut.
+    rut_transaction_fkey: References the transaction with this id and
+      protocol, so it is not of another subclass.
   */
-  id INT PRIMARY KEY REFERENCES Blockchain.Transaction(id)
-    ON DELETE CASCADE ON UPDATE CASCADE,
+  id INT PRIMARY KEY,
+  protocol VARCHAR(5) NOT NULL DEFAULT 'rut',
   remove_time TIMESTAMPTZ NOT NULL,
-  user_pubk TEXT UNIQUE NOT NULL
+  user_pubk TEXT UNIQUE NOT NULL,
+  CONSTRAINT rut_protocol_check CHECK (protocol = 'rut'),
+  CONSTRAINT rut_transaction_fkey FOREIGN KEY (id, protocol)
+    REFERENCES Blockchain.Transaction(id, protocol)
+    ON DELETE CASCADE ON UPDATE CASCADE
 );
 
 CREATE TABLE IF NOT EXISTS Blockchain.IncludeTransaction (
@@ -230,25 +298,215 @@ CREATE TABLE IF NOT EXISTS Blockchain.IncludeTransaction (
 );
 
 CREATE TABLE IF NOT EXISTS Blockchain.Pool (
-  /* Shows the transactions that are currently in the pool. */
+  /* Shows the transactions that are currently in the pool.
+
+  attempted -- a commit left the transaction in the pool and it has not
+    changed since, see Blockchain.getPoolState
+  */
   transaction_id INT PRIMARY KEY REFERENCES Blockchain.Transaction(id)
     ON DELETE CASCADE ON UPDATE CASCADE,
-  insert_time TIMESTAMPTZ NOT NULL DEFAULT NOW()
+  insert_time TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+  attempted BOOLEAN NOT NULL DEFAULT FALSE
+);
+
+CREATE TABLE IF NOT EXISTS Blockchain.PoolConfig (
+  /* Limits of the pool, a single row.
+
+  max_size -- number of pooled transactions at which adding another one
+    fails with SQLSTATE 45004
+  timeout -- age at which Blockchain.expirePool drops a pooled transaction
+  */
+  id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+  max_size INT NOT NULL DEFAULT 100000 CHECK (max_size > 0),
+  timeout INTERVAL NOT NULL DEFAULT INTERVAL '12 hours'
+);
+
+CREATE TABLE IF NOT EXISTS Blockchain.PoolSize (
+  /* Number of pooled transactions, kept by the triggers on Pool.
+
+  The count is spread over slots picked by backend, so concurrent
+  submitters do not wait on a single row. The size of the pool is the sum
+  of the slots.
+  */
+  slot INT PRIMARY KEY,
+  size BIGINT NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS Blockchain.Stat (
+  /* Calls of the stored procedures, kept by Blockchain.recordStat and
+  Blockchain.recordStats.
+
+  name -- stored procedure
+  outcome -- result of the calls, see doc/database.md
+  slot -- spreads the rows over backends as in PoolSize
+  calls -- number of calls, or of pool entries for commitTransaction and
+    expirePool, batch elements included
+  total_ms -- time spent in the calls
+  */
+  name TEXT,
+  outcome TEXT,
+  slot INT,
+  calls BIGINT NOT NULL DEFAULT 0,
+  total_ms DOUBLE PRECISION NOT NULL DEFAULT 0,
+  PRIMARY KEY (name, outcome, slot)
 );
 
 CREATE TABLE IF NOT EXISTS Blockchain.Debt (
   /* Shows the debt between two users
 
+  Only pairs with a debt have a row, a missing pair owes 0 cookies. Use
+  Blockchain.getDebt to read and Blockchain.changeDebt to write.
+
   Constraint:
-    debt_cookies_owed_check -- cookies_owed cannot be negative.
+    debt_cookies_owed_check -- cookies_owed must be positive.
     debt_sender_receiver_check -- Sender and receiver should not the same.
   */
   sender_pubk TEXT REFERENCES Blockchain.CookieUser(pubk),
   receiver_pubk TEXT REFERENCES Blockchain.CookieUser(pubk),
-  cookies_owed INT DEFAULT 0 NOT NULL,
+  cookies_owed INT NOT NULL,
   PRIMARY KEY(sender_pubk, receiver_pubk),
   -- Constraints:
-  CONSTRAINT debt_cookies_owed_check CHECK (cookies_owed >= 0),
+  CONSTRAINT debt_cookies_owed_check CHECK (cookies_owed > 0),
   CONSTRAINT debt_sender_receiver_check CHECK (sender_pubk != receiver_pubk)
 );
+
+/* Indexes
+
+Primary and unique keys cover lookups by id, block hash and debt pair.
+The indexes below cover the other hot access paths, checked by the query
+plan tests in sql/plans.
+*/
+-- addCCT and addPCT matching a pooled combined transaction
+CREATE INDEX IF NOT EXISTS ccct_users_idx
+  ON Blockchain.CombinedChainCollapseTransaction(start_user, mid_user,
+                                                 end_user, num_cookies);
+CREATE INDEX IF NOT EXISTS cpct_users_idx
+  ON Blockchain.CombinedPairCancelTransaction(user_a, user_b, num_cookies);
+-- Expiring and reading the pool oldest first
+CREATE INDEX IF NOT EXISTS pool_insert_time_idx
+  ON Blockchain.Pool(insert_time, transaction_id);
+-- Reading the transactions no commit has tried yet
+CREATE INDEX IF NOT EXISTS pool_pending_idx
+  ON Blockchain.Pool(insert_time) WHERE NOT attempted;
+-- Finding the block of a transaction, and foreign key checks when a
+-- transaction is deleted
+CREATE INDEX IF NOT EXISTS includetransaction_transaction_id_idx
+  ON Blockchain.IncludeTransaction(transaction_id);
+-- Foreign key checks when an empty block is deleted
+CREATE INDEX IF NOT EXISTS gct_recent_block_idx
+  ON Blockchain.GiveCookieTransaction(recent_block);
+CREATE INDEX IF NOT EXISTS rct_recent_block_idx
+  ON Blockchain.ReceiveCookieTransaction(recent_block);
+CREATE INDEX IF NOT EXISTS cct_recent_block_idx
+  ON Blockchain.ChainCollapseTransaction(recent_block);
+CREATE INDEX IF NOT EXISTS pct_recent_block_idx
+  ON Blockchain.PairCancelTransaction(recent_block);
+-- Foreign key checks when a sub-transaction is deleted
+CREATE INDEX IF NOT EXISTS ccct_start_user_transaction_idx
+  ON Blockchain.CombinedChainCollapseTransaction(start_user_transaction);
+CREATE INDEX IF NOT EXISTS ccct_mid_user_transaction_idx
+  ON Blockchain.CombinedChainCollapseTransaction(mid_user_transaction);
+CREATE INDEX IF NOT EXISTS ccct_end_user_transaction_idx
+  ON Blockchain.CombinedChainCollapseTransaction(end_user_transaction);
+CREATE INDEX IF NOT EXISTS cpct_user_a_transaction_idx
+  ON Blockchain.CombinedPairCancelTransaction(user_a_transaction);
+CREATE INDEX IF NOT EXISTS cpct_user_b_transaction_idx
+  ON Blockchain.CombinedPairCancelTransaction(user_b_transaction);
+
+CREATE OR REPLACE VIEW Blockchain.FormattedTransaction AS
+  /* Each transaction in the format that the protocol is signed.
+
+  Combined transactions have one line per sub-transaction, ordered by
+  position: start, mid and end user for a ccct, user a and b for a cpct.
+  */
+  SELECT aut.id AS transaction_id,
+         1 AS position,
+         FORMAT(E'aut\t%s', user_pubk) AS line
+    FROM Blockchain.AddUserTransaction aut
+  UNION ALL
+  SELECT rut.id, 1, FORMAT(E'rut\t%s', user_pubk)
+    FROM Blockchain.RemoveUserTransaction rut
+  UNION ALL
+  SELECT gct.id, 1, FORMAT(E'gct\t%s\t%s\t%s\t%s\t%s\t%s\t%s',
+                           invoker,
+                           extract(epoch FROM transaction_time),
+                           receiver,
+                           b.curr_hash,
+                           num_cookies,
+                           reason,
+                           signature)
+    FROM Blockchain.GiveCookieTransaction gct
+    JOIN Blockchain.Block b ON (gct.recent_block = b.id)
+  UNION ALL
+  SELECT rct.id, 1, FORMAT(E'rct\t%s\t%s\t%s\t%s\t%s\t%s\t%s',
+                           invoker,
+                           extract(epoch FROM transaction_time),
+                           sender,
+                           b.curr_hash,
+                           num_cookies,
+                           cookie_type,
+                           signature)
+    FROM Blockchain.ReceiveCookieTransaction rct
+    JOIN Blockchain.Block b ON (rct.recent_block = b.id)
+  UNION ALL
+  SELECT ccct.id, sub.position,
+         FORMAT(E'cct\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s',
+                cct.invoker,
+                extract(epoch FROM cct.transaction_time),
+                b.curr_hash,
+                ccct.start_user,
+                ccct.mid_user,
+                ccct.end_user,
+                ccct.num_cookies,
+                cct.signature)
+    FROM Blockchain.CombinedChainCollapseTransaction ccct
+    CROSS JOIN LATERAL (VALUES (1, ccct.start_user_transaction),
+                               (2, ccct.mid_user_transaction),
+                               (3, ccct.end_user_transaction))
+      AS sub(position, transaction_id)
+    JOIN Blockchain.ChainCollapseTransaction cct
+      ON (cct.id = sub.transaction_id)
+    JOIN Blockchain.Block b ON (cct.recent_block = b.id)
+  UNION ALL
+  SELECT cpct.id, sub.position,
+         FORMAT(E'pct\t%s\t%s\t%s\t%s\t%s',
+                pct.invoker,
+                extract(epoch FROM pct.transaction_time),
+                sub.other,
+                cpct.num_cookies,
+                pct.signature)
+    FROM Blockchain.CombinedPairCancelTransaction cpct
+    CROSS JOIN LATERAL (VALUES (1, cpct.user_a_transaction, cpct.user_b),
+                               (2, cpct.user_b_transaction, cpct.user_a))
+      AS sub(position, transaction_id, other)
+    JOIN Blockchain.PairCancelTransaction pct
+      ON (pct.id = sub.transaction_id);
+
+CREATE OR REPLACE VIEW Blockchain.DebtDelta AS
+  /* Change each transaction makes to the debt between two users once it is
+  executed.
+  */
+  SELECT id AS transaction_id,
+         invoker AS sender_pubk,
+         receiver AS receiver_pubk,
+         num_cookies AS cookies_delta
+    FROM Blockchain.GiveCookieTransaction
+  UNION ALL
+  SELECT id, sender, invoker, -num_cookies
+    FROM Blockchain.ReceiveCookieTransaction
+  UNION ALL
+  SELECT id, start_user, mid_user, -num_cookies
+    FROM Blockchain.CombinedChainCollapseTransaction
+  UNION ALL
+  SELECT id, mid_user, end_user, -num_cookies
+    FROM Blockchain.CombinedChainCollapseTransaction
+  UNION ALL
+  SELECT id, start_user, end_user, num_cookies
+    FROM Blockchain.CombinedChainCollapseTransaction
+  UNION ALL
+  SELECT id, user_a, user_b, -num_cookies
+    FROM Blockchain.CombinedPairCancelTransaction
+  UNION ALL
+  SELECT id, user_b, user_a, -num_cookies
+    FROM Blockchain.CombinedPairCancelTransaction;
 COMMIT;
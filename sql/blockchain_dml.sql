@@ -3,4 +3,8 @@ BEGIN TRANSACTION;
 INSERT INTO Blockchain.Block(curr_hash, prev_hash)
   VALUES ('GENESIS/BLOCK/==============================',
           NULL);
+/* Default pool limits and the slots of the pool size */
+INSERT INTO Blockchain.PoolConfig DEFAULT VALUES;
+INSERT INTO Blockchain.PoolSize(slot)
+  SELECT generate_series(0, 15);
 COMMIT;
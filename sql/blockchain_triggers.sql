@@ -3,175 +3,10 @@
 45001 -- Transaction permanently invalid (should be delete from the pool)
 45002 -- Server failure
 45003 -- Unit testing abort and rollback
+45004 -- Pool full (try again later)
 */
 
 BEGIN TRANSACTION;
-CREATE OR REPLACE FUNCTION Blockchain.blockPrevHashFkey()
-  RETURNS trigger AS
-  /* Check that the previous_hash is valid. */
-  $$
-    DECLARE
-      genesis_hash CONSTANT TEXT := 'GENESIS/BLOCK/==============================';
-      searched_hash TEXT;
-    BEGIN
-      IF (NEW.id = 1) THEN
-        IF (NEW.prev_hash IS NULL AND NEW.curr_hash = genesis_hash) THEN
-          -- Genesis block must have a all 0 curr_hash and NULL prev_hash
-          RETURN NEW;
-        ELSE
-          RAISE EXCEPTION SQLSTATE '45002' USING
-            MESSAGE = 'Genesis block must have NULL prev_hash and all 0 curr_hash.';
-        END IF;
-      ELSEIF (NEW.id > 1) THEN
-        IF (NEW.prev_hash IS NOT NULL AND
-            NEW.prev_hash = (SELECT curr_hash FROM Blockchain.Block
-                             WHERE id < NEW.id
-                             ORDER BY id DESC
-                             LIMIT 1)) THEN
-          -- Non-genesis block must have previous block's hash as prev_hash
-          RETURN NEW;
-        ELSE
-          RAISE EXCEPTION SQLSTATE '45002' USING
-            MESSAGE = 'Block''s prev_hash does not match.';
-
-        END IF;
-      ELSE
-        RAISE EXCEPTION SQLSTATE '45002' USING
-          MESSAGE = 'Block id cannot be 0 or negative.';
-
-      END IF;
-    END
-  $$ LANGUAGE plpgsql;
-
-DROP TRIGGER IF EXISTS block_prev_hash_fkey ON Blockchain.Block;
-CREATE TRIGGER block_prev_hash_fkey
-  /* Check that the previous_hash is valid. */
-  BEFORE INSERT OR UPDATE OF prev_hash ON Blockchain.Block
-  FOR EACH ROW
-  EXECUTE PROCEDURE Blockchain.blockPrevHashFkey();
-
-
-CREATE OR REPLACE FUNCTION Blockchain.transactionMutualExclCheck()
-  RETURNS trigger AS
-  /* Check that all transaction subclasses are mutually exclusive. */
-  $$
-    DECLARE
-      occ INT := 0;
-    BEGIN
-      IF (EXISTS (SELECT 1
-                  FROM Blockchain.GiveCookieTransaction AS t
-                  WHERE t.id = NEW.id)) THEN
-        occ := occ + 1;
-      END IF;
-      IF (EXISTS (SELECT 1
-                  FROM Blockchain.ReceiveCookieTransaction AS t
-                  WHERE t.id = NEW.id)) THEN
-        occ := occ + 1;
-      END IF;
-      IF (EXISTS (SELECT 1
-                  FROM Blockchain.ChainCollapseTransaction AS t
-                  WHERE t.id = NEW.id)) THEN
-        occ := occ + 1;
-      END IF;
-      IF (EXISTS (SELECT 1
-                  FROM Blockchain.CombinedChainCollapseTransaction AS t
-                  WHERE t.id = NEW.id)) THEN
-        occ := occ + 1;
-      END IF;
-      IF (EXISTS (SELECT 1
-                  FROM Blockchain.PairCancelTransaction AS t
-                  WHERE t.id = NEW.id)) THEN
-        occ := occ + 1;
-      END IF;
-      IF (EXISTS (SELECT 1
-                  FROM Blockchain.CombinedPairCancelTransaction AS t
-                  WHERE t.id = NEW.id)) THEN
-        occ := occ + 1;
-      END IF;
-      IF (EXISTS (SELECT 1
-                  FROM Blockchain.AddUserTransaction AS t
-                  WHERE t.id = NEW.id)) THEN
-        occ := occ + 1;
-      END IF;
-      IF (EXISTS (SELECT 1
-                  FROM Blockchain.RemoveUserTransaction AS t
-                  WHERE t.id = NEW.id)) THEN
-        occ := occ + 1;
-      END IF;
-      IF (occ = 1) THEN
-        RETURN NULL;
-      ELSE
-        RAISE EXCEPTION SQLSTATE '45002' USING
-          MESSAGE = 'Transaction is not mutually exclusive.';
-      END IF;
-    END
-  $$ LANGUAGE plpgsql SECURITY DEFINER;
-
-DROP TRIGGER IF EXISTS gct_mutualexcl_check
-  ON Blockchain.GiveCookieTransaction;
-CREATE TRIGGER gct_mutualexcl_check
-  /* Check that transactions are mutually exclusive. */
-  AFTER INSERT OR UPDATE OF id ON Blockchain.GiveCookieTransaction
-  FOR EACH ROW
-  EXECUTE PROCEDURE Blockchain.transactionMutualExclCheck();
-
-DROP TRIGGER IF EXISTS rct_mutualexcl_check
-  ON Blockchain.ReceiveCookieTransaction;
-CREATE TRIGGER rct_mutualexcl_check
-  /* Check that transactions are mutually exclusive. */
-  AFTER INSERT OR UPDATE OF id ON Blockchain.ReceiveCookieTransaction
-  FOR EACH ROW
-  EXECUTE PROCEDURE Blockchain.transactionMutualExclCheck();
-
-DROP TRIGGER IF EXISTS cct_mutualexcl_check
-  ON Blockchain.ChainCollapseTransaction;
-CREATE TRIGGER cct_mutualexcl_check
-  /* Check that transactions are mutually exclusive. */
-  AFTER INSERT OR UPDATE OF id ON Blockchain.ChainCollapseTransaction
-  FOR EACH ROW
-  EXECUTE PROCEDURE Blockchain.transactionMutualExclCheck();
-
-DROP TRIGGER IF EXISTS ccct_mutualexcl_check
-  ON Blockchain.CombinedChainCollapseTransaction;
-CREATE TRIGGER ccct_mutualexcl_check
-  /* Check that transactions are mutually exclusive. */
-  AFTER INSERT OR UPDATE OF id ON Blockchain.CombinedChainCollapseTransaction
-  FOR EACH ROW
-  EXECUTE PROCEDURE Blockchain.transactionMutualExclCheck();
-
-DROP TRIGGER IF EXISTS pct_mutualexcl_check
-  ON Blockchain.PairCancelTransaction;
-CREATE TRIGGER pct_mutualexcl_check
-  /* Check that transactions are mutually exclusive. */
-  AFTER INSERT OR UPDATE OF id ON Blockchain.PairCancelTransaction
-  FOR EACH ROW
-  EXECUTE PROCEDURE Blockchain.transactionMutualExclCheck();
-
-DROP TRIGGER IF EXISTS cpct_mutualexcl_check
-  ON Blockchain.CombinedPairCancelTransaction;
-CREATE TRIGGER cpct_mutualexcl_check
-  /* Check that transactions are mutually exclusive. */
-  AFTER INSERT OR UPDATE OF id ON Blockchain.CombinedPairCancelTransaction
-  FOR EACH ROW
-  EXECUTE PROCEDURE Blockchain.transactionMutualExclCheck();
-
-DROP TRIGGER IF EXISTS aut_mutualexcl_check
-  ON Blockchain.AddUserTransaction;
-CREATE TRIGGER aut_mutualexcl_check
-  /* Check that transactions are mutually exclusive. */
-  AFTER INSERT OR UPDATE OF id ON Blockchain.AddUserTransaction
-  FOR EACH ROW
-  EXECUTE PROCEDURE Blockchain.transactionMutualExclCheck();
-
-DROP TRIGGER IF EXISTS rut_mutualexcl_check
-  ON Blockchain.RemoveUserTransaction;
-CREATE TRIGGER rut_mutualexcl_check
-  /* Check that transactions are mutually exclusive. */
-  AFTER INSERT OR UPDATE OF id ON Blockchain.RemoveUserTransaction
-  FOR EACH ROW
-  EXECUTE PROCEDURE Blockchain.transactionMutualExclCheck();
-
-
 CREATE OR REPLACE FUNCTION Blockchain.isValidUser(k TEXT)
   RETURNS BOOLEAN AS
   /* Returns whether user is valid or not
@@ -194,8 +29,10 @@ CREATE OR REPLACE FUNCTION Blockchain.GCTUserCheck()
   /* Check that all users are valid */
   $$
   BEGIN
-    IF ((SELECT Blockchain.isValidUser(NEW.invoker)) AND
-        (SELECT Blockchain.isValidUser(NEW.receiver))) THEN
+    -- Look all users up at once, a repeated user counts once and is rejected
+    IF ((SELECT count(*)
+         FROM Blockchain.CookieUser u
+         WHERE u.pubk IN (NEW.invoker, NEW.receiver) AND u.valid) = 2) THEN
       RETURN NEW;
     ELSE RAISE EXCEPTION SQLSTATE '45001' USING
       MESSAGE = 'User is invalid.';
@@ -216,8 +53,10 @@ CREATE OR REPLACE FUNCTION Blockchain.RCTUserCheck()
   /* Check that all users are valid */
   $$
   BEGIN
-    IF ((SELECT Blockchain.isValidUser(NEW.invoker)) AND
-        (SELECT Blockchain.isValidUser(NEW.sender))) THEN
+    -- Look all users up at once, a repeated user counts once and is rejected
+    IF ((SELECT count(*)
+         FROM Blockchain.CookieUser u
+         WHERE u.pubk IN (NEW.invoker, NEW.sender) AND u.valid) = 2) THEN
       RETURN NEW;
     ELSE RAISE EXCEPTION SQLSTATE '45001' USING
       MESSAGE = 'User is invalid.';
@@ -238,7 +77,9 @@ CREATE OR REPLACE FUNCTION Blockchain.CCTUserCheck()
   /* Check that all users are valid */
   $$
   BEGIN
-    IF ((SELECT Blockchain.isValidUser(NEW.invoker))) THEN
+    IF (EXISTS (SELECT 1
+                FROM Blockchain.CookieUser u
+                WHERE u.pubk = NEW.invoker AND u.valid)) THEN
       RETURN NEW;
     ELSE RAISE EXCEPTION SQLSTATE '45001' USING
       MESSAGE = 'User is invalid.';
@@ -247,7 +88,7 @@ CREATE OR REPLACE FUNCTION Blockchain.CCTUserCheck()
   $$ LANGUAGE plpgsql SECURITY DEFINER;
 
 DROP TRIGGER IF EXISTS cct_user_check ON Blockchain.ChainCollapseTransaction;
-CREATE TRIGGER block_prev_hash_fkey
+CREATE TRIGGER cct_user_check
   /* Check that all users are valid */
   BEFORE INSERT OR UPDATE OF invoker ON Blockchain.ChainCollapseTransaction
   FOR EACH ROW
@@ -258,9 +99,10 @@ CREATE OR REPLACE FUNCTION Blockchain.CCCTUserCheck()
   /* Check that all users are valid */
   $$
   BEGIN
-    IF ((SELECT Blockchain.isValidUser(NEW.start_user)) AND
-        (SELECT Blockchain.isValidUser(NEW.mid_user)) AND
-        (SELECT Blockchain.isValidUser(NEW.end_user))) THEN
+    -- Look all users up at once, a repeated user counts once and is rejected
+    IF ((SELECT count(*)
+         FROM Blockchain.CookieUser u
+         WHERE u.pubk IN (NEW.start_user, NEW.mid_user, NEW.end_user) AND u.valid) = 3) THEN
       RETURN NEW;
     ELSE RAISE EXCEPTION SQLSTATE '45001' USING
       MESSAGE = 'User is invalid.';
@@ -272,7 +114,7 @@ CREATE OR REPLACE FUNCTION Blockchain.CCCTUserCheck()
 DROP TRIGGER IF EXISTS ccct_user_check
   ON Blockchain.CombinedChainCollapseTransaction;
 CREATE TRIGGER ccct_user_check
-  /* Check that the previous_hash is valid. */
+  /* Check that all users are valid */
   BEFORE INSERT OR UPDATE OF start_user, mid_user, end_user
     ON Blockchain.CombinedChainCollapseTransaction
   FOR EACH ROW
@@ -283,7 +125,9 @@ CREATE OR REPLACE FUNCTION Blockchain.PCTUserCheck()
   /* Check that all users are valid */
   $$
   BEGIN
-    IF ((SELECT Blockchain.isValidUser(NEW.invoker))) THEN
+    IF (EXISTS (SELECT 1
+                FROM Blockchain.CookieUser u
+                WHERE u.pubk = NEW.invoker AND u.valid)) THEN
       RETURN NEW;
     ELSE RAISE EXCEPTION SQLSTATE '45001' USING
       MESSAGE = 'User is invalid.';
@@ -303,8 +147,10 @@ CREATE OR REPLACE FUNCTION Blockchain.CPCTUserCheck()
   /* Check that all users are valid */
   $$
   BEGIN
-    IF ((SELECT Blockchain.isValidUser(NEW.user_a)) AND
-        (SELECT Blockchain.isValidUser(NEW.user_b))) THEN
+    -- Look all users up at once, a repeated user counts once and is rejected
+    IF ((SELECT count(*)
+         FROM Blockchain.CookieUser u
+         WHERE u.pubk IN (NEW.user_a, NEW.user_b) AND u.valid) = 2) THEN
       RETURN NEW;
     ELSE RAISE EXCEPTION SQLSTATE '45001' USING
       MESSAGE = 'User is invalid.';
@@ -314,13 +160,13 @@ CREATE OR REPLACE FUNCTION Blockchain.CPCTUserCheck()
   $$ LANGUAGE plpgsql SECURITY DEFINER;
 
 DROP TRIGGER IF EXISTS cpct_user_check
-  ON Blockchain.CombiendPairCancelTransaction;
+  ON Blockchain.CombinedPairCancelTransaction;
 CREATE TRIGGER cpct_user_check
   /* Check that all users are valid */
   BEFORE INSERT OR UPDATE OF user_a, user_b
     ON Blockchain.CombinedPairCancelTransaction
   FOR EACH ROW
-  EXECUTE PROCEDURE Blockchain.CPCTUsercheck();
+  EXECUTE PROCEDURE Blockchain.CPCTUserCheck();
 
 CREATE OR REPLACE FUNCTION Blockchain.cookieUserValidCheck()
   RETURNS trigger AS
@@ -432,4 +278,60 @@ CREATE TRIGGER cpct_individual_transaction_check
                    ON Blockchain.CombinedPairCancelTransaction
   FOR EACH ROW
   EXECUTE PROCEDURE Blockchain.CPCTIndividualTransactionCheck();
+
+CREATE OR REPLACE FUNCTION Blockchain.PoolSizeInsert()
+  RETURNS trigger AS
+  /* Count the added transactions and refuse them if the pool is full.
+
+  Exception:
+  45004 -- The pool holds more than PoolConfig.max_size transactions.
+  */
+  $$
+  BEGIN
+    UPDATE Blockchain.PoolSize
+      SET size = size + (SELECT count(*) FROM new_pool)
+    WHERE slot = pg_backend_pid() % 16;
+    IF ((SELECT sum(size) FROM Blockchain.PoolSize) >
+        (SELECT max_size FROM Blockchain.PoolConfig)) THEN
+      RAISE EXCEPTION SQLSTATE '45004' USING
+        MESSAGE = 'Pool full.';
+    END IF;
+    RETURN NULL;
+  END
+  $$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS pool_size_insert ON Blockchain.Pool;
+CREATE TRIGGER pool_size_insert
+  /* Keep PoolSize and enforce PoolConfig.max_size, once per statement. */
+  AFTER INSERT ON Blockchain.Pool
+  REFERENCING NEW TABLE AS new_pool
+  FOR EACH STATEMENT
+  EXECUTE PROCEDURE Blockchain.PoolSizeInsert();
+
+CREATE OR REPLACE FUNCTION Blockchain.PoolSizeDelete()
+  RETURNS trigger AS
+  /* Count the removed transactions.
+
+  A statement deleting nothing leaves PoolSize alone, so it does not lock
+  the PoolSize row of its backend.
+  */
+  $$
+  BEGIN
+    IF NOT EXISTS (SELECT 1 FROM old_pool) THEN
+      RETURN NULL;
+    END IF;
+    UPDATE Blockchain.PoolSize
+      SET size = size - (SELECT count(*) FROM old_pool)
+    WHERE slot = pg_backend_pid() % 16;
+    RETURN NULL;
+  END
+  $$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS pool_size_delete ON Blockchain.Pool;
+CREATE TRIGGER pool_size_delete
+  /* Keep PoolSize, once per statement. */
+  AFTER DELETE ON Blockchain.Pool
+  REFERENCING OLD TABLE AS old_pool
+  FOR EACH STATEMENT
+  EXECUTE PROCEDURE Blockchain.PoolSizeDelete();
 COMMIT;
@@ -0,0 +1,74 @@
+/*
+Query plan tests, run against a database built with plans/seed.sql.
+Test files should be named with the format: "test_[name].sql".
+
+Each test case explains a hot query and fails if its plan reads a large
+table with a sequential scan:
+
+CREATE OR REPLACE FUNCTION PlanTest.[TESTCASE_NAME]() RETURNS BOOLEAN AS
+  $$
+  BEGIN
+    RETURN PlanTest.noSeqScan($q$ [QUERY] $q$);
+  END
+  $$ LANGUAGE plpgsql;
+*/
+
+BEGIN TRANSACTION;
+DROP SCHEMA IF EXISTS PlanTest CASCADE;
+CREATE SCHEMA IF NOT EXISTS PlanTest;
+
+CREATE OR REPLACE FUNCTION PlanTest.seqScans(query TEXT)
+  RETURNS SETOF TEXT AS
+  /* Return the tables read by a sequential scan in the plan of query.
+
+  Tables of at most 10000 rows are ignored, a sequential scan is the
+  right plan for them.
+
+  Keyword arguments:
+  query -- the query to explain
+
+  Returns:
+  The name of each large table scanned sequentially.
+  */
+  $$
+  DECLARE
+    plan JSONB;
+  BEGIN
+    EXECUTE 'EXPLAIN (FORMAT JSON) ' || query INTO plan;
+    RETURN QUERY
+      SELECT DISTINCT c.relname::TEXT
+        FROM jsonb_path_query(
+               plan,
+               'strict $.** ? (@."Node Type" == "Seq Scan")."Relation Name"'
+             ) scan
+        JOIN pg_catalog.pg_class c ON (c.relname = scan #>> '{}')
+        JOIN pg_catalog.pg_namespace s ON (s.oid = c.relnamespace)
+       WHERE s.nspname = 'blockchain' AND c.reltuples > 10000;
+  END
+  $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION PlanTest.noSeqScan(query TEXT,
+                                              allowed TEXT[] DEFAULT '{}')
+  RETURNS BOOLEAN AS
+  /* Check that the plan of query reads no large table sequentially.
+
+  Keyword arguments:
+  query -- the query to explain
+  allowed -- tables the query reads in full, which may be scanned
+
+  Returns:
+  TRUE if no large table is scanned sequentially, FALSE otherwise.
+  */
+  $$
+  DECLARE
+    relation TEXT;
+    result BOOLEAN := TRUE;
+  BEGIN
+    FOR relation IN SELECT PlanTest.seqScans(query)
+                    EXCEPT SELECT unnest(allowed) LOOP
+      RAISE NOTICE 'Seq Scan on %', relation;
+      result := FALSE;
+    END LOOP;
+    RETURN result;
+  END
+  $$ LANGUAGE plpgsql;
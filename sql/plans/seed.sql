@@ -0,0 +1,151 @@
+/*
+Seed a freshly built database with about 1M transactions for the query
+plan tests. Rows are inserted directly rather than through the add
+functions; signatures and hashes are placeholders.
+
+- 1000 users and 1000 committed blocks
+- 500k gct, 300k rct, 40k ccct from 120k cct, 20k cpct from 40k pct
+- every transaction is in a block except the last 20k, which are pooled
+- 100k debts
+*/
+
+BEGIN TRANSACTION;
+-- Users
+INSERT INTO Blockchain.CookieUser(pubk)
+  SELECT 'user' || g FROM generate_series(1, 1000) g;
+
+-- Blocks
+DO $$
+DECLARE
+  bid INT;
+BEGIN
+  FOR i IN 1..1000 LOOP
+    INSERT INTO Blockchain.Block(prev_hash)
+      SELECT curr_hash FROM Blockchain.Block ORDER BY id DESC LIMIT 1
+      RETURNING id INTO bid;
+    UPDATE Blockchain.Block
+       SET curr_hash = 'seed/block/' || bid, plaintext = ''
+     WHERE id = bid;
+  END LOOP;
+END
+$$;
+-- Number the blocks from 0, the genesis block, to 1000
+CREATE TEMPORARY TABLE SeedBlock ON COMMIT DROP AS
+  SELECT row_number() OVER (ORDER BY id) - 1 AS k, id FROM Blockchain.Block;
+
+-- Give and receive cookie transactions
+WITH t AS (
+  INSERT INTO Blockchain.Transaction(protocol)
+    SELECT 'gct' FROM generate_series(1, 500000)
+    RETURNING id
+)
+INSERT INTO Blockchain.GiveCookieTransaction(
+  id, invoker, transaction_time, receiver, recent_block, num_cookies,
+  reason, signature)
+  SELECT t.id, 'user' || (t.id % 1000 + 1), NOW() - t.id * INTERVAL '1 ms',
+         'user' || ((t.id + 1) % 1000 + 1), b.id, t.id % 10 + 1,
+         'seed', 'signature'
+    FROM t JOIN SeedBlock b ON (b.k = t.id % 1000);
+
+WITH t AS (
+  INSERT INTO Blockchain.Transaction(protocol)
+    SELECT 'rct' FROM generate_series(1, 300000)
+    RETURNING id
+)
+INSERT INTO Blockchain.ReceiveCookieTransaction(
+  id, invoker, transaction_time, sender, recent_block, num_cookies,
+  cookie_type, signature)
+  SELECT t.id, 'user' || ((t.id + 1) % 1000 + 1),
+         NOW() - t.id * INTERVAL '1 ms', 'user' || (t.id % 1000 + 1), b.id,
+         t.id % 10 + 1, 'seed', 'signature'
+    FROM t JOIN SeedBlock b ON (b.k = t.id % 1000);
+
+-- Chain collapses, each made of three consecutive cct
+WITH t AS (
+  INSERT INTO Blockchain.Transaction(protocol)
+    SELECT 'cct' FROM generate_series(1, 120000)
+    RETURNING id
+), n AS (
+  SELECT id, row_number() OVER (ORDER BY id) - 1 AS k FROM t
+)
+INSERT INTO Blockchain.ChainCollapseTransaction(
+  id, invoker, transaction_time, recent_block, signature)
+  SELECT n.id, 'user' || ((n.k / 3 + n.k % 3) % 1000 + 1),
+         NOW() - n.id * INTERVAL '1 ms', b.id, 'signature'
+    FROM n JOIN SeedBlock b ON (b.k = n.id % 1000);
+
+WITH c AS (
+  SELECT array_agg(id ORDER BY id) AS ids,
+         row_number() OVER (ORDER BY min(id)) - 1 AS k
+    FROM (SELECT id, (row_number() OVER (ORDER BY id) - 1) / 3 AS grp
+            FROM Blockchain.ChainCollapseTransaction) cct
+   GROUP BY grp
+), t AS (
+  INSERT INTO Blockchain.Transaction(protocol)
+    SELECT 'ccct' FROM c
+    RETURNING id
+), tn AS (
+  SELECT id, row_number() OVER (ORDER BY id) - 1 AS k FROM t
+)
+INSERT INTO Blockchain.CombinedChainCollapseTransaction(
+  id, start_user, mid_user, end_user, start_user_transaction,
+  mid_user_transaction, end_user_transaction, num_cookies)
+  SELECT tn.id, 'user' || (c.k % 1000 + 1), 'user' || ((c.k + 1) % 1000 + 1),
+         'user' || ((c.k + 2) % 1000 + 1), c.ids[1], c.ids[2], c.ids[3],
+         c.k % 10 + 1
+    FROM c JOIN tn USING (k);
+
+-- Pair cancels, each made of two consecutive pct
+WITH t AS (
+  INSERT INTO Blockchain.Transaction(protocol)
+    SELECT 'pct' FROM generate_series(1, 40000)
+    RETURNING id
+), n AS (
+  SELECT id, row_number() OVER (ORDER BY id) - 1 AS k FROM t
+)
+INSERT INTO Blockchain.PairCancelTransaction(
+  id, invoker, transaction_time, recent_block, signature)
+  SELECT n.id, 'user' || ((n.k / 2 + n.k % 2) % 1000 + 1),
+         NOW() - n.id * INTERVAL '1 ms', b.id, 'signature'
+    FROM n JOIN SeedBlock b ON (b.k = n.id % 1000);
+
+WITH c AS (
+  SELECT array_agg(id ORDER BY id) AS ids,
+         row_number() OVER (ORDER BY min(id)) - 1 AS k
+    FROM (SELECT id, (row_number() OVER (ORDER BY id) - 1) / 2 AS grp
+            FROM Blockchain.PairCancelTransaction) pct
+   GROUP BY grp
+), t AS (
+  INSERT INTO Blockchain.Transaction(protocol)
+    SELECT 'cpct' FROM c
+    RETURNING id
+), tn AS (
+  SELECT id, row_number() OVER (ORDER BY id) - 1 AS k FROM t
+)
+INSERT INTO Blockchain.CombinedPairCancelTransaction(
+  id, user_a_transaction, user_b_transaction, user_a, user_b, num_cookies)
+  SELECT tn.id, c.ids[1], c.ids[2], 'user' || (c.k % 1000 + 1),
+         'user' || ((c.k + 1) % 1000 + 1), c.k % 10 + 1
+    FROM c JOIN tn USING (k);
+
+-- Spread the committed transactions over the blocks, pool the newest
+INSERT INTO Blockchain.IncludeTransaction(block, transaction_id)
+  SELECT b.id, t.id
+    FROM Blockchain.Transaction t
+    JOIN SeedBlock b ON (b.k = t.id % 1000 + 1)
+   WHERE t.protocol NOT IN ('cct', 'pct') AND
+         t.id <= (SELECT max(id) - 20000 FROM Blockchain.Transaction);
+INSERT INTO Blockchain.Pool(transaction_id, insert_time)
+  SELECT t.id, NOW() - (t.id % 3600) * INTERVAL '1 s'
+    FROM Blockchain.Transaction t
+   WHERE t.protocol NOT IN ('cct', 'pct') AND
+         t.id > (SELECT max(id) - 20000 FROM Blockchain.Transaction);
+
+-- Debts
+INSERT INTO Blockchain.Debt(sender_pubk, receiver_pubk, cookies_owed)
+  SELECT 'user' || (g % 1000 + 1), 'user' || ((g / 1000 + g + 1) % 1000 + 1),
+         g % 50 + 1
+    FROM generate_series(0, 99999) g;
+COMMIT;
+
+ANALYZE;
@@ -0,0 +1,45 @@
+CREATE OR REPLACE FUNCTION PlanTest.formatted_block() RETURNS BOOLEAN AS
+  $$
+  BEGIN
+    -- The transactions of a block, as in getFormattedBlock
+    RETURN PlanTest.noSeqScan($q$
+      SELECT string_agg(f.line || E'\n', ''
+                        ORDER BY i.transaction_id, f.position)
+        FROM Blockchain.IncludeTransaction i
+        CROSS JOIN LATERAL (
+          SELECT *
+            FROM Blockchain.FormattedTransaction f
+           WHERE f.transaction_id = i.transaction_id
+          OFFSET 0) f
+       WHERE i.block = (SELECT max(id) FROM Blockchain.Block)
+    $q$);
+  END
+  $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION PlanTest.transaction_block() RETURNS BOOLEAN AS
+  $$
+  BEGIN
+    RETURN PlanTest.noSeqScan($q$
+      SELECT block
+        FROM Blockchain.IncludeTransaction
+       WHERE transaction_id = 1000
+    $q$);
+  END
+  $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION PlanTest.transactions_by_recent_block()
+  RETURNS BOOLEAN AS
+  $$
+  BEGIN
+    -- Foreign key checks when a block is deleted
+    RETURN PlanTest.noSeqScan($q$
+      SELECT id FROM Blockchain.GiveCookieTransaction WHERE recent_block = 1
+      UNION ALL
+      SELECT id FROM Blockchain.ReceiveCookieTransaction WHERE recent_block = 1
+      UNION ALL
+      SELECT id FROM Blockchain.ChainCollapseTransaction WHERE recent_block = 1
+      UNION ALL
+      SELECT id FROM Blockchain.PairCancelTransaction WHERE recent_block = 1
+    $q$);
+  END
+  $$ LANGUAGE plpgsql;
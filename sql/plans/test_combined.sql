@@ -0,0 +1,59 @@
+CREATE OR REPLACE FUNCTION PlanTest.ccct_match() RETURNS BOOLEAN AS
+  $$
+  BEGIN
+    RETURN PlanTest.noSeqScan($q$
+      SELECT id
+        FROM Blockchain.CombinedChainCollapseTransaction ccct
+        JOIN Blockchain.Pool p ON (ccct.id = p.transaction_id)
+       WHERE ccct.start_user = 'user1' AND
+             ccct.mid_user = 'user2' AND
+             ccct.end_user = 'user3' AND
+             ccct.num_cookies = 1
+    $q$);
+  END
+  $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION PlanTest.cpct_match() RETURNS BOOLEAN AS
+  $$
+  BEGIN
+    RETURN PlanTest.noSeqScan($q$
+      SELECT id
+        FROM Blockchain.CombinedPairCancelTransaction cpct
+        JOIN Blockchain.Pool p ON (cpct.id = p.transaction_id)
+       WHERE cpct.user_a = 'user2' AND
+             cpct.user_b = 'user1' AND
+             cpct.num_cookies = 1
+    $q$);
+  END
+  $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION PlanTest.ccct_by_sub_transaction() RETURNS BOOLEAN AS
+  $$
+  BEGIN
+    -- Foreign key checks when a cct is deleted
+    RETURN PlanTest.noSeqScan($q$
+      SELECT id FROM Blockchain.CombinedChainCollapseTransaction
+       WHERE start_user_transaction = 1000
+      UNION ALL
+      SELECT id FROM Blockchain.CombinedChainCollapseTransaction
+       WHERE mid_user_transaction = 1000
+      UNION ALL
+      SELECT id FROM Blockchain.CombinedChainCollapseTransaction
+       WHERE end_user_transaction = 1000
+    $q$);
+  END
+  $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION PlanTest.cpct_by_sub_transaction() RETURNS BOOLEAN AS
+  $$
+  BEGIN
+    -- Foreign key checks when a pct is deleted
+    RETURN PlanTest.noSeqScan($q$
+      SELECT id FROM Blockchain.CombinedPairCancelTransaction
+       WHERE user_a_transaction = 1000
+      UNION ALL
+      SELECT id FROM Blockchain.CombinedPairCancelTransaction
+       WHERE user_b_transaction = 1000
+    $q$);
+  END
+  $$ LANGUAGE plpgsql;
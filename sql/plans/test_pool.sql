@@ -0,0 +1,52 @@
+CREATE OR REPLACE FUNCTION PlanTest.pool_expire() RETURNS BOOLEAN AS
+  $$
+  BEGIN
+    RETURN PlanTest.noSeqScan($q$
+      DELETE FROM Blockchain.Pool p
+       WHERE p.insert_time < NOW() - INTERVAL '12 hours'
+    $q$);
+  END
+  $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION PlanTest.pool_oldest() RETURNS BOOLEAN AS
+  $$
+  BEGIN
+    RETURN PlanTest.noSeqScan($q$
+      SELECT transaction_id
+        FROM Blockchain.Pool p
+       ORDER BY p.insert_time, p.transaction_id
+       LIMIT 100
+    $q$);
+  END
+  $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION PlanTest.pool_debt_delta() RETURNS BOOLEAN AS
+  $$
+  BEGIN
+    -- The delta of every pooled transaction, as in commitBlockBatch. The
+    -- pool itself is read in full.
+    RETURN PlanTest.noSeqScan($q$
+      SELECT d.*, p.insert_time
+        FROM Blockchain.Pool p
+        CROSS JOIN LATERAL (
+          SELECT *
+            FROM Blockchain.DebtDelta d
+           WHERE d.transaction_id = p.transaction_id
+          OFFSET 0) d
+    $q$, ARRAY['pool']);
+  END
+  $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION PlanTest.pool_net_debt() RETURNS BOOLEAN AS
+  $$
+  BEGIN
+    RETURN PlanTest.noSeqScan($q$
+      SELECT sender_pubk, receiver_pubk, SUM(cookies_delta)
+        FROM Blockchain.DebtDelta
+       WHERE transaction_id = ANY(ARRAY(SELECT transaction_id
+                                          FROM Blockchain.Pool
+                                         LIMIT 1000))
+       GROUP BY sender_pubk, receiver_pubk
+    $q$, ARRAY['pool']);
+  END
+  $$ LANGUAGE plpgsql;
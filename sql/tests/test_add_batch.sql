@@ -0,0 +1,95 @@
+CREATE OR REPLACE FUNCTION Test.batch_gct_statuses() RETURNS BOOLEAN AS
+  $$
+  DECLARE
+    result BOOLEAN;
+    now DOUBLE PRECISION := extract(epoch from now());
+  BEGIN
+    PERFORM Blockchain.addAUT('aaa123');
+    PERFORM Blockchain.addAUT('bbb123');
+    PERFORM Blockchain.commitBlock();
+    -- Second has negative cookies, third an unknown block, fourth repeats
+    -- the first
+    SELECT Blockchain.addGCTBatch(
+             ARRAY['aaa123', 'aaa123', 'aaa123', 'aaa123', 'bbb123'],
+             ARRAY[now, now + 1, now + 2, now, now],
+             ARRAY['bbb123', 'bbb123', 'bbb123', 'bbb123', 'aaa123'],
+             ARRAY['GENESIS/BLOCK/==============================',
+                   'GENESIS/BLOCK/==============================',
+                   'no such block',
+                   'GENESIS/BLOCK/==============================',
+                   'GENESIS/BLOCK/=============================='],
+             ARRAY[2, -1, 2, 2, 3],
+             ARRAY['Why not', 'Why not', 'Why not', 'Why not', 'Why not'],
+             ARRAY['signature1', 'signature2', 'signature3', 'signature4',
+                   'signature5']) = ARRAY[TRUE, FALSE, FALSE, FALSE, TRUE]
+      INTO result;
+    -- Rejected transactions leave nothing behind
+    SELECT result AND (SELECT count(*) = 2 FROM Blockchain.Pool) AND
+           (SELECT count(*) = 2 FROM Blockchain.GiveCookieTransaction) AND
+           NOT EXISTS (SELECT 1
+                         FROM Blockchain.Transaction t
+                         LEFT JOIN Blockchain.IncludeTransaction i
+                           ON (i.transaction_id = t.id)
+                         LEFT JOIN Blockchain.Pool p
+                           ON (p.transaction_id = t.id)
+                        WHERE i.transaction_id IS NULL AND
+                              p.transaction_id IS NULL)
+      INTO result;
+    RAISE EXCEPTION SQLSTATE '45003';
+  EXCEPTION WHEN SQLSTATE '45003' THEN
+    RETURN result;
+  END
+  $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION Test.batch_cct_complete() RETURNS BOOLEAN AS
+  $$
+  DECLARE
+    result BOOLEAN;
+    now DOUBLE PRECISION := extract(epoch from now());
+  BEGIN
+    PERFORM Blockchain.addAUT('aaa123');
+    PERFORM Blockchain.addAUT('bbb123');
+    PERFORM Blockchain.addAUT('ccc123');
+    PERFORM Blockchain.commitBlock();
+    SELECT Blockchain.addGCTBatch(
+             ARRAY['aaa123', 'bbb123'],
+             ARRAY[now, now],
+             ARRAY['bbb123', 'ccc123'],
+             ARRAY['GENESIS/BLOCK/==============================',
+                   'GENESIS/BLOCK/=============================='],
+             ARRAY[5, 5],
+             ARRAY['Why not', 'Why not'],
+             ARRAY['signature1', 'signature2']) = ARRAY[TRUE, TRUE] AND
+           Blockchain.commitBlock() AND
+           Blockchain.addCCTBatch(
+             ARRAY['aaa123', 'bbb123', 'ccc123'],
+             ARRAY[now, now, now],
+             ARRAY['GENESIS/BLOCK/==============================',
+                   'GENESIS/BLOCK/==============================',
+                   'GENESIS/BLOCK/=============================='],
+             ARRAY['aaa123', 'aaa123', 'aaa123'],
+             ARRAY['bbb123', 'bbb123', 'bbb123'],
+             ARRAY['ccc123', 'ccc123', 'ccc123'],
+             ARRAY[5, 5, 5],
+             ARRAY['signature3', 'signature4', 'signature5'])
+             = ARRAY[TRUE, TRUE, TRUE] AND
+           Blockchain.commitBlock() INTO result;
+    SELECT result AND Blockchain.getDebt('aaa123', 'ccc123') = 5 AND
+           Blockchain.getDebt('aaa123', 'bbb123') = 0 AND
+           NOT EXISTS (SELECT 1 FROM Blockchain.Pool) INTO result;
+    RAISE EXCEPTION SQLSTATE '45003';
+  EXCEPTION WHEN SQLSTATE '45003' THEN
+    RETURN result;
+  END
+  $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION Test.batch_length_mismatch() RETURNS BOOLEAN AS
+  $$
+  BEGIN
+    PERFORM Blockchain.addRCTBatch(ARRAY['aaa123'], ARRAY[0.0], '{}',
+                                   '{}', '{}', '{}', '{}');
+    RETURN FALSE;
+  EXCEPTION WHEN invalid_parameter_value THEN
+    RETURN TRUE;
+  END
+  $$ LANGUAGE plpgsql;
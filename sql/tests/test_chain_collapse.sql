@@ -48,21 +48,12 @@ CREATE OR REPLACE FUNCTION Test.cct_normal_case() RETURNS BOOLEAN AS
                              'signature123') AND
            Blockchain.commitBlock() AND
            NOT Blockchain.commitBlock() INTO result;
-    SELECT result AND cookies_owed = 0
-     INTO result
-     FROM Blockchain.Debt
-     WHERE sender_pubk = 'aaa123' AND
-           receiver_pubk = 'bbb123';
-    SELECT result AND cookies_owed = 18
-    INTO result
-    FROM Blockchain.Debt
-    WHERE sender_pubk = 'bbb123' AND
-          receiver_pubk = 'ccc123';
-    SELECT result AND cookies_owed = 12
-    INTO result
-    FROM Blockchain.Debt
-    WHERE sender_pubk = 'aaa123' AND
-          receiver_pubk = 'ccc123';
+    SELECT result AND Blockchain.getDebt('aaa123', 'bbb123') = 0
+      INTO result;
+    SELECT result AND Blockchain.getDebt('bbb123', 'ccc123') = 18
+      INTO result;
+    SELECT result AND Blockchain.getDebt('aaa123', 'ccc123') = 12
+      INTO result;
     RAISE EXCEPTION SQLSTATE '45003';
   EXCEPTION WHEN SQLSTATE '45003' THEN
     RETURN result;
@@ -118,21 +109,12 @@ CREATE OR REPLACE FUNCTION Test.cct_not_enough_debt() RETURNS BOOLEAN AS
                              60,
                              'signature123') AND
            NOT Blockchain.commitBlock() INTO result;
-    SELECT result AND cookies_owed = 10
-     INTO result
-     FROM Blockchain.Debt
-     WHERE sender_pubk = 'aaa123' AND
-           receiver_pubk = 'bbb123';
-    SELECT result AND cookies_owed = 20
-    INTO result
-    FROM Blockchain.Debt
-    WHERE sender_pubk = 'bbb123' AND
-          receiver_pubk = 'ccc123';
-    SELECT result AND cookies_owed = 0
-    INTO result
-    FROM Blockchain.Debt
-    WHERE sender_pubk = 'aaa123' AND
-          receiver_pubk = 'ccc123';
+    SELECT result AND Blockchain.getDebt('aaa123', 'bbb123') = 10
+      INTO result;
+    SELECT result AND Blockchain.getDebt('bbb123', 'ccc123') = 20
+      INTO result;
+    SELECT result AND Blockchain.getDebt('aaa123', 'ccc123') = 0
+      INTO result;
     RAISE EXCEPTION SQLSTATE '45003';
   EXCEPTION WHEN SQLSTATE '45003' THEN
     RETURN result;
@@ -0,0 +1,118 @@
+CREATE OR REPLACE FUNCTION Test.batch_same_as_sequential() RETURNS BOOLEAN AS
+  $$
+  DECLARE
+    result BOOLEAN;
+    sequential TEXT;
+    batch TEXT;
+  BEGIN
+    PERFORM Blockchain.addAUT('aaa123');
+    PERFORM Blockchain.addAUT('bbb123');
+    PERFORM Blockchain.addAUT('ccc123');
+    PERFORM Blockchain.commitBlock();
+    PERFORM Blockchain.addGCT('aaa123',
+                              extract(epoch from now()) - 10,
+                              'bbb123',
+                              'GENESIS/BLOCK/==============================',
+                              5,
+                              'Why not',
+                              'signature1');
+    -- Received before given, fails
+    PERFORM Blockchain.addRCT('ccc123',
+                              extract(epoch from now()) - 9,
+                              'bbb123',
+                              'GENESIS/BLOCK/==============================',
+                              2,
+                              'butter scotch',
+                              'signature2');
+    PERFORM Blockchain.addGCT('bbb123',
+                              extract(epoch from now()) - 8,
+                              'ccc123',
+                              'GENESIS/BLOCK/==============================',
+                              3,
+                              'Why not',
+                              'signature3');
+    PERFORM Blockchain.addRCT('bbb123',
+                              extract(epoch from now()) - 7,
+                              'aaa123',
+                              'GENESIS/BLOCK/==============================',
+                              4,
+                              'butter scotch',
+                              'signature4');
+    -- Incomplete, stays in the pool
+    PERFORM Blockchain.addPCT('aaa123',
+                              'bbb123',
+                              extract(epoch from now()) - 6,
+                              'GENESIS/BLOCK/==============================',
+                              1,
+                              'signature5');
+    BEGIN
+      PERFORM Blockchain.commitBlock();
+      SELECT string_agg(FORMAT('%s>%s:%s', sender_pubk, receiver_pubk,
+                               cookies_owed), ','
+                        ORDER BY sender_pubk, receiver_pubk) ||
+             (SELECT string_agg(transaction_id::TEXT, ','
+                                ORDER BY transaction_id)
+              FROM Blockchain.Pool)
+        INTO sequential
+        FROM Blockchain.Debt;
+      RAISE EXCEPTION SQLSTATE '45003';
+    EXCEPTION WHEN SQLSTATE '45003' THEN
+      NULL;
+    END;
+    SELECT Blockchain.commitBlockBatch() INTO result;
+    SELECT string_agg(FORMAT('%s>%s:%s', sender_pubk, receiver_pubk,
+                             cookies_owed), ','
+                      ORDER BY sender_pubk, receiver_pubk) ||
+           (SELECT string_agg(transaction_id::TEXT, ','
+                              ORDER BY transaction_id)
+            FROM Blockchain.Pool)
+      INTO batch
+      FROM Blockchain.Debt;
+    SELECT result AND sequential = batch INTO result;
+    -- Debt was applied and the early rct is still pooled
+    SELECT result AND Blockchain.getDebt('aaa123', 'bbb123') = 1
+      INTO result;
+    SELECT result AND (SELECT count(*) = 2 FROM Blockchain.Pool)
+      INTO result;
+    RAISE EXCEPTION SQLSTATE '45003';
+  EXCEPTION WHEN SQLSTATE '45003' THEN
+    RETURN result;
+  END
+  $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION Test.batch_removed_user() RETURNS BOOLEAN AS
+  $$
+  DECLARE
+    result BOOLEAN;
+  BEGIN
+    PERFORM Blockchain.addAUT('aaa123');
+    PERFORM Blockchain.addAUT('bbb123');
+    PERFORM Blockchain.commitBlock();
+    PERFORM Blockchain.addGCT('aaa123',
+                              extract(epoch from now()) - 10,
+                              'bbb123',
+                              'GENESIS/BLOCK/==============================',
+                              5,
+                              'Why not',
+                              'signature1');
+    PERFORM Blockchain.addRUT('aaa123');
+    SELECT Blockchain.addGCT('bbb123',
+                             extract(epoch from now()) - 9,
+                             'aaa123',
+                             'GENESIS/BLOCK/==============================',
+                             2,
+                             'Why not',
+                             'signature2') AND
+           Blockchain.commitBlockBatch() INTO result;
+    -- The gct before the removal is committed, the one after is discarded
+    SELECT result AND Blockchain.getDebt('aaa123', 'bbb123') = 5
+      INTO result;
+    SELECT result AND Blockchain.getDebt('bbb123', 'aaa123') = 0
+      INTO result;
+    SELECT result AND NOT EXISTS (SELECT 1 FROM Blockchain.Pool)
+      INTO result;
+    RAISE EXCEPTION SQLSTATE '45003';
+  EXCEPTION WHEN SQLSTATE '45003' THEN
+    RETURN result;
+  END
+  $$ LANGUAGE plpgsql;
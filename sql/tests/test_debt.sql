@@ -0,0 +1,82 @@
+CREATE OR REPLACE FUNCTION Test.debt_sparse_rows() RETURNS BOOLEAN AS
+  $$
+  DECLARE
+    result BOOLEAN;
+  BEGIN
+    PERFORM Blockchain.addAUT('aaa123');
+    PERFORM Blockchain.addAUT('bbb123');
+    PERFORM Blockchain.addAUT('ccc123');
+    PERFORM Blockchain.commitBlock();
+    -- Adding users does not create debts
+    SELECT NOT EXISTS (SELECT 1 FROM Blockchain.Debt) INTO result;
+    SELECT result AND
+           Blockchain.addGCT('aaa123',
+                             extract(epoch from now()),
+                             'bbb123',
+                             'GENESIS/BLOCK/==============================',
+                             3,
+                             'Why not',
+                             'signature1') AND
+           Blockchain.commitBlock() INTO result;
+    SELECT result AND Blockchain.getDebt('aaa123', 'bbb123') = 3 AND
+           Blockchain.getDebt('bbb123', 'aaa123') = 0 AND
+           (SELECT count(*) = 1 FROM Blockchain.Debt) INTO result;
+    -- A settled debt has no row
+    SELECT result AND
+           Blockchain.addRCT('bbb123',
+                             extract(epoch from now()),
+                             'aaa123',
+                             'GENESIS/BLOCK/==============================',
+                             3,
+                             'butter scotch',
+                             'signature2') AND
+           Blockchain.commitBlock() INTO result;
+    SELECT result AND Blockchain.getDebt('aaa123', 'bbb123') = 0 AND
+           NOT EXISTS (SELECT 1 FROM Blockchain.Debt) INTO result;
+    RAISE EXCEPTION SQLSTATE '45003';
+  EXCEPTION WHEN SQLSTATE '45003' THEN
+    RETURN result;
+  END
+  $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION Test.debt_batch_settles_pair() RETURNS BOOLEAN AS
+  $$
+  DECLARE
+    result BOOLEAN;
+  BEGIN
+    PERFORM Blockchain.addAUT('aaa123');
+    PERFORM Blockchain.addAUT('bbb123');
+    PERFORM Blockchain.commitBlock();
+    -- New pair, changed pair and settled pair in one batch
+    SELECT Blockchain.addGCT('aaa123',
+                             extract(epoch from now()) - 2,
+                             'bbb123',
+                             'GENESIS/BLOCK/==============================',
+                             4,
+                             'Why not',
+                             'signature1') AND
+           Blockchain.commitBlockBatch() AND
+           Blockchain.addGCT('bbb123',
+                             extract(epoch from now()) - 1,
+                             'aaa123',
+                             'GENESIS/BLOCK/==============================',
+                             2,
+                             'Why not',
+                             'signature2') AND
+           Blockchain.addRCT('bbb123',
+                             extract(epoch from now()),
+                             'aaa123',
+                             'GENESIS/BLOCK/==============================',
+                             4,
+                             'butter scotch',
+                             'signature3') AND
+           Blockchain.commitBlockBatch() INTO result;
+    SELECT result AND Blockchain.getDebt('aaa123', 'bbb123') = 0 AND
+           Blockchain.getDebt('bbb123', 'aaa123') = 2 AND
+           (SELECT count(*) = 1 FROM Blockchain.Debt) AND
+           NOT EXISTS (SELECT 1 FROM Blockchain.Pool) INTO result;
+    RAISE EXCEPTION SQLSTATE '45003';
+  EXCEPTION WHEN SQLSTATE '45003' THEN
+    RETURN result;
+  END
+  $$ LANGUAGE plpgsql;
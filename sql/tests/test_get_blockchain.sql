@@ -0,0 +1,155 @@
+CREATE OR REPLACE FUNCTION Test.GBC_plaintext_stored() RETURNS BOOLEAN AS
+  $$
+  DECLARE
+    result BOOLEAN;
+  BEGIN
+    PERFORM Blockchain.addAUT('aaa123');
+    PERFORM Blockchain.addAUT('bbb123');
+    PERFORM Blockchain.commitBlock();
+    SELECT Blockchain.addGCT('aaa123',
+                             extract(epoch from now()),
+                             'bbb123',
+                             'GENESIS/BLOCK/==============================',
+                             2,
+                             'Why not',
+                             'signature1') AND
+           Blockchain.commitBlock() INTO result;
+    SELECT result AND bool_and(
+             plaintext = Blockchain.getFormattedBlock(id) AND
+             curr_hash = encode(Blockchain.digest(plaintext, TEXT 'SHA256'),
+                                'base64'))
+      INTO result
+      FROM Blockchain.Block
+     WHERE prev_hash IS NOT NULL;
+    RAISE EXCEPTION SQLSTATE '45003';
+  EXCEPTION
+    WHEN SQLSTATE '45003' THEN RETURN result;
+  END
+  $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION Test.GBC_from_genesis() RETURNS BOOLEAN AS
+  $$
+  DECLARE
+    result BOOLEAN;
+  BEGIN
+    PERFORM Blockchain.addAUT('aaa123');
+    PERFORM Blockchain.addAUT('bbb123');
+    PERFORM Blockchain.commitBlock();
+    PERFORM Blockchain.addGCT('aaa123',
+                              extract(epoch from now()),
+                              'bbb123',
+                              'GENESIS/BLOCK/==============================',
+                              2,
+                              'Why not',
+                              'signature1');
+    PERFORM Blockchain.commitBlock();
+    SELECT Blockchain.getBlockchain(
+             'GENESIS/BLOCK/==============================') =
+           (SELECT string_agg(TRIM(trailing E'\n' FROM
+                                   Blockchain.getFormattedBlock(id)),
+                              E'\n' ORDER BY id)
+              FROM Blockchain.Block
+             WHERE prev_hash IS NOT NULL) ||
+           (SELECT E'\nhead\t' || curr_hash
+              FROM Blockchain.Block
+             ORDER BY id DESC LIMIT 1) INTO result;
+    RAISE EXCEPTION SQLSTATE '45003';
+  EXCEPTION
+    WHEN SQLSTATE '45003' THEN RETURN result;
+  END
+  $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION Test.GBC_formatted_gct() RETURNS BOOLEAN AS
+  $$
+  DECLARE
+    result BOOLEAN;
+  BEGIN
+    PERFORM Blockchain.addAUT('aaa123');
+    PERFORM Blockchain.addAUT('bbb123');
+    PERFORM Blockchain.commitBlock();
+    SELECT Blockchain.addGCT('aaa123',
+                             extract(epoch from now()),
+                             'bbb123',
+                             'GENESIS/BLOCK/==============================',
+                             2,
+                             NULL,
+                             'signature1') AND
+           Blockchain.commitBlock() INTO result;
+    SELECT result AND b.plaintext =
+             E'prev\t' || b.prev_hash || E'\n' ||
+             E'gct\taaa123\t' || extract(epoch FROM gct.transaction_time) ||
+             E'\tbbb123\tGENESIS/BLOCK/==============================' ||
+             E'\t2\t\tsignature1\n'
+      INTO result
+      FROM Blockchain.Block b, Blockchain.GiveCookieTransaction gct
+     ORDER BY b.id DESC LIMIT 1;
+    RAISE EXCEPTION SQLSTATE '45003';
+  EXCEPTION
+    WHEN SQLSTATE '45003' THEN RETURN result;
+  END
+  $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION Test.GBC_formatted_chain_collapse()
+  RETURNS BOOLEAN AS
+  $$
+  DECLARE
+    result BOOLEAN;
+  BEGIN
+    PERFORM Blockchain.addAUT('aaa123');
+    PERFORM Blockchain.addAUT('bbb123');
+    PERFORM Blockchain.addAUT('ccc123');
+    PERFORM Blockchain.commitBlock();
+    PERFORM Blockchain.addGCT('aaa123',
+                              extract(epoch from now()),
+                              'bbb123',
+                              'GENESIS/BLOCK/==============================',
+                              12,
+                              'Why not',
+                              'signature1');
+    PERFORM Blockchain.addGCT('bbb123',
+                              extract(epoch from now()),
+                              'ccc123',
+                              'GENESIS/BLOCK/==============================',
+                              30,
+                              'Why not',
+                              'signature1');
+    PERFORM Blockchain.commitBlock();
+    PERFORM Blockchain.addCCT('ccc123',
+                              extract(epoch from now()),
+                              'GENESIS/BLOCK/==============================',
+                              'aaa123',
+                              'bbb123',
+                              'ccc123',
+                              12,
+                              'signatureC');
+    PERFORM Blockchain.addCCT('aaa123',
+                              extract(epoch from now()),
+                              'GENESIS/BLOCK/==============================',
+                              'aaa123',
+                              'bbb123',
+                              'ccc123',
+                              12,
+                              'signatureA');
+    PERFORM Blockchain.addCCT('bbb123',
+                              extract(epoch from now()),
+                              'GENESIS/BLOCK/==============================',
+                              'aaa123',
+                              'bbb123',
+                              'ccc123',
+                              12,
+                              'signatureB');
+    SELECT Blockchain.commitBlock() INTO result;
+    -- One line per participant, in start, mid, end order
+    SELECT result AND
+           string_agg(split_part(l.line, E'\t', 9), ',' ORDER BY l.n) =
+           'signatureA,signatureB,signatureC'
+      INTO result
+      FROM unnest(string_to_array(
+             (SELECT plaintext FROM Blockchain.Block ORDER BY id DESC LIMIT 1),
+             E'\n')) WITH ORDINALITY AS l(line, n)
+     WHERE l.line LIKE E'cct\t%';
+    RAISE EXCEPTION SQLSTATE '45003';
+  EXCEPTION
+    WHEN SQLSTATE '45003' THEN RETURN result;
+  END
+  $$ LANGUAGE plpgsql;
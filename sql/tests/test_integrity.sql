@@ -0,0 +1,69 @@
+CREATE OR REPLACE FUNCTION Test.integrity_subclass_protocol() RETURNS BOOLEAN AS
+  $$
+  DECLARE
+    result BOOLEAN := TRUE;
+    tid INT;
+  BEGIN
+    PERFORM Blockchain.addAUT('aaa123');
+    PERFORM Blockchain.commitBlock();
+    SELECT Blockchain.createTransaction('rut') INTO tid;
+    -- A rut cannot also be an aut
+    BEGIN
+      INSERT INTO Blockchain.AddUserTransaction(id, join_time, user_pubk)
+        VALUES (tid, NOW(), 'bbb123');
+      result := FALSE;
+    EXCEPTION WHEN foreign_key_violation THEN
+      NULL;
+    END;
+    INSERT INTO Blockchain.RemoveUserTransaction(id, remove_time, user_pubk)
+      VALUES (tid, NOW(), 'aaa123');
+    -- The protocol of a transaction with a subclass cannot change
+    BEGIN
+      UPDATE Blockchain.Transaction SET protocol = 'aut' WHERE id = tid;
+      result := FALSE;
+    EXCEPTION WHEN check_violation THEN
+      NULL;
+    END;
+    RAISE EXCEPTION SQLSTATE '45003';
+  EXCEPTION WHEN SQLSTATE '45003' THEN
+    RETURN result;
+  END
+  $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION Test.integrity_block_chain() RETURNS BOOLEAN AS
+  $$
+  DECLARE
+    result BOOLEAN := TRUE;
+  BEGIN
+    PERFORM Blockchain.addAUT('aaa123');
+    PERFORM Blockchain.commitBlock();
+    -- The genesis block already has a next block
+    BEGIN
+      INSERT INTO Blockchain.Block(prev_hash)
+        VALUES ('GENESIS/BLOCK/==============================');
+      result := FALSE;
+    EXCEPTION WHEN unique_violation THEN
+      NULL;
+    END;
+    -- prev_hash must be the hash of a block
+    BEGIN
+      INSERT INTO Blockchain.Block(prev_hash) VALUES ('no such block');
+      result := FALSE;
+    EXCEPTION WHEN foreign_key_violation THEN
+      NULL;
+    END;
+    -- Only the genesis block has no prev_hash
+    BEGIN
+      INSERT INTO Blockchain.Block(prev_hash) VALUES (NULL);
+      result := FALSE;
+    EXCEPTION WHEN check_violation THEN
+      NULL;
+    END;
+    -- The last block can be followed
+    SELECT result AND Blockchain.addAUT('bbb123') AND Blockchain.commitBlock()
+      INTO result;
+    RAISE EXCEPTION SQLSTATE '45003';
+  EXCEPTION WHEN SQLSTATE '45003' THEN
+    RETURN result;
+  END
+  $$ LANGUAGE plpgsql;
@@ -33,14 +33,10 @@ CREATE OR REPLACE FUNCTION Test.pct_normal_case() RETURNS BOOLEAN AS
                                 10,
                                 'signature1') AND
             Blockchain.commitBlock() INTO result;
-    SELECT result AND cookies_owed = 0
-     INTO result
-      FROM Blockchain.Debt
-    WHERE sender_pubk = 'aaa123' AND receiver_pubk = 'bbb123';
-    SELECT result AND cookies_owed = 10
-     INTO result
-      FROM Blockchain.Debt
-    WHERE sender_pubk = 'bbb123' AND receiver_pubk = 'aaa123';
+    SELECT result AND Blockchain.getDebt('aaa123', 'bbb123') = 0
+      INTO result;
+    SELECT result AND Blockchain.getDebt('bbb123', 'aaa123') = 10
+      INTO result;
     RAISE EXCEPTION SQLSTATE '45003';
   EXCEPTION WHEN SQLSTATE '45003' THEN
     RETURN result;
@@ -0,0 +1,265 @@
+/* Use mc_admin to run this file */
+
+CREATE OR REPLACE FUNCTION Test.pool_expire_drops_old() RETURNS BOOLEAN AS
+  $$
+  DECLARE
+    result BOOLEAN;
+  BEGIN
+    PERFORM Blockchain.addAUT('aaa123');
+    PERFORM Blockchain.addAUT('bbb123');
+    UPDATE Blockchain.Pool
+      SET insert_time = NOW() - INTERVAL '13 hours'
+    WHERE transaction_id = (SELECT min(transaction_id)
+                              FROM Blockchain.Pool);
+    SELECT Blockchain.expirePool() = 1 INTO result;
+    SELECT result AND Blockchain.expirePool() = 0 INTO result;
+    SELECT result AND
+           (SELECT count(*) = 1 FROM Blockchain.Pool) AND
+           (SELECT sum(size) = 1 FROM Blockchain.PoolSize) INTO result;
+    RAISE EXCEPTION SQLSTATE '45003';
+  EXCEPTION WHEN SQLSTATE '45003' THEN
+    RETURN result;
+  END
+  $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION Test.pool_timeout_is_configurable()
+  RETURNS BOOLEAN AS
+  $$
+  DECLARE
+    result BOOLEAN;
+  BEGIN
+    UPDATE Blockchain.PoolConfig SET timeout = INTERVAL '1 hour';
+    PERFORM Blockchain.addAUT('aaa123');
+    PERFORM Blockchain.addAUT('bbb123');
+    UPDATE Blockchain.Pool
+      SET insert_time = NOW() - INTERVAL '2 hours'
+    WHERE transaction_id = (SELECT min(transaction_id)
+                              FROM Blockchain.Pool);
+    SELECT Blockchain.commitBlock() INTO result;
+    SELECT result AND
+           Blockchain.isValidUser('aaa123') IS NULL AND
+           Blockchain.isValidUser('bbb123') AND
+           (SELECT count(*) = 0 FROM Blockchain.Pool) INTO result;
+    RAISE EXCEPTION SQLSTATE '45003';
+  EXCEPTION WHEN SQLSTATE '45003' THEN
+    RETURN result;
+  END
+  $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION Test.pool_full_raises() RETURNS BOOLEAN AS
+  $$
+  DECLARE
+    result BOOLEAN;
+  BEGIN
+    UPDATE Blockchain.PoolConfig SET max_size = 2;
+    SELECT Blockchain.addAUT('aaa123') AND
+           Blockchain.addAUT('bbb123') INTO result;
+    BEGIN
+      PERFORM Blockchain.addAUT('ccc123');
+      result := FALSE;
+    EXCEPTION WHEN SQLSTATE '45004' THEN
+      NULL;
+    END;
+    -- A commit makes room again
+    SELECT result AND Blockchain.commitBlock() INTO result;
+    SELECT result AND Blockchain.addAUT('ccc123') INTO result;
+    SELECT result AND
+           (SELECT count(*) = 1 FROM Blockchain.Pool) AND
+           (SELECT sum(size) = 1 FROM Blockchain.PoolSize) INTO result;
+    RAISE EXCEPTION SQLSTATE '45003';
+  EXCEPTION WHEN SQLSTATE '45003' THEN
+    RETURN result;
+  END
+  $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION Test.pool_size_follows_batch_commit()
+  RETURNS BOOLEAN AS
+  $$
+  DECLARE
+    result BOOLEAN;
+  BEGIN
+    PERFORM Blockchain.addAUT('aaa123');
+    PERFORM Blockchain.addAUT('bbb123');
+    PERFORM Blockchain.commitBlockBatch();
+    PERFORM Blockchain.addGCT('aaa123',
+                              extract(epoch from now()) - 10,
+                              'bbb123',
+                              'GENESIS/BLOCK/==============================',
+                              5,
+                              'Why not',
+                              'signature1');
+    -- Incomplete, stays in the pool
+    PERFORM Blockchain.addPCT('aaa123',
+                              'bbb123',
+                              extract(epoch from now()) - 6,
+                              'GENESIS/BLOCK/==============================',
+                              1,
+                              'signature2');
+    SELECT Blockchain.commitBlockBatch() INTO result;
+    SELECT result AND
+           (SELECT count(*) = 1 FROM Blockchain.Pool) AND
+           (SELECT sum(size) = 1 FROM Blockchain.PoolSize) INTO result;
+    RAISE EXCEPTION SQLSTATE '45003';
+  EXCEPTION WHEN SQLSTATE '45003' THEN
+    RETURN result;
+  END
+  $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION Test.pool_state() RETURNS BOOLEAN AS
+  $$
+  DECLARE
+    result BOOLEAN;
+  BEGIN
+    SELECT pool_size = 0 AND oldest_age IS NULL
+      FROM Blockchain.getPoolState() INTO result;
+    PERFORM Blockchain.addAUT('aaa123');
+    PERFORM Blockchain.addAUT('bbb123');
+    UPDATE Blockchain.Pool
+      SET insert_time = NOW() - INTERVAL '1 minute'
+    WHERE transaction_id = (SELECT min(transaction_id)
+                              FROM Blockchain.Pool);
+    SELECT result AND pool_size = 2 AND oldest_age >= 60
+      FROM Blockchain.getPoolState() INTO result;
+    RAISE EXCEPTION SQLSTATE '45003';
+  EXCEPTION WHEN SQLSTATE '45003' THEN
+    RETURN result;
+  END
+  $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION Test.pool_full_batch_keeps_added()
+  RETURNS BOOLEAN AS
+  $$
+  DECLARE
+    result BOOLEAN;
+    now DOUBLE PRECISION := extract(epoch from now());
+  BEGIN
+    PERFORM Blockchain.addAUT('aaa123');
+    PERFORM Blockchain.addAUT('bbb123');
+    PERFORM Blockchain.commitBlock();
+    UPDATE Blockchain.PoolConfig SET max_size = 2;
+    -- The third transaction fills the pool, the fourth is not tried
+    SELECT Blockchain.addGCTBatch(
+             ARRAY['aaa123', 'aaa123', 'aaa123', 'bbb123'],
+             ARRAY[now, now + 1, now + 2, now],
+             ARRAY['bbb123', 'bbb123', 'bbb123', 'aaa123'],
+             ARRAY['GENESIS/BLOCK/==============================',
+                   'GENESIS/BLOCK/==============================',
+                   'GENESIS/BLOCK/==============================',
+                   'GENESIS/BLOCK/=============================='],
+             ARRAY[2, 2, 2, 2],
+             ARRAY['Why not', 'Why not', 'Why not', 'Why not'],
+             ARRAY['signature1', 'signature2', 'signature3',
+                   'signature4']) IS NOT DISTINCT FROM
+           ARRAY[TRUE, TRUE, NULL, NULL]
+      INTO result;
+    SELECT result AND
+           (SELECT count(*) = 2 FROM Blockchain.Pool) AND
+           (SELECT count(*) = 2 FROM Blockchain.GiveCookieTransaction) AND
+           (SELECT sum(size) = 2 FROM Blockchain.PoolSize) INTO result;
+    RAISE EXCEPTION SQLSTATE '45003';
+  EXCEPTION WHEN SQLSTATE '45003' THEN
+    RETURN result;
+  END
+  $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION Test.pool_empty_delete_writes_nothing()
+  RETURNS BOOLEAN AS
+  $$
+  DECLARE
+    result BOOLEAN;
+  BEGIN
+    -- A statement deleting nothing leaves PoolSize alone, so no row is
+    -- written
+    DELETE FROM Blockchain.Pool WHERE FALSE;
+    SELECT pg_current_xact_id_if_assigned() IS NULL INTO result;
+    RAISE EXCEPTION SQLSTATE '45003';
+  EXCEPTION WHEN SQLSTATE '45003' THEN
+    RETURN result;
+  END
+  $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION Test.pool_pending_after_commit()
+  RETURNS BOOLEAN AS
+  $$
+  DECLARE
+    result BOOLEAN;
+  BEGIN
+    PERFORM Blockchain.addAUT('aaa123');
+    PERFORM Blockchain.addAUT('bbb123');
+    PERFORM Blockchain.commitBlockBatch();
+    -- Incomplete, and receiving before giving
+    PERFORM Blockchain.addPCT('aaa123',
+                              'bbb123',
+                              extract(epoch from now()) - 6,
+                              'GENESIS/BLOCK/==============================',
+                              1,
+                              'signature1');
+    PERFORM Blockchain.addRCT('bbb123',
+                              extract(epoch from now()),
+                              'aaa123',
+                              'GENESIS/BLOCK/==============================',
+                              2,
+                              'butter scotch',
+                              'signature2');
+    SELECT pool_size = 2 AND pending_size = 2 AND pending_age >= 0
+      FROM Blockchain.getPoolState() INTO result;
+    -- Neither can be committed, so they stop counting as pending
+    SELECT result AND Blockchain.commitPool() = 0 INTO result;
+    SELECT result AND pool_size = 2 AND oldest_age >= 0 AND
+           pending_size = 0 AND pending_age IS NULL
+      FROM Blockchain.getPoolState() INTO result;
+    -- Completing the cpct makes it pending again
+    PERFORM Blockchain.addPCT('bbb123',
+                              'aaa123',
+                              extract(epoch from now()) - 5,
+                              'GENESIS/BLOCK/==============================',
+                              1,
+                              'signature3');
+    SELECT result AND pool_size = 2 AND pending_size = 1
+      FROM Blockchain.getPoolState() INTO result;
+    -- So does a new transaction
+    PERFORM Blockchain.addGCT('aaa123',
+                              extract(epoch from now()) - 10,
+                              'bbb123',
+                              'GENESIS/BLOCK/==============================',
+                              2,
+                              'Why not',
+                              'signature4');
+    SELECT result AND pool_size = 3 AND pending_size = 2
+      FROM Blockchain.getPoolState() INTO result;
+    RAISE EXCEPTION SQLSTATE '45003';
+  EXCEPTION WHEN SQLSTATE '45003' THEN
+    RETURN result;
+  END
+  $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION Test.pool_commit_counts_included()
+  RETURNS BOOLEAN AS
+  $$
+  DECLARE
+    result BOOLEAN;
+  BEGIN
+    SELECT Blockchain.commitPool() = 0 INTO result;
+    PERFORM Blockchain.addAUT('aaa123');
+    PERFORM Blockchain.addAUT('bbb123');
+    SELECT result AND Blockchain.commitPool() = 2 INTO result;
+    PERFORM Blockchain.addGCT('aaa123',
+                              extract(epoch from now()) - 10,
+                              'bbb123',
+                              'GENESIS/BLOCK/==============================',
+                              2,
+                              'Why not',
+                              'signature1');
+    -- Incomplete, left in the pool
+    PERFORM Blockchain.addPCT('aaa123',
+                              'bbb123',
+                              extract(epoch from now()) - 6,
+                              'GENESIS/BLOCK/==============================',
+                              1,
+                              'signature2');
+    SELECT result AND Blockchain.commitPool() = 1 INTO result;
+    RAISE EXCEPTION SQLSTATE '45003';
+  EXCEPTION WHEN SQLSTATE '45003' THEN
+    RETURN result;
+  END
+  $$ LANGUAGE plpgsql;
@@ -0,0 +1,159 @@
+/* Use mc_admin to run this file */
+
+CREATE OR REPLACE FUNCTION Test.stats_add_outcomes() RETURNS BOOLEAN AS
+  $$
+  DECLARE
+    result BOOLEAN;
+  BEGIN
+    PERFORM Blockchain.addAUT('aaa123');
+    PERFORM Blockchain.addAUT('bbb123');
+    PERFORM Blockchain.commitBlock();
+    PERFORM Blockchain.addGCT('aaa123',
+                              extract(epoch from now()),
+                              'bbb123',
+                              'GENESIS/BLOCK/==============================',
+                              2,
+                              'Why not',
+                              'signature1');
+    -- Unknown recent block
+    PERFORM Blockchain.addGCT('aaa123',
+                              extract(epoch from now()) - 1,
+                              'bbb123',
+                              'NOT/A/BLOCK',
+                              2,
+                              'Why not',
+                              'signature2');
+    -- Invalid receiver
+    PERFORM Blockchain.addGCT('aaa123',
+                              extract(epoch from now()) - 2,
+                              'ccc123',
+                              'GENESIS/BLOCK/==============================',
+                              2,
+                              'Why not',
+                              'signature3');
+    SELECT (SELECT calls = 1 FROM Blockchain.getStats()
+             WHERE name = 'addGCT' AND outcome = 'ok') AND
+           (SELECT calls = 2 FROM Blockchain.getStats()
+             WHERE name = 'addGCT' AND outcome = 'no') AND
+           (SELECT total_ms >= 0
+              FROM Blockchain.getStats()
+             WHERE name = 'addGCT' AND outcome = 'ok') INTO result;
+    RAISE EXCEPTION SQLSTATE '45003';
+  EXCEPTION WHEN SQLSTATE '45003' THEN
+    RETURN result;
+  END
+  $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION Test.stats_commit_outcomes() RETURNS BOOLEAN AS
+  $$
+  DECLARE
+    result BOOLEAN;
+  BEGIN
+    PERFORM Blockchain.addAUT('aaa123');
+    PERFORM Blockchain.addAUT('bbb123');
+    PERFORM Blockchain.commitBlock();
+    -- Receiving before giving stays in the pool
+    PERFORM Blockchain.addRCT('bbb123',
+                              extract(epoch from now()),
+                              'aaa123',
+                              'GENESIS/BLOCK/==============================',
+                              2,
+                              'butter scotch',
+                              'signature2');
+    PERFORM Blockchain.commitBlock();
+    PERFORM Blockchain.addGCT('aaa123',
+                              extract(epoch from now()),
+                              'bbb123',
+                              'GENESIS/BLOCK/==============================',
+                              2,
+                              'Why not',
+                              'signature1');
+    PERFORM Blockchain.commitBlock();
+    SELECT (SELECT calls = 3 FROM Blockchain.getStats()
+             WHERE name = 'commitTransaction' AND outcome = 'committed') AND
+           (SELECT calls = 2 FROM Blockchain.getStats()
+             WHERE name = 'commitTransaction' AND outcome = 'postponed') AND
+           (SELECT calls = 2 FROM Blockchain.getStats()
+             WHERE name = 'commitBlock' AND outcome = 'block') AND
+           (SELECT calls = 1 FROM Blockchain.getStats()
+             WHERE name = 'commitBlock' AND outcome = 'empty') AND
+           (SELECT calls = 2 FROM Blockchain.getStats()
+             WHERE name = 'generateCurrHash' AND outcome = 'ok') INTO result;
+    RAISE EXCEPTION SQLSTATE '45003';
+  EXCEPTION WHEN SQLSTATE '45003' THEN
+    RETURN result;
+  END
+  $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION Test.stats_batch_commit_outcomes()
+  RETURNS BOOLEAN AS
+  $$
+  DECLARE
+    result BOOLEAN;
+  BEGIN
+    PERFORM Blockchain.addAUT('aaa123');
+    PERFORM Blockchain.addAUT('bbb123');
+    PERFORM Blockchain.commitBlockBatch();
+    PERFORM Blockchain.addGCT('aaa123',
+                              extract(epoch from now()) - 10,
+                              'bbb123',
+                              'GENESIS/BLOCK/==============================',
+                              5,
+                              'Why not',
+                              'signature1');
+    PERFORM Blockchain.addGCT('bbb123',
+                              extract(epoch from now()) - 9,
+                              'aaa123',
+                              'GENESIS/BLOCK/==============================',
+                              1,
+                              'Why not',
+                              'signature2');
+    PERFORM Blockchain.commitBlockBatch();
+    SELECT (SELECT calls = 2 FROM Blockchain.getStats()
+             WHERE name = 'commitTransaction' AND outcome = 'bulk') AND
+           (SELECT calls = 2 FROM Blockchain.getStats()
+             WHERE name = 'commitBlockBatch' AND outcome = 'block') INTO result;
+    RAISE EXCEPTION SQLSTATE '45003';
+  EXCEPTION WHEN SQLSTATE '45003' THEN
+    RETURN result;
+  END
+  $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION Test.stats_batch_add_outcomes()
+  RETURNS BOOLEAN AS
+  $$
+  DECLARE
+    result BOOLEAN;
+    now DOUBLE PRECISION := extract(epoch from now());
+    writes BIGINT;
+  BEGIN
+    PERFORM Blockchain.addAUT('aaa123');
+    PERFORM Blockchain.addAUT('bbb123');
+    PERFORM Blockchain.commitBlock();
+    SELECT n_tup_ins + n_tup_upd INTO writes
+      FROM pg_stat_xact_user_tables
+     WHERE relid = 'Blockchain.Stat'::regclass;
+    -- The second has negative cookies
+    PERFORM Blockchain.addGCTBatch(
+              ARRAY['aaa123', 'aaa123', 'bbb123'],
+              ARRAY[now, now + 1, now],
+              ARRAY['bbb123', 'bbb123', 'aaa123'],
+              ARRAY['GENESIS/BLOCK/==============================',
+                    'GENESIS/BLOCK/==============================',
+                    'GENESIS/BLOCK/=============================='],
+              ARRAY[2, -1, 3],
+              ARRAY['Why not', 'Why not', 'Why not'],
+              ARRAY['signature1', 'signature2', 'signature3']);
+    -- Each outcome is written once for the whole batch
+    SELECT (SELECT calls = 2 FROM Blockchain.getStats()
+             WHERE name = 'addGCT' AND outcome = 'ok') AND
+           (SELECT calls = 1 FROM Blockchain.getStats()
+             WHERE name = 'addGCT' AND outcome = 'no') AND
+           (SELECT n_tup_ins + n_tup_upd = writes + 2
+              FROM pg_stat_xact_user_tables
+             WHERE relid = 'Blockchain.Stat'::regclass) INTO result;
+    RAISE EXCEPTION SQLSTATE '45003';
+  EXCEPTION WHEN SQLSTATE '45003' THEN
+    RETURN result;
+  END
+  $$ LANGUAGE plpgsql;